@@ -1,15 +1,25 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 from flask_cors import CORS
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
-from sqlalchemy import text
+from sqlalchemy import inspect, text, tuple_
 import requests
+import csv
+import io
+import json
+import logging
 import os
+import sys
 import atexit
 from functools import wraps
-from websocket_client import initialize_notification_client, send_booking_notification, cleanup_notification_client
+from websocket_client import initialize_notification_client, send_booking_notification, send_session_availability, cleanup_notification_client
+from crm_sync import CRMSyncWorker
+from reminder_scheduler import ReminderScheduler
+# instrumentation.py is shared from common/ at the repository root; the images copy it to /common
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'common'))
+from instrumentation import Instrumentation, Tracer
 
 app = Flask(__name__)
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'your-secret-key-change-in-production')
@@ -25,13 +35,30 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db = SQLAlchemy(app)
 jwt = JWTManager(app)
 CORS(app)
+# /metrics is defined further down, behind METRICS_TOKEN
+instrumentation = Instrumentation('backend', app, db=db, metrics_endpoint=False)
+tracer = Tracer('backend')
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 # CRM Service Configuration
+# Static bearer token for Prometheus scrapes of /metrics; unset means /metrics always answers 401
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
 CRM_SERVICE_URL = os.getenv('CRM_SERVICE_URL', 'http://localhost:5001')
 CRM_BEARER_TOKEN = os.getenv('CRM_BEARER_TOKEN', 'your-static-bearer-token-here')
+CRM_SYNC_ENABLED = os.getenv('CRM_SYNC_ENABLED', 'true').lower() == 'true'
+# Changes younger than this wait for the next poll, so a transaction that stamped
+# updated_at before a later one but committed after it is not skipped
+CRM_SYNC_SETTLE_SECONDS = float(os.getenv('CRM_SYNC_SETTLE_SECONDS', '2'))
 
 # Email Service Configuration
 EMAIL_SERVICE_URL = os.getenv('EMAIL_SERVICE_URL', 'http://localhost:5003')
+REMINDER_ENABLED = os.getenv('REMINDER_ENABLED', 'true').lower() == 'true'
+
+# Exports fetch and send this many rows at a time
+EXPORT_CHUNK_ROWS = 500
 
 # Database Models
 class User(db.Model):
@@ -70,6 +97,11 @@ class Session(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     bookings = db.relationship('Booking', backref='session', lazy=True)
+    
+    # Range reads of upcoming sessions for reminders
+    __table_args__ = (
+        db.Index('ix_session_start_time', 'start_time'),
+    )
 
 class Booking(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -78,6 +110,33 @@ class Booking(db.Model):
     booking_status = db.Column(db.String(20), default='confirmed')  # 'confirmed', 'cancelled'
     booking_date = db.Column(db.DateTime, default=datetime.utcnow)
     notes = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Change feed order for the CRM sync watermark
+    __table_args__ = (
+        db.Index('ix_booking_updated_at_id', 'updated_at', 'id'),
+    )
+
+class SyncState(db.Model):
+    """Persisted watermark of an outbound sync, so restarts resume where they stopped"""
+    name = db.Column(db.String(50), primary_key=True)
+    watermark_updated_at = db.Column(db.DateTime)
+    watermark_id = db.Column(db.Integer)
+    synced_total = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class SessionReminder(db.Model):
+    """A reminder batch sent for a session; start_time is the start it was sent for, so a moved session is reminded again"""
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.Integer, db.ForeignKey('session.id'), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    batch_id = db.Column(db.String(32))
+    recipients = db.Column(db.Integer, default=0)
+    sent_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('session_id', 'start_time', name='uq_session_reminder_session_start'),
+    )
 
 # Helper Functions
 def role_required(role):
@@ -96,30 +155,52 @@ def role_required(role):
 def notify_facilitator_websocket(booking_data):
     """Notify facilitator via WebSocket"""
     try:
-        success = send_booking_notification(booking_data)
+        with instrumentation.outbound('notification_service', 'booking_notification'), \
+                tracer.span('notify_websocket'):
+            # The notification service continues the trace from the payload
+            trace = tracer.context()
+            success = send_booking_notification({**booking_data, 'trace': trace} if trace else booking_data)
         return success
     except Exception as e:
-        print(f"WebSocket notification failed: {e}")
+        logger.error(f"WebSocket notification failed: {e}")
+        return False
+
+def publish_session_availability(session):
+    """Push a session's remaining spots to browsers watching the catalog"""
+    try:
+        update = {
+            'session_id': session.id,
+            'available_spots': max(0, session.capacity - len(session.bookings)),
+            'capacity': session.capacity,
+            'status': session.status
+        }
+        with instrumentation.outbound('notification_service', 'session_availability_update'), \
+                tracer.span('publish_availability'):
+            return send_session_availability(update)
+    except Exception as e:
+        logger.error(f"Availability update failed: {e}")
         return False
 
 def send_booking_emails(booking_data):
     """Send booking confirmation emails to user and facilitator"""
     try:
-        response = requests.post(
-            f"{EMAIL_SERVICE_URL}/send-booking-emails",
-            json=booking_data,
-            headers={'Content-Type': 'application/json'},
-            timeout=30
-        )
+        with instrumentation.outbound('email_service', 'send_booking_emails'), tracer.span('send_booking_emails'):
+            response = requests.post(
+                f"{EMAIL_SERVICE_URL}/send-booking-emails",
+                json=booking_data,
+                headers={'Content-Type': 'application/json', **tracer.headers()},
+                timeout=30
+            )
         
-        if response.status_code == 200:
-            print("Booking emails sent successfully")
+        # The email service queues both emails and sends them in the background
+        if response.status_code == 202:
+            logger.info(f"Booking emails queued: {response.json().get('jobs')}")
             return True
         else:
-            print(f"Failed to send booking emails: {response.status_code} - {response.text}")
+            logger.error(f"Failed to send booking emails: {response.status_code} - {response.text}")
             return False
     except Exception as e:
-        print(f"Email service error: {e}")
+        logger.error(f"Email service error: {e}")
         return False
 
 # Authentication Routes
@@ -285,6 +366,7 @@ def update_session(session_id):
         session.end_time = datetime.fromisoformat(data['end_time'])
     
     db.session.commit()
+    publish_session_availability(session)
     return jsonify({'message': 'Session updated successfully'})
 
 @app.route('/api/sessions/<int:session_id>/cancel', methods=['POST'])
@@ -304,6 +386,7 @@ def cancel_session(session_id):
         booking.booking_status = 'cancelled'
     
     db.session.commit()
+    publish_session_availability(session)
     return jsonify({'message': 'Session cancelled successfully'})
 
 @app.route('/api/facilitator/sessions/<int:session_id>', methods=['DELETE'])
@@ -324,12 +407,14 @@ def delete_session(session_id):
     # Mark session as cancelled instead of deleting
     session.status = 'cancelled'
     db.session.commit()
+    publish_session_availability(session)
     
     return jsonify({'message': 'Session cancelled successfully'})
 
 # Booking Routes
 @app.route('/api/bookings', methods=['POST'])
 @jwt_required()
+@tracer.traced('create_booking', new_trace=True)
 def create_booking():
     data = request.get_json()
     current_user_id = int(get_jwt_identity())
@@ -360,8 +445,13 @@ def create_booking():
         notes=data.get('notes', '')
     )
     
-    db.session.add(booking)
-    db.session.commit()
+    with tracer.span('db_commit'):
+        db.session.add(booking)
+        db.session.commit()
+    tracer.annotate(booking_id=booking.id, session_id=session.id)
+    
+    # Push the new seat count to browsers watching this session
+    publish_session_availability(session)
     
     # Get current user for notification
     current_user = User.query.get(current_user_id)
@@ -461,6 +551,62 @@ def get_facilitator_bookings():
         'notes': b.notes
     } for b in bookings])
 
+@app.route('/api/facilitator/bookings/export', methods=['GET'])
+@role_required('facilitator')
+def export_facilitator_bookings():
+    """Stream the facilitator's bookings as NDJSON (default) or CSV without building them in memory"""
+    current_user_id = int(get_jwt_identity())
+    facilitator = Facilitator.query.filter_by(user_id=current_user_id).first()
+    
+    if not facilitator:
+        return jsonify({'error': 'Facilitator profile not found'}), 404
+    
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+    
+    # Select plain columns with the joins done in SQL, instead of lazy-loading
+    # each booking's user and session
+    rows = db.session.query(
+        Booking.id, User.id, User.name, User.email, Session.id, Session.title, Session.start_time,
+        Booking.booking_status, Booking.booking_date, Booking.notes
+    ).join(Session, Booking.session_id == Session.id).join(User, Booking.user_id == User.id).filter(
+        Session.facilitator_id == facilitator.id
+    ).order_by(Booking.id)
+    
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if export_format == 'csv':
+            writer.writerow(['id', 'user_id', 'user_name', 'user_email', 'session_id', 'session_title',
+                             'session_start_time', 'booking_status', 'booking_date', 'notes'])
+        
+        for count, row in enumerate(rows.yield_per(EXPORT_CHUNK_ROWS), 1):
+            (booking_id, user_id, user_name, user_email, session_id, session_title, start_time,
+             booking_status, booking_date, notes) = row
+            if export_format == 'csv':
+                writer.writerow([booking_id, user_id, user_name, user_email, session_id, session_title,
+                                 start_time.isoformat(), booking_status, booking_date.isoformat(), notes])
+            else:
+                buffer.write(json.dumps({
+                    'id': booking_id,
+                    'user': {'id': user_id, 'name': user_name, 'email': user_email},
+                    'session': {'id': session_id, 'title': session_title, 'start_time': start_time.isoformat()},
+                    'booking_status': booking_status,
+                    'booking_date': booking_date.isoformat(),
+                    'notes': notes
+                }) + '\n')
+            if count % EXPORT_CHUNK_ROWS == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=facilitator_bookings.{export_format}'
+    })
+
 # Facilitator Dashboard Routes
 @app.route('/api/facilitator/dashboard', methods=['GET'])
 @role_required('facilitator')
@@ -571,6 +717,179 @@ def get_session_bookings(session_id):
         'notes': b.notes
     } for b in bookings])
 
+# CRM Sync
+CRM_SYNC_NAME = 'crm_bookings'
+
+def load_crm_sync_position():
+    state = db.session.get(SyncState, CRM_SYNC_NAME)
+    if not state or state.watermark_updated_at is None:
+        return None
+    return state.watermark_updated_at, state.watermark_id
+
+def save_crm_sync_position(position, synced_count):
+    state = db.session.get(SyncState, CRM_SYNC_NAME) or SyncState(name=CRM_SYNC_NAME, synced_total=0)
+    state.watermark_updated_at, state.watermark_id = position
+    state.synced_total = (state.synced_total or 0) + synced_count
+    db.session.add(state)
+    db.session.commit()
+
+def fetch_booking_changes(position, limit):
+    """Bookings changed after the (updated_at, id) watermark, as CRM batch records"""
+    cutoff = datetime.utcnow() - timedelta(seconds=CRM_SYNC_SETTLE_SECONDS)
+    query = db.session.query(
+        Booking.id, Booking.updated_at, Booking.booking_status,
+        User.id, User.email, User.name,
+        Session.id, Session.title, Session.start_time, Session.facilitator_id
+    ).join(User, Booking.user_id == User.id).join(Session, Booking.session_id == Session.id).filter(
+        Booking.updated_at <= cutoff
+    )
+    if position:
+        query = query.filter(tuple_(Booking.updated_at, Booking.id) > position)
+    rows = query.order_by(Booking.updated_at, Booking.id).limit(limit).all()
+    
+    records = [{
+        'booking_id': booking_id,
+        'event_type': 'booking_cancelled' if status == 'cancelled' else 'booking_created',
+        'user': {'id': user_id, 'email': email, 'name': name},
+        'event': {'id': session_id, 'title': title, 'start_time': start_time.isoformat()},
+        'facilitator_id': facilitator_id
+    } for (booking_id, _, status, user_id, email, name, session_id, title, start_time, facilitator_id) in rows]
+    
+    last_position = (rows[-1][1], rows[-1][0]) if rows else position
+    return records, last_position
+
+crm_sync_worker = CRMSyncWorker(
+    app, fetch_booking_changes, load_crm_sync_position, save_crm_sync_position,
+    crm_service_url=CRM_SERVICE_URL, token=CRM_BEARER_TOKEN
+)
+instrumentation.instrument_session(crm_sync_worker.http, 'crm_service')
+
+def start_crm_sync():
+    if CRM_SYNC_ENABLED:
+        crm_sync_worker.start()
+
+@app.route('/api/crm-sync/status', methods=['GET'])
+@role_required('facilitator')
+def crm_sync_status():
+    """Watermark, backlog and lag of the backend-to-CRM sync"""
+    position = load_crm_sync_position()
+    pending = db.session.query(db.func.count(Booking.id), db.func.min(Booking.updated_at))
+    if position:
+        pending = pending.filter(tuple_(Booking.updated_at, Booking.id) > position)
+    pending_changes, oldest_pending = pending.one()
+    state = db.session.get(SyncState, CRM_SYNC_NAME)
+    
+    return jsonify({
+        **crm_sync_worker.status(),
+        'enabled': CRM_SYNC_ENABLED,
+        'watermark': {
+            'updated_at': position[0].isoformat(),
+            'id': position[1]
+        } if position else None,
+        'synced_total': state.synced_total if state else 0,
+        'pending_changes': pending_changes,
+        # Age of the oldest change the CRM has not seen yet
+        'lag_seconds': round((datetime.utcnow() - oldest_pending).total_seconds(), 3) if oldest_pending else 0
+    })
+
+# Session Reminders
+def find_sessions_to_remind(start_after, start_before):
+    """Active sessions starting in the window that have not been reminded for their current start time"""
+    reminded = db.session.query(SessionReminder.id).filter(
+        SessionReminder.session_id == Session.id,
+        SessionReminder.start_time == Session.start_time
+    ).exists()
+    return db.session.query(Session.id, Session.start_time).filter(
+        Session.start_time > start_after,
+        Session.start_time <= start_before,
+        Session.status == 'active',
+        ~reminded
+    ).order_by(Session.start_time).all()
+
+def build_session_reminder(session_id, start_time):
+    """/send-bulk request reminding every confirmed attendee, or None if no reminder is due"""
+    session = db.session.get(Session, session_id)
+    if (not session or session.status != 'active' or session.start_time != start_time
+            or start_time <= datetime.utcnow()):
+        return None
+    if SessionReminder.query.filter_by(session_id=session_id, start_time=start_time).first():
+        return None
+    
+    attendees = db.session.query(Booking.id, User.id, User.email, User.name).join(
+        User, Booking.user_id == User.id
+    ).filter(
+        Booking.session_id == session_id,
+        Booking.booking_status == 'confirmed'
+    ).all()
+    if not attendees:
+        return None
+    
+    return {
+        'template': 'session_reminder',
+        'data': {
+            'session': {
+                'id': session.id,
+                'title': session.title,
+                'session_type': session.session_type,
+                'start_time': session.start_time.isoformat(),
+                'end_time': session.end_time.isoformat(),
+                'price': session.price
+            },
+            'facilitator': {
+                'id': session.facilitator.id,
+                'email': session.facilitator.user.email,
+                'name': session.facilitator.user.name
+            }
+        },
+        # The start time is part of the email service's dedupe key, so a moved session is reminded again
+        'recipients': [{
+            'email': email,
+            'data': {'booking_id': booking_id, 'reminder_key': start_time.isoformat(),
+                     'user': {'id': user_id, 'name': name}}
+        } for (booking_id, user_id, email, name) in attendees]
+    }
+
+def record_session_reminder(session_id, start_time, result):
+    # Duplicates were queued for this same start time by an earlier, unrecorded send
+    accepted = sum(1 for item in result.get('results', []) if item.get('status') in ('queued', 'duplicate'))
+    if not accepted:
+        logger.warning(f"No reminders accepted for session {session_id} at {start_time.isoformat()}; not recorded")
+        return
+    db.session.add(SessionReminder(
+        session_id=session_id,
+        start_time=start_time,
+        batch_id=result.get('batch_id'),
+        recipients=accepted
+    ))
+    db.session.commit()
+
+reminder_scheduler = ReminderScheduler(
+    app, find_sessions_to_remind, build_session_reminder, record_session_reminder,
+    email_service_url=EMAIL_SERVICE_URL
+)
+instrumentation.instrument_session(reminder_scheduler.http, 'email_service')
+
+def start_reminder_scheduler():
+    if REMINDER_ENABLED:
+        reminder_scheduler.start()
+
+@app.route('/api/reminders/status', methods=['GET'])
+@role_required('facilitator')
+def reminder_status():
+    """Upcoming reminders held by the scheduler and reminders sent so far"""
+    return jsonify({
+        **reminder_scheduler.status(),
+        'enabled': REMINDER_ENABLED,
+        'sessions_reminded': db.session.query(db.func.count(SessionReminder.id)).scalar()
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus histograms, for scrapers holding the METRICS_TOKEN bearer token"""
+    if not METRICS_TOKEN or request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        return jsonify({'error': 'Invalid or missing Bearer token'}), 401
+    return instrumentation.metrics_response()
+
 # Health check endpoint
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -580,7 +899,7 @@ def health_check():
         db_status = 'connected'
     except Exception as e:
         db_status = 'disconnected'
-        print(f"Database connection error: {e}")
+        logger.error(f"Database connection error: {e}")
     
     return jsonify({
         'status': 'healthy',
@@ -596,10 +915,29 @@ def initialize_services():
 
 # Cleanup on shutdown
 atexit.register(cleanup_notification_client)
+atexit.register(crm_sync_worker.stop)
+atexit.register(reminder_scheduler.stop)
+
+def upgrade_booking_table():
+    """Add updated_at to a booking table created by an older release"""
+    columns = {column['name'] for column in inspect(db.engine).get_columns('booking')}
+    if 'updated_at' not in columns:
+        db.session.execute(text('ALTER TABLE booking ADD COLUMN updated_at TIMESTAMP'))
+        db.session.execute(text('UPDATE booking SET updated_at = booking_date'))
+        db.session.commit()
+    for index in Booking.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
+
+def upgrade_session_table():
+    """Add indexes declared after the session table was created"""
+    for index in Session.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
 
 def create_tables():
     with app.app_context():
         db.create_all()
+        upgrade_booking_table()
+        upgrade_session_table()
         
         # Create sample data
         if not User.query.first():
@@ -654,4 +992,8 @@ def create_tables():
 
 if __name__ == '__main__':
     initialize_services()
+    # The debug reloader runs this block in a watcher and a serving process; only the server syncs
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_crm_sync()
+        start_reminder_scheduler()
     app.run(debug=True, port=5000, host='0.0.0.0')
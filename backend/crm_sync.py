@@ -0,0 +1,121 @@
+import logging
+import os
+import threading
+from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+class CRMSyncWorker:
+    """Tails changed bookings by watermark and ships them to the CRM batch endpoint.
+
+    The worker owns the HTTP side (a pooled keep-alive session, retries with
+    backoff) and the loop. Reading changes and persisting the watermark are
+    passed in by the app, and each is called inside an app context:
+
+        fetch_changes(position, limit) -> (records, last_position)
+        load_position() -> position
+        save_position(position, synced_count)
+    """
+
+    def __init__(self, app, fetch_changes, load_position, save_position,
+                 crm_service_url=None, token=None):
+        self.app = app
+        self.fetch_changes = fetch_changes
+        self.load_position = load_position
+        self.save_position = save_position
+        self.crm_service_url = crm_service_url or os.getenv('CRM_SERVICE_URL', 'http://localhost:5001')
+        self.token = token or os.getenv('CRM_BEARER_TOKEN', 'your-static-bearer-token-here')
+        self.batch_size = int(os.getenv('CRM_SYNC_BATCH_SIZE', '500'))
+        self.interval = float(os.getenv('CRM_SYNC_INTERVAL', '2'))
+        self.max_backoff = float(os.getenv('CRM_SYNC_MAX_BACKOFF', '60'))
+
+        # One keep-alive connection is reused for every batch
+        self.http = requests.Session()
+        self.http.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self.http.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self.http.headers['Authorization'] = f'Bearer {self.token}'
+
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.last_synced_at = None
+        self.last_error = None
+        self.rejected_total = 0
+
+    def start(self):
+        """Start the sync loop on a daemon thread"""
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name='crm-sync', daemon=True)
+        self.thread.start()
+        logger.info("CRM sync worker started")
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=10)
+        self.http.close()
+
+    def is_running(self):
+        return bool(self.thread and self.thread.is_alive())
+
+    def run(self):
+        backoff = self.interval
+        while not self.stop_event.is_set():
+            try:
+                sent = self.sync_batch()
+                backoff = self.interval
+                if sent >= self.batch_size:
+                    # More changes are waiting; keep draining without sleeping
+                    continue
+                wait = self.interval
+            except Exception as e:
+                self.last_error = f"{datetime.utcnow().isoformat()}: {e}"
+                logger.error(f"CRM sync failed, retrying in {backoff:.0f}s: {e}")
+                wait = backoff
+                backoff = min(backoff * 2, self.max_backoff)
+            self.stop_event.wait(wait)
+
+    def sync_batch(self):
+        """Send one batch of changes; the watermark only advances once the CRM has accepted it"""
+        with self.app.app_context():
+            position = self.load_position()
+            records, last_position = self.fetch_changes(position, self.batch_size)
+
+        if not records:
+            return 0
+
+        response = self.http.post(
+            f"{self.crm_service_url}/api/booking-notifications/batch",
+            json=records,
+            timeout=30
+        )
+        response.raise_for_status()
+        result = response.json()
+
+        # Rejected records would be rejected again on every retry, so log them and move on
+        for error in result.get('errors', []):
+            logger.warning(f"CRM rejected booking {error.get('booking_id')}: {error.get('error')}")
+        self.rejected_total += result.get('failed', 0)
+
+        with self.app.app_context():
+            self.save_position(last_position, len(records))
+
+        self.last_synced_at = datetime.utcnow()
+        self.last_error = None
+        logger.info(f"Synced {len(records)} booking changes to CRM "
+                    f"({result.get('inserted', 0)} new, {result.get('duplicates', 0)} already known)")
+        return len(records)
+
+    def status(self):
+        return {
+            'running': self.is_running(),
+            'batch_size': self.batch_size,
+            'interval_seconds': self.interval,
+            'last_synced_at': self.last_synced_at.isoformat() if self.last_synced_at else None,
+            'last_error': self.last_error,
+            'rejected_total': self.rejected_total
+        }
@@ -0,0 +1,156 @@
+import heapq
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+class ReminderScheduler:
+    """Sends one reminder email batch per session, `lead` before it starts.
+
+    Every scan interval the scheduler loads sessions starting within the next
+    lead + scan interval that have not been reminded yet. That is a range read
+    on the Session.start_time index, not a scan of bookings. They are pushed
+    onto a heap keyed by reminder due time, and the thread sleeps until the
+    earliest reminder or the next scan. The app supplies, each called inside
+    an app context:
+
+        find_sessions(start_after, start_before) -> [(session_id, start_time)]
+        build_reminder(session_id, start_time) -> /send-bulk request, or None to skip
+        record_reminder(session_id, start_time, response)
+
+    A session is recorded once its batch is accepted, so after a restart the
+    first scan picks up every reminder still owed, including any that fell due
+    while the service was down, and nothing already recorded.
+    """
+
+    def __init__(self, app, find_sessions, build_reminder, record_reminder, email_service_url=None):
+        self.app = app
+        self.find_sessions = find_sessions
+        self.build_reminder = build_reminder
+        self.record_reminder = record_reminder
+        self.email_service_url = email_service_url or os.getenv('EMAIL_SERVICE_URL', 'http://localhost:5003')
+        self.lead = timedelta(hours=float(os.getenv('REMINDER_LEAD_HOURS', '24')))
+        self.scan_interval = float(os.getenv('REMINDER_SCAN_INTERVAL', '300'))
+        self.retry_delay = float(os.getenv('REMINDER_RETRY_DELAY', '60'))
+
+        self.http = requests.Session()
+        self.http.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+        self.http.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+
+        self.heap = []  # (due_at, session_id, start_time)
+        self.scheduled = set()  # (session_id, start_time) on the heap
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.last_scan_at = None
+        self.last_error = None
+        self.sent_total = 0
+
+    def start(self):
+        """Start the scheduler on a daemon thread"""
+        if self.thread and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name='session-reminders', daemon=True)
+        self.thread.start()
+        logger.info("Session reminder scheduler started")
+
+    def stop(self):
+        self.stop_event.set()
+        self.wakeup.set()
+        if self.thread:
+            self.thread.join(timeout=10)
+        self.http.close()
+
+    def is_running(self):
+        return bool(self.thread and self.thread.is_alive())
+
+    def run(self):
+        next_scan = datetime.utcnow()
+        while not self.stop_event.is_set():
+            now = datetime.utcnow()
+            if now >= next_scan:
+                try:
+                    self.scan(now)
+                    next_scan = now + timedelta(seconds=self.scan_interval)
+                except Exception as e:
+                    self.last_error = f"{now.isoformat()}: {e}"
+                    logger.error(f"Reminder scan failed, retrying in {self.retry_delay:.0f}s: {e}")
+                    next_scan = now + timedelta(seconds=self.retry_delay)
+
+            for session_id, start_time in self.pop_due(datetime.utcnow()):
+                self.send(session_id, start_time)
+
+            with self.lock:
+                wake_at = min(self.heap[0][0], next_scan) if self.heap else next_scan
+            self.wakeup.wait(max(0.0, (wake_at - datetime.utcnow()).total_seconds()))
+            self.wakeup.clear()
+
+    def scan(self, now):
+        """Queue reminders for sessions that will enter the reminder window before the next scan"""
+        with self.app.app_context():
+            sessions = self.find_sessions(now, now + self.lead + timedelta(seconds=self.scan_interval))
+        for session_id, start_time in sessions:
+            self.schedule(session_id, start_time, start_time - self.lead)
+        self.last_scan_at = now
+
+    def schedule(self, session_id, start_time, due_at):
+        with self.lock:
+            if (session_id, start_time) in self.scheduled:
+                return
+            self.scheduled.add((session_id, start_time))
+            heapq.heappush(self.heap, (due_at, session_id, start_time))
+        self.wakeup.set()
+
+    def pop_due(self, now):
+        due = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                _, session_id, start_time = heapq.heappop(self.heap)
+                self.scheduled.discard((session_id, start_time))
+                due.append((session_id, start_time))
+        return due
+
+    def send(self, session_id, start_time):
+        try:
+            with self.app.app_context():
+                # Rechecked now: the session may have been cancelled, moved or reminded since the scan
+                payload = self.build_reminder(session_id, start_time)
+            if payload is None:
+                return
+
+            response = self.http.post(f"{self.email_service_url}/send-bulk", json=payload, timeout=30)
+            response.raise_for_status()
+            result = response.json()
+
+            with self.app.app_context():
+                self.record_reminder(session_id, start_time, result)
+            self.sent_total += result.get('queued', 0)
+            self.last_error = None
+            logger.info(f"Queued {result.get('queued', 0)} reminders for session {session_id}")
+        except Exception as e:
+            self.last_error = f"{datetime.utcnow().isoformat()}: {e}"
+            logger.error(f"Reminder for session {session_id} failed, retrying in {self.retry_delay:.0f}s: {e}")
+            if start_time > datetime.utcnow():
+                self.schedule(session_id, start_time, datetime.utcnow() + timedelta(seconds=self.retry_delay))
+
+    def status(self):
+        with self.lock:
+            next_due = self.heap[0][0] if self.heap else None
+            pending = len(self.heap)
+        return {
+            'running': self.is_running(),
+            'lead_hours': self.lead.total_seconds() / 3600,
+            'scan_interval_seconds': self.scan_interval,
+            'pending_reminders': pending,
+            'next_due_at': next_due.isoformat() if next_due else None,
+            'last_scan_at': self.last_scan_at.isoformat() if self.last_scan_at else None,
+            'last_error': self.last_error,
+            'sent_total': self.sent_total
+        }
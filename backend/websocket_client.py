@@ -5,12 +5,22 @@ import time
 import os
 from datetime import datetime
 
+try:
+    import msgpack
+except ImportError:  # optional: payloads fall back to JSON without it
+    msgpack = None
+
 logger = logging.getLogger(__name__)
 
 class NotificationWebSocketClient:
     def __init__(self, notification_service_url=None, token=None):
         self.notification_service_url = notification_service_url or os.getenv('NOTIFICATION_SERVICE_URL', 'http://localhost:5002')
         self.token = token or os.getenv('BACKEND_SERVICE_TOKEN', 'backend-service-token-here')
+        # 'msgpack' sends payloads as a binary attachment, 'json' keeps the default text frames
+        self.wire_format = os.getenv('NOTIFICATION_WIRE_FORMAT', 'json')
+        if self.wire_format == 'msgpack' and msgpack is None:
+            logger.warning("NOTIFICATION_WIRE_FORMAT=msgpack but msgpack is not installed, using JSON")
+            self.wire_format = 'json'
         self.sio = socketio.Client(logger=True, engineio_logger=True)
         self.connected = False
         self.setup_event_handlers()
@@ -65,6 +75,12 @@ class NotificationWebSocketClient:
         if self.sio.connected:
             self.sio.disconnect()
     
+    def encode_payload(self, data):
+        """Encode an outgoing payload in the configured wire format"""
+        if self.wire_format == 'msgpack':
+            return msgpack.packb(data, use_bin_type=True)
+        return data
+    
     def send_booking_notification(self, booking_data):
         """Send booking notification via WebSocket"""
         if not self.connected:
@@ -74,13 +90,26 @@ class NotificationWebSocketClient:
                 return False
         
         try:
-            self.sio.emit('booking_notification', booking_data)
+            self.sio.emit('booking_notification', self.encode_payload(booking_data))
             logger.info(f"Booking notification sent: {booking_data['booking_id']}")
             return True
         except Exception as e:
             logger.error(f"Failed to send booking notification: {e}")
             return False
     
+    def send_session_availability(self, availability_data):
+        """Publish a session's remaining spots; best effort, never reconnects on the request path"""
+        if not self.is_connected():
+            logger.debug("Not connected to notification service, skipping availability update")
+            return False
+        
+        try:
+            self.sio.emit('session_availability_update', self.encode_payload(availability_data))
+            return True
+        except Exception as e:
+            logger.error(f"Failed to send availability update: {e}")
+            return False
+    
     def is_connected(self):
         """Check if connected to notification service"""
         return self.connected and self.sio.connected
@@ -101,6 +130,10 @@ def send_booking_notification(booking_data):
     """Send booking notification through WebSocket"""
     return notification_client.send_booking_notification(booking_data)
 
+def send_session_availability(availability_data):
+    """Send session availability update through WebSocket"""
+    return notification_client.send_session_availability(availability_data)
+
 def cleanup_notification_client():
     """Cleanup notification client connection"""
     notification_client.disconnect_from_service()
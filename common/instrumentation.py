@@ -0,0 +1,344 @@
+"""
+Request, SQL, outbound call and Socket.IO handler timings in Prometheus text format,
+and trace spans written as JSON lines.
+
+Every service imports this one module: its app.py puts common/ on sys.path,
+and each image, built from the repository root, copies it to /common. Typical
+wiring:
+
+    instrumentation = Instrumentation('backend', app, db=db)
+    instrumentation.instrument_session(worker.http, 'crm_service')
+    with instrumentation.outbound('email_service', 'send_booking_emails'):
+        requests.post(...)
+
+Instrumentation registers GET /metrics unless `metrics_endpoint=False`, in which
+case the service's own endpoint appends `instrumentation.render()`.
+
+Tracer follows one request across services:
+
+    tracer = Tracer('backend')
+    with tracer.span('send_booking_emails'):
+        requests.post(url, json=data, headers=tracer.headers())
+
+The receiving service continues the trace with
+`tracer.span(name, tracer.from_headers(request.headers))`, or with the `trace`
+field of a Socket.IO or queued payload, which carries `tracer.context()`.
+"""
+
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from urllib.parse import urlsplit
+
+from flask import Response, g, has_request_context, request
+
+logger = logging.getLogger(__name__)
+
+TRACE_ID_HEADER = 'X-Trace-Id'
+PARENT_SPAN_HEADER = 'X-Parent-Span-Id'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100)
+
+# name -> (help, buckets)
+HISTOGRAMS = {
+    'http_request_duration_seconds': ('HTTP request latency by route', LATENCY_BUCKETS),
+    'http_request_sql_statements': ('SQL statements run per HTTP request', STATEMENT_BUCKETS),
+    'http_request_sql_seconds': ('Time spent in SQL per HTTP request', LATENCY_BUCKETS),
+    'sql_statement_duration_seconds': ('SQL statement latency by operation, requests and background work', LATENCY_BUCKETS),
+    'outbound_request_duration_seconds': ('Calls to other services and SMTP by target and operation', LATENCY_BUCKETS),
+    'socketio_event_duration_seconds': ('Socket.IO event handler latency by event', LATENCY_BUCKETS),
+}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+def format_labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def format_bound(bound):
+    return f'{bound:g}' if isinstance(bound, float) else str(bound)
+
+
+class Instrumentation:
+    def __init__(self, service, app=None, db=None, socketio=None, metrics_endpoint=True):
+        self.service = service
+        self.series = {}  # (histogram name, ((label, value), ...)) -> Histogram
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, metrics_endpoint)
+        if db is not None:
+            self.instrument_sqlalchemy()
+        if socketio is not None:
+            self.instrument_socketio(socketio)
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(labels.items()))
+        with self.lock:
+            histogram = self.series.get(key)
+            if histogram is None:
+                histogram = self.series[key] = Histogram(HISTOGRAMS[name][1])
+            histogram.observe(value)
+
+    def init_app(self, app, metrics_endpoint=True):
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        if metrics_endpoint:
+            app.add_url_rule('/metrics', 'metrics', self.metrics_response)
+
+    def start_request(self):
+        g.instrumentation_started = time.perf_counter()
+        g.sql_statements = 0
+        g.sql_seconds = 0.0
+
+    def finish_request(self, response):
+        started = g.pop('instrumentation_started', None)
+        if started is None:
+            return response
+        # Unmatched paths share one label so 404 scans cannot grow the series without bound
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        self.observe('http_request_duration_seconds', time.perf_counter() - started,
+                     method=request.method, route=route, status=response.status_code)
+        self.observe('http_request_sql_statements', g.sql_statements, method=request.method, route=route)
+        self.observe('http_request_sql_seconds', g.sql_seconds, method=request.method, route=route)
+        return response
+
+    def instrument_sqlalchemy(self):
+        """Time every statement on every engine in the process"""
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('instrumentation_started', []).append(time.perf_counter())
+
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - conn.info['instrumentation_started'].pop()
+            operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else 'UNKNOWN'
+            self.observe('sql_statement_duration_seconds', elapsed, operation=operation)
+            if has_request_context() and 'sql_statements' in g:
+                g.sql_statements += 1
+                g.sql_seconds += elapsed
+
+        def handle_error(exception_context):
+            # A failed statement never reaches after_cursor_execute
+            started = exception_context.connection.info.get('instrumentation_started') \
+                if exception_context.connection is not None else None
+            if started:
+                started.pop()
+
+        event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+        event.listen(Engine, 'handle_error', handle_error)
+
+    def instrument_socketio(self, socketio):
+        """Time handlers registered with socketio.on or socketio.event from now on"""
+        register = socketio.on
+
+        def on(message, namespace=None):
+            def decorator(handler):
+                @functools.wraps(handler)
+                def timed(*args, **kwargs):
+                    started = time.perf_counter()
+                    outcome = 'error'
+                    try:
+                        result = handler(*args, **kwargs)
+                        outcome = 'ok'
+                        return result
+                    finally:
+                        self.observe('socketio_event_duration_seconds', time.perf_counter() - started,
+                                     event=message, outcome=outcome)
+                register(message, namespace)(timed)
+                return handler
+            return decorator
+
+        socketio.on = on
+
+    @contextmanager
+    def outbound(self, target, operation):
+        """Time a call to another service; outcome is error if the block raises"""
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            yield
+            outcome = 'ok'
+        finally:
+            self.observe('outbound_request_duration_seconds', time.perf_counter() - started,
+                         target=target, operation=operation, outcome=outcome)
+
+    def instrument_session(self, session, target):
+        """Time every call made through a requests.Session; the operation is the method and path"""
+        send = session.request
+
+        def timed_request(method, url, *args, **kwargs):
+            with self.outbound(target, f'{method.upper()} {urlsplit(url).path}'):
+                return send(method, url, *args, **kwargs)
+
+        session.request = timed_request
+        return session
+
+    def render(self):
+        """Prometheus text exposition of every histogram recorded so far"""
+        with self.lock:
+            snapshot = sorted((key, list(histogram.counts), histogram.sum)
+                              for key, histogram in self.series.items())
+        lines = []
+        current = None
+        for (name, labels), counts, total in snapshot:
+            metric = f'{self.service}_{name}'
+            if name != current:
+                help_text, _ = HISTOGRAMS[name]
+                lines.append(f'# HELP {metric} {help_text}')
+                lines.append(f'# TYPE {metric} histogram')
+                current = name
+            buckets = HISTOGRAMS[name][1]
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), counts):
+                cumulative += count
+                le = bound if bound == '+Inf' else format_bound(bound)
+                lines.append(f'{metric}_bucket{format_labels(labels, le=le)} {cumulative}')
+            lines.append(f'{metric}_sum{format_labels(labels)} {total}')
+            lines.append(f'{metric}_count{format_labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def metrics_response(self):
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+current_span = ContextVar('current_span', default=None)
+
+
+class Tracer:
+    """Records spans as JSON lines in TRACE_LOG_PATH, one file shared by every service or
+    one per service; trace_report.py in the repository root rebuilds the waterfalls.
+
+    A span only exists inside a trace, one started with new_trace=True or continued from
+    a propagated context, so untraced work records nothing. Without TRACE_LOG_PATH spans
+    are still propagated but not written.
+    """
+
+    def __init__(self, service, path=None):
+        self.service = service
+        self.path = os.getenv('TRACE_LOG_PATH', '') if path is None else path
+        self.file = None
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, context=None, new_trace=False, **attrs):
+        """Time a block as a child of `context`, or of the current span if none is given"""
+        parent = current_span.get()
+        if new_trace:
+            trace_id, parent_id = uuid.uuid4().hex, None
+        elif context:
+            trace_id, parent_id = context.get('trace_id'), context.get('parent_id')
+        elif parent is not None:
+            trace_id, parent_id = parent['trace_id'], parent['span_id']
+        else:
+            trace_id = None
+
+        if not trace_id:
+            yield None
+            return
+
+        span = {
+            'trace_id': trace_id,
+            'span_id': uuid.uuid4().hex[:16],
+            'parent_id': parent_id,
+            'service': self.service,
+            'name': name,
+            'start': time.time(),
+            'attrs': attrs,
+            'outcome': 'error'
+        }
+        token = current_span.set(span)
+        started = time.perf_counter()
+        try:
+            yield span
+            span['outcome'] = 'ok'
+        finally:
+            span['duration_ms'] = round((time.perf_counter() - started) * 1000, 3)
+            current_span.reset(token)
+            self.write(span)
+
+    def traced(self, name, new_trace=False):
+        """Decorator form of span"""
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.span(name, new_trace=new_trace):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def record(self, name, start, end, context, **attrs):
+        """Write a span measured elsewhere, such as time spent waiting in a queue"""
+        if context and context.get('trace_id'):
+            self.write({
+                'trace_id': context['trace_id'],
+                'span_id': uuid.uuid4().hex[:16],
+                'parent_id': context.get('parent_id'),
+                'service': self.service,
+                'name': name,
+                'start': start,
+                'attrs': attrs,
+                'outcome': 'ok',
+                'duration_ms': round(max(0.0, end - start) * 1000, 3)
+            })
+
+    def annotate(self, **attrs):
+        """Add attributes to the current span, such as ids only known partway through"""
+        span = current_span.get()
+        if span is not None:
+            span['attrs'].update(attrs)
+
+    def context(self):
+        """Trace context for work continued elsewhere, parented to the current span"""
+        span = current_span.get()
+        if span is None:
+            return None
+        return {'trace_id': span['trace_id'], 'parent_id': span['span_id']}
+
+    def headers(self):
+        context = self.context()
+        if context is None:
+            return {}
+        return {TRACE_ID_HEADER: context['trace_id'], PARENT_SPAN_HEADER: context['parent_id']}
+
+    def from_headers(self, headers):
+        trace_id = headers.get(TRACE_ID_HEADER)
+        if not trace_id:
+            return None
+        return {'trace_id': trace_id, 'parent_id': headers.get(PARENT_SPAN_HEADER)}
+
+    def write(self, span):
+        if not self.path:
+            return
+        line = json.dumps(span, default=str) + '\n'
+        with self.lock:
+            try:
+                if self.file is None:
+                    # Line buffered appends, so services sharing the file do not interleave lines
+                    self.file = open(self.path, 'a', buffering=1)
+                self.file.write(line)
+            except OSError as e:
+                logger.warning(f"Could not write trace span to {self.path}: {e}")
@@ -1,13 +1,54 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from sqlalchemy import inspect, select, text, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from collections import Counter
+from datetime import date, datetime, timedelta
+import base64
+import csv
+import io
+import json
+import logging
 import os
+import sys
+# instrumentation.py is shared from common/ at the repository root; the images copy it to /common
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'common'))
+from instrumentation import Instrumentation
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///crm.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 db = SQLAlchemy(app)
+# /metrics is defined below, behind the same bearer token as the API
+instrumentation = Instrumentation('crm_service', app, db=db, metrics_endpoint=False)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Largest number of records accepted by one batch ingest request
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', '5000'))
+
+# Page sizes for GET /api/notifications
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Exports fetch and send this many rows at a time
+EXPORT_CHUNK_ROWS = 500
+EXPORT_CSV_COLUMNS = [
+    'id', 'booking_id', 'event_type', 'user_id', 'user_email', 'user_name', 'event_id',
+    'event_title', 'event_start_time', 'facilitator_id', 'received_at', 'processed'
+]
+
+# Work queue claims: a claimed notification is hidden from other workers until
+# it is completed or its lease runs out
+DEFAULT_CLAIM_SIZE = 10
+MAX_CLAIM_SIZE = 500
+DEFAULT_LEASE_SECONDS = int(os.getenv('CLAIM_LEASE_SECONDS', '60'))
+MAX_LEASE_SECONDS = 3600
+
+# Event type recorded when the sender does not give one
+DEFAULT_EVENT_TYPE = 'booking_created'
 
 # Static Bearer Token for authentication
 BEARER_TOKEN = os.getenv('CRM_BEARER_TOKEN', 'your-static-bearer-token-here')
@@ -23,8 +64,40 @@ class BookingNotification(db.Model):
     event_title = db.Column(db.String(200), nullable=False)
     event_start_time = db.Column(db.DateTime, nullable=False)
     facilitator_id = db.Column(db.Integer, nullable=False)
+    event_type = db.Column(db.String(50), nullable=False, default=DEFAULT_EVENT_TYPE,
+                           server_default=DEFAULT_EVENT_TYPE)
     received_at = db.Column(db.DateTime, default=datetime.utcnow)
     processed = db.Column(db.Boolean, default=False)
+    claimed_by = db.Column(db.String(100), nullable=True)
+    lease_expires_at = db.Column(db.DateTime, nullable=True)
+    
+    # One row per booking event, so upstream retries are absorbed by the index
+    # Listing indexes end in (received_at, id) to serve keyset pages for each filter
+    __table_args__ = (
+        db.Index('uq_booking_notification_booking_event', 'booking_id', 'event_type', unique=True),
+        db.Index('ix_booking_notification_received', 'received_at', 'id'),
+        db.Index('ix_booking_notification_processed_received', 'processed', 'received_at', 'id'),
+        db.Index('ix_booking_notification_facilitator_received', 'facilitator_id', 'received_at', 'id'),
+        db.Index('ix_booking_notification_event_received', 'event_id', 'received_at', 'id'),
+    )
+
+class BookingRollup(db.Model):
+    """Notification counts per UTC day, facilitator, event and event type, maintained at ingest"""
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    facilitator_id = db.Column(db.Integer, nullable=False)
+    event_id = db.Column(db.Integer, nullable=False)
+    event_type = db.Column(db.String(50), nullable=False)
+    bookings = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        db.Index('uq_booking_rollup_key', 'day', 'facilitator_id', 'event_id', 'event_type', unique=True),
+        db.Index('ix_booking_rollup_facilitator_day', 'facilitator_id', 'day'),
+        db.Index('ix_booking_rollup_event_day', 'event_id', 'day'),
+    )
+
+# Dimensions GET /api/analytics/bookings can group by
+ROLLUP_DIMENSIONS = ['day', 'facilitator_id', 'event_id', 'event_type']
 
 def validate_bearer_token():
     """Validate Bearer token from Authorization header"""
@@ -40,79 +113,227 @@ def validate_bearer_token():
     except ValueError:
         return False
 
-@app.route('/api/booking-notification', methods=['POST'])
-def receive_booking_notification():
-    # Validate Bearer token
-    if not validate_bearer_token():
-        return jsonify({'error': 'Invalid or missing Bearer token'}), 401
+def is_id(value):
+    """Client-supplied ids are checked before they reach a query; bool is an int subclass"""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def parse_booking_notification(data):
+    """Validate one booking notification payload.
     
-    data = request.get_json()
+    Returns (values, None) with the BookingNotification column values, or
+    (None, error) describing the first problem found.
+    """
+    if not isinstance(data, dict):
+        return None, 'Record must be a JSON object'
     
     # Validate required fields
     required_fields = ['booking_id', 'user', 'event', 'facilitator_id']
     for field in required_fields:
         if field not in data:
-            return jsonify({'error': f'Missing required field: {field}'}), 400
+            return None, f'Missing required field: {field}'
     
     # Validate nested required fields
     user_fields = ['id', 'email', 'name']
     event_fields = ['id', 'title', 'start_time']
     
     for field in user_fields:
-        if field not in data['user']:
-            return jsonify({'error': f'Missing required user field: {field}'}), 400
+        if not isinstance(data['user'], dict) or field not in data['user']:
+            return None, f'Missing required user field: {field}'
     
     for field in event_fields:
-        if field not in data['event']:
-            return jsonify({'error': f'Missing required event field: {field}'}), 400
+        if not isinstance(data['event'], dict) or field not in data['event']:
+            return None, f'Missing required event field: {field}'
+    
+    # Checked here so one bad record is rejected on its own instead of failing the batch insert
+    for name, value in (('booking_id', data['booking_id']), ('user.id', data['user']['id']),
+                        ('event.id', data['event']['id']), ('facilitator_id', data['facilitator_id'])):
+        if not is_id(value):
+            return None, f'{name} must be an integer'
+    for name, value, max_length in (('user.email', data['user']['email'], 120),
+                                    ('user.name', data['user']['name'], 100),
+                                    ('event.title', data['event']['title'], 200)):
+        if not isinstance(value, str) or not value.strip() or len(value) > max_length:
+            return None, f'{name} must be a non-empty string of at most {max_length} characters'
+    
+    event_type = data.get('event_type', DEFAULT_EVENT_TYPE)
+    if not isinstance(event_type, str) or not event_type or len(event_type) > 50:
+        return None, 'event_type must be a non-empty string of at most 50 characters'
     
+    # Parse and validate start_time
     try:
-        # Parse and validate start_time
         start_time = datetime.fromisoformat(data['event']['start_time'])
-        
-        # Store notification in database
-        notification = BookingNotification(
-            booking_id=data['booking_id'],
-            user_id=data['user']['id'],
-            user_email=data['user']['email'],
-            user_name=data['user']['name'],
-            event_id=data['event']['id'],
-            event_title=data['event']['title'],
-            event_start_time=start_time,
-            facilitator_id=data['facilitator_id']
-        )
-        
-        db.session.add(notification)
+    except (TypeError, ValueError) as e:
+        return None, f'Invalid date format: {str(e)}'
+    
+    return {
+        'booking_id': data['booking_id'],
+        'user_id': data['user']['id'],
+        'user_email': data['user']['email'],
+        'user_name': data['user']['name'],
+        'event_id': data['event']['id'],
+        'event_title': data['event']['title'],
+        'event_start_time': start_time,
+        'facilitator_id': data['facilitator_id'],
+        'event_type': event_type
+    }, None
+
+def insert_ignoring_duplicates():
+    """INSERT ... ON CONFLICT (booking_id, event_type) DO NOTHING RETURNING id for this database"""
+    dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+    return dialect.insert(BookingNotification).on_conflict_do_nothing(
+        index_elements=['booking_id', 'event_type']
+    ).returning(
+        BookingNotification.id, BookingNotification.received_at, BookingNotification.facilitator_id,
+        BookingNotification.event_id, BookingNotification.event_type
+    )
+
+def update_rollups(inserted):
+    """Add newly inserted notifications to the rollup counts in the caller's transaction"""
+    counts = Counter(
+        (row.received_at.date(), row.facilitator_id, row.event_id, row.event_type) for row in inserted
+    )
+    if not counts:
+        return
+    
+    dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+    statement = dialect.insert(BookingRollup)
+    statement = statement.on_conflict_do_update(
+        index_elements=['day', 'facilitator_id', 'event_id', 'event_type'],
+        set_={'bookings': BookingRollup.bookings + statement.excluded.bookings}
+    )
+    db.session.execute(statement, [
+        {'day': day, 'facilitator_id': facilitator_id, 'event_id': event_id, 'event_type': event_type,
+         'bookings': bookings}
+        for (day, facilitator_id, event_id, event_type), bookings in counts.items()
+    ])
+
+def rebuild_rollups():
+    """Recompute every rollup from booking_notification, e.g. for data stored before rollups existed"""
+    db.session.execute(db.delete(BookingRollup))
+    day = db.func.date(BookingNotification.received_at)
+    db.session.execute(db.insert(BookingRollup).from_select(
+        ['day', 'facilitator_id', 'event_id', 'event_type', 'bookings'],
+        select(day, BookingNotification.facilitator_id, BookingNotification.event_id,
+               BookingNotification.event_type, db.func.count())
+        .group_by(day, BookingNotification.facilitator_id, BookingNotification.event_id,
+                  BookingNotification.event_type)
+    ))
+    db.session.commit()
+
+def read_batch_records():
+    """Yield (index, record, error) for a JSON array body or an NDJSON stream"""
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        # Read line by line so large NDJSON bodies are never held as one string
+        index = 0
+        for line in request.stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield index, json.loads(line), None
+            except ValueError as e:
+                yield index, None, f'Invalid JSON: {str(e)}'
+            index += 1
+        return
+    
+    records = request.get_json(silent=True)
+    if not isinstance(records, list):
+        raise ValueError('Body must be a JSON array or an NDJSON stream')
+    for index, record in enumerate(records):
+        yield index, record, None
+
+@app.route('/api/booking-notification', methods=['POST'])
+def receive_booking_notification():
+    # Validate Bearer token
+    if not validate_bearer_token():
+        return jsonify({'error': 'Invalid or missing Bearer token'}), 401
+    
+    values, error = parse_booking_notification(request.get_json())
+    if error:
+        return jsonify({'error': error}), 400
+    
+    try:
+        # Store notification in database; a replay of a known booking event is a no-op
+        inserted = db.session.execute(insert_ignoring_duplicates().values(**values)).first()
+        duplicate = inserted is None
+        if duplicate:
+            notification_id = db.session.execute(
+                db.select(BookingNotification.id).filter_by(
+                    booking_id=values['booking_id'], event_type=values['event_type']
+                )
+            ).scalar()
+        else:
+            notification_id = inserted.id
+            update_rollups([inserted])
         db.session.commit()
         
         # Log the notification (in production, you might want to send emails, etc.)
-        print(f"New booking notification received:")
-        print(f"  Booking ID: {data['booking_id']}")
-        print(f"  User: {data['user']['name']} ({data['user']['email']})")
-        print(f"  Event: {data['event']['title']}")
-        print(f"  Facilitator ID: {data['facilitator_id']}")
+        logger.info(f"Booking notification {'replayed' if duplicate else 'received'}: "
+                    f"booking {values['booking_id']} for facilitator {values['facilitator_id']}")
         
         return jsonify({
-            'message': 'Booking notification received successfully',
-            'notification_id': notification.id
+            'message': 'Booking notification already received' if duplicate
+                       else 'Booking notification received successfully',
+            'notification_id': notification_id,
+            'duplicate': duplicate
         }), 200
         
-    except ValueError as e:
-        return jsonify({'error': f'Invalid date format: {str(e)}'}), 400
     except Exception as e:
-        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+        db.session.rollback()
+        logger.error(f"Error storing booking notification: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
 
-@app.route('/api/notifications', methods=['GET'])
-def get_notifications():
+@app.route('/api/booking-notifications/batch', methods=['POST'])
+def receive_booking_notifications_batch():
+    """Validate a batch in one pass and insert every valid record in a single transaction"""
     # Validate Bearer token
     if not validate_bearer_token():
         return jsonify({'error': 'Invalid or missing Bearer token'}), 401
     
-    notifications = BookingNotification.query.order_by(
-        BookingNotification.received_at.desc()
-    ).all()
+    rows = []
+    errors = []
+    received = 0
+    try:
+        for index, record, error in read_batch_records():
+            received += 1
+            if received > MAX_BATCH_SIZE:
+                return jsonify({'error': f'Batch exceeds {MAX_BATCH_SIZE} records'}), 413
+            if error is None:
+                values, error = parse_booking_notification(record)
+            if error:
+                errors.append({'index': index, 'booking_id': record.get('booking_id') if isinstance(record, dict) else None,
+                               'error': error})
+            else:
+                rows.append(values)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    inserted = 0
+    try:
+        if rows:
+            inserted_rows = db.session.execute(insert_ignoring_duplicates(), rows).all()
+            update_rollups(inserted_rows)
+            inserted = len(inserted_rows)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error storing booking notification batch: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+    
+    logger.info(f"Batch ingest: {inserted} booking notifications stored, "
+                f"{len(rows) - inserted} duplicates ignored, {len(errors)} rejected")
     
-    return jsonify([{
+    return jsonify({
+        'message': 'Batch processed',
+        'received': received,
+        'inserted': inserted,
+        'duplicates': len(rows) - inserted,
+        'failed': len(errors),
+        'errors': errors
+    }), 200
+
+def serialize_notification(n):
+    return {
         'id': n.id,
         'booking_id': n.booking_id,
         'user': {
@@ -126,9 +347,139 @@ def get_notifications():
             'start_time': n.event_start_time.isoformat()
         },
         'facilitator_id': n.facilitator_id,
+        'event_type': n.event_type,
         'received_at': n.received_at.isoformat(),
-        'processed': n.processed
-    } for n in notifications])
+        'processed': n.processed,
+        'claimed_by': n.claimed_by,
+        'lease_expires_at': n.lease_expires_at.isoformat() if n.lease_expires_at else None
+    }
+
+def encode_cursor(notification):
+    raw = json.dumps([notification.received_at.isoformat(), notification.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        received_at, notification_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(received_at), int(notification_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+def parse_bool(value):
+    if value.lower() in ('true', '1', 'yes'):
+        return True
+    if value.lower() in ('false', '0', 'no'):
+        return False
+    raise ValueError(f'Invalid boolean: {value}')
+
+def filter_notifications(query, args):
+    """Apply the listing filters from the query string; raises ValueError on bad input"""
+    if 'processed' in args:
+        query = query.filter(BookingNotification.processed == parse_bool(args['processed']))
+    if 'facilitator_id' in args:
+        query = query.filter(BookingNotification.facilitator_id == int(args['facilitator_id']))
+    if 'event_id' in args:
+        query = query.filter(BookingNotification.event_id == int(args['event_id']))
+    if 'since' in args:
+        query = query.filter(BookingNotification.received_at >= datetime.fromisoformat(args['since']))
+    if 'until' in args:
+        query = query.filter(BookingNotification.received_at < datetime.fromisoformat(args['until']))
+    return query
+
+def export_row(n):
+    return [
+        n.id, n.booking_id, n.event_type, n.user_id, n.user_email, n.user_name, n.event_id,
+        n.event_title, n.event_start_time.isoformat(), n.facilitator_id, n.received_at.isoformat(), n.processed
+    ]
+
+@app.route('/api/notifications', methods=['GET'])
+def get_notifications():
+    """List notifications a page at a time, keyed on (received_at, id).
+    
+    Query parameters: processed, facilitator_id, event_id, since, until (ISO
+    datetimes on received_at), order (desc by default, asc for work queues),
+    limit and cursor (the next_cursor of the previous page).
+    """
+    # Validate Bearer token
+    if not validate_bearer_token():
+        return jsonify({'error': 'Invalid or missing Bearer token'}), 401
+    
+    args = request.args
+    order = args.get('order', 'desc')
+    if order not in ('asc', 'desc'):
+        return jsonify({'error': 'order must be asc or desc'}), 400
+    
+    try:
+        limit = min(max(int(args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        query = filter_notifications(BookingNotification.query, args)
+        
+        key = tuple_(BookingNotification.received_at, BookingNotification.id)
+        if 'cursor' in args:
+            position = decode_cursor(args['cursor'])
+            query = query.filter(key > position if order == 'asc' else key < position)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if order == 'asc':
+        query = query.order_by(BookingNotification.received_at.asc(), BookingNotification.id.asc())
+    else:
+        query = query.order_by(BookingNotification.received_at.desc(), BookingNotification.id.desc())
+    
+    # Fetch one extra row to learn whether another page exists
+    notifications = query.limit(limit + 1).all()
+    has_more = len(notifications) > limit
+    notifications = notifications[:limit]
+    
+    return jsonify({
+        'notifications': [serialize_notification(n) for n in notifications],
+        'count': len(notifications),
+        'next_cursor': encode_cursor(notifications[-1]) if has_more else None
+    })
+
+@app.route('/api/notifications/export', methods=['GET'])
+def export_notifications():
+    """Stream every matching notification as NDJSON (default) or CSV.
+    
+    Takes the same filters as the listing. Rows are read through a server-side
+    cursor EXPORT_CHUNK_ROWS at a time and written out as they arrive, so memory
+    stays flat however large the export.
+    """
+    # Validate Bearer token
+    if not validate_bearer_token():
+        return jsonify({'error': 'Invalid or missing Bearer token'}), 401
+    
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+    
+    try:
+        query = filter_notifications(BookingNotification.query, request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    query = query.order_by(BookingNotification.received_at, BookingNotification.id)
+    
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if export_format == 'csv':
+            writer.writerow(EXPORT_CSV_COLUMNS)
+        
+        for count, n in enumerate(query.yield_per(EXPORT_CHUNK_ROWS), 1):
+            if export_format == 'csv':
+                writer.writerow(export_row(n))
+            else:
+                buffer.write(json.dumps(serialize_notification(n)) + '\n')
+            if count % EXPORT_CHUNK_ROWS == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename=booking_notifications.{export_format}'
+    })
 
 @app.route('/api/notifications/<int:notification_id>/process', methods=['PUT'])
 def mark_notification_processed(notification_id):
@@ -138,10 +489,160 @@ def mark_notification_processed(notification_id):
     
     notification = BookingNotification.query.get_or_404(notification_id)
     notification.processed = True
+    notification.claimed_by = None
+    notification.lease_expires_at = None
     db.session.commit()
     
     return jsonify({'message': 'Notification marked as processed'})
 
+@app.route('/api/notifications/claim', methods=['POST'])
+def claim_notifications():
+    """Lease up to `limit` unprocessed notifications, oldest first, to one worker.
+    
+    Rows held by another worker's unexpired lease are skipped. On PostgreSQL
+    the candidate rows are locked with FOR UPDATE SKIP LOCKED so concurrent
+    claims never wait on or hand out the same row; SQLite runs the whole
+    UPDATE under its single write lock, which gives the same guarantee.
+    """
+    # Validate Bearer token
+    if not validate_bearer_token():
+        return jsonify({'error': 'Invalid or missing Bearer token'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    worker_id = data.get('worker_id')
+    if not isinstance(worker_id, str) or not worker_id or len(worker_id) > 100:
+        return jsonify({'error': 'worker_id must be a non-empty string of at most 100 characters'}), 400
+    
+    try:
+        limit = min(max(int(data.get('limit', DEFAULT_CLAIM_SIZE)), 1), MAX_CLAIM_SIZE)
+        lease_seconds = min(max(int(data.get('lease_seconds', DEFAULT_LEASE_SECONDS)), 1), MAX_LEASE_SECONDS)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'limit and lease_seconds must be integers'}), 400
+    
+    now = datetime.utcnow()
+    lease_expires_at = now + timedelta(seconds=lease_seconds)
+    
+    candidates = select(BookingNotification.id).where(
+        BookingNotification.processed == False,  # noqa: E712
+        db.or_(BookingNotification.lease_expires_at.is_(None), BookingNotification.lease_expires_at < now)
+    ).order_by(
+        BookingNotification.received_at, BookingNotification.id
+    ).limit(limit).with_for_update(skip_locked=True)
+    
+    claimed = db.session.execute(
+        update(BookingNotification)
+        .where(BookingNotification.id.in_(candidates))
+        .values(claimed_by=worker_id, lease_expires_at=lease_expires_at)
+        .returning(BookingNotification)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    db.session.commit()
+    
+    claimed.sort(key=lambda n: (n.received_at, n.id))
+    return jsonify({
+        'notifications': [serialize_notification(n) for n in claimed],
+        'count': len(claimed),
+        'lease_expires_at': lease_expires_at.isoformat()
+    })
+
+@app.route('/api/notifications/complete', methods=['POST'])
+def complete_notifications():
+    """Mark a worker's claimed notifications processed in one statement.
+    
+    Only rows still leased to the worker are completed. A row whose lease
+    expired and was claimed by someone else is reported back as lost.
+    """
+    # Validate Bearer token
+    if not validate_bearer_token():
+        return jsonify({'error': 'Invalid or missing Bearer token'}), 401
+    
+    data = request.get_json(silent=True) or {}
+    worker_id = data.get('worker_id')
+    notification_ids = data.get('notification_ids')
+    if not isinstance(worker_id, str) or not worker_id:
+        return jsonify({'error': 'worker_id is required'}), 400
+    if not isinstance(notification_ids, list) or not all(is_id(i) for i in notification_ids):
+        return jsonify({'error': 'notification_ids must be a list of integers'}), 400
+    
+    completed = []
+    if notification_ids:
+        completed = db.session.execute(
+            update(BookingNotification)
+            .where(
+                BookingNotification.id.in_(notification_ids),
+                BookingNotification.claimed_by == worker_id,
+                BookingNotification.processed == False  # noqa: E712
+            )
+            .values(processed=True, claimed_by=None, lease_expires_at=None)
+            .returning(BookingNotification.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        db.session.commit()
+    
+    completed_ids = set(completed)
+    return jsonify({
+        'completed': len(completed_ids),
+        'lost': [i for i in notification_ids if i not in completed_ids]
+    })
+
+@app.route('/api/analytics/bookings', methods=['GET'])
+def get_booking_analytics():
+    """Booking counts from the rollup table.
+    
+    Query parameters: since / until (dates, until exclusive), facilitator_id,
+    event_id, event_type (default booking_created) and group_by, a comma-separated
+    subset of day, facilitator_id, event_id, event_type (default day).
+    """
+    # Validate Bearer token
+    if not validate_bearer_token():
+        return jsonify({'error': 'Invalid or missing Bearer token'}), 401
+    
+    args = request.args
+    group_by = [name for name in args.get('group_by', 'day').split(',') if name]
+    unknown = [name for name in group_by if name not in ROLLUP_DIMENSIONS]
+    if unknown:
+        return jsonify({'error': f"Cannot group by {', '.join(unknown)}; choose from {', '.join(ROLLUP_DIMENSIONS)}"}), 400
+    
+    columns = [getattr(BookingRollup, name) for name in group_by]
+    query = select(*columns, db.func.sum(BookingRollup.bookings).label('bookings')).where(
+        BookingRollup.event_type == args.get('event_type', DEFAULT_EVENT_TYPE)
+    )
+    try:
+        if 'since' in args:
+            query = query.where(BookingRollup.day >= date.fromisoformat(args['since']))
+        if 'until' in args:
+            query = query.where(BookingRollup.day < date.fromisoformat(args['until']))
+        if 'facilitator_id' in args:
+            query = query.where(BookingRollup.facilitator_id == int(args['facilitator_id']))
+        if 'event_id' in args:
+            query = query.where(BookingRollup.event_id == int(args['event_id']))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    results = db.session.execute(query.group_by(*columns).order_by(*columns)).all()
+    
+    rows = []
+    for result in results:
+        row = {name: value for name, value in zip(group_by, result)}
+        if 'day' in row:
+            row['day'] = row['day'].isoformat()
+        row['bookings'] = int(result.bookings or 0)
+        rows.append(row)
+    
+    return jsonify({
+        'group_by': group_by,
+        'rows': rows,
+        'total': sum(row['bookings'] for row in rows)
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus histograms"""
+    # Validate Bearer token
+    if not validate_bearer_token():
+        return jsonify({'error': 'Invalid or missing Bearer token'}), 401
+    return instrumentation.metrics_response()
+
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'healthy', 'service': 'CRM'}), 200
@@ -150,6 +651,39 @@ def health_check():
 def create_tables():
     with app.app_context():
         db.create_all()
+        upgrade_booking_notification_table()
+        # Rollups start empty on upgrade; build them once from the stored notifications
+        if not db.session.query(BookingRollup.query.exists()).scalar() and \
+                db.session.query(BookingNotification.query.exists()).scalar():
+            rebuild_rollups()
+
+def upgrade_booking_notification_table():
+    """Bring a booking_notification table created by an older release up to date"""
+    table = BookingNotification.__tablename__
+    columns = {column['name'] for column in inspect(db.engine).get_columns(table)}
+    added_columns = {
+        'event_type': f"VARCHAR(50) NOT NULL DEFAULT '{DEFAULT_EVENT_TYPE}'",
+        'claimed_by': 'VARCHAR(100)',
+        'lease_expires_at': 'TIMESTAMP'
+    }
+    for name, ddl in added_columns.items():
+        if name not in columns:
+            db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+    
+    indexes = {index['name'] for index in inspect(db.engine).get_indexes(table)}
+    if 'uq_booking_notification_booking_event' not in indexes:
+        # Earlier retries may have stored the same booking event twice; keep the first copy
+        removed = db.session.execute(text(f"""
+            DELETE FROM {table} WHERE id NOT IN (
+                SELECT MIN(id) FROM {table} GROUP BY booking_id, event_type
+            )
+        """)).rowcount
+        if removed:
+            logger.warning(f"Removed {removed} duplicate booking notifications before adding the unique index")
+    db.session.commit()
+    
+    for index in BookingNotification.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
 
 if __name__ == '__main__':
     create_tables()
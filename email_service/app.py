@@ -5,10 +5,21 @@ from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
 import os
-from datetime import datetime
+import sys
+from datetime import datetime, timezone
+import atexit
 import logging
+from collections import Counter
+from smtp_pool import SMTPConnectionPool
+from email_queue import EmailQueue
+from email_templates import EmailTemplates
+# instrumentation.py is shared from common/ at the repository root; the images copy it to /common
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'common'))
+from instrumentation import Instrumentation, Tracer
 
 app = Flask(__name__)
+instrumentation = Instrumentation('email_service', app)
+tracer = Tracer('email_service')
 
 # Email configuration
 SMTP_SERVER = os.getenv('SMTP_SERVER', 'smtp.gmail.com')
@@ -16,6 +27,33 @@ SMTP_PORT = int(os.getenv('SMTP_PORT', '587'))
 EMAIL_ADDRESS = os.getenv('EMAIL_ADDRESS', 'your-email@gmail.com')
 EMAIL_PASSWORD = os.getenv('EMAIL_PASSWORD', 'your-app-password')
 EMAIL_FROM_NAME = os.getenv('EMAIL_FROM_NAME', 'Booking System')
+SMTP_USE_TLS = os.getenv('SMTP_USE_TLS', 'true').lower() == 'true'
+SMTP_TIMEOUT = float(os.getenv('SMTP_TIMEOUT', '30'))
+
+# Authenticated SMTP connections are pooled and reused across sends
+SMTP_POOL_SIZE = int(os.getenv('SMTP_POOL_SIZE', '4'))
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv('SMTP_MAX_MESSAGES_PER_CONNECTION', '100'))
+SMTP_HEALTH_CHECK_INTERVAL = float(os.getenv('SMTP_HEALTH_CHECK_INTERVAL', '30'))  # idle seconds before a NOOP check
+
+# Emails are queued in SQLite and sent by a worker pool, with retries and a dead-letter state
+EMAIL_QUEUE_PATH = os.getenv('EMAIL_QUEUE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'email_queue.db'))
+EMAIL_WORKERS = int(os.getenv('EMAIL_WORKERS', '4'))
+EMAIL_MAX_ATTEMPTS = int(os.getenv('EMAIL_MAX_ATTEMPTS', '5'))
+EMAIL_RETRY_BACKOFF = float(os.getenv('EMAIL_RETRY_BACKOFF', '2'))  # seconds before the first retry, doubled each attempt
+EMAIL_RETRY_MAX_BACKOFF = float(os.getenv('EMAIL_RETRY_MAX_BACKOFF', '300'))
+# Workers start when the module loads; tests and benchmarks that start them themselves turn this off
+EMAIL_QUEUE_AUTOSTART = os.getenv('EMAIL_QUEUE_AUTOSTART', 'true').lower() == 'true'
+
+# Bulk sends: recipients per request, and emails per second across all bulk batches (0 = unlimited)
+EMAIL_BULK_MAX_RECIPIENTS = int(os.getenv('EMAIL_BULK_MAX_RECIPIENTS', '5000'))
+EMAIL_BULK_RATE_LIMIT = float(os.getenv('EMAIL_BULK_RATE_LIMIT', '10'))
+
+# A booking email already sent to a recipient is skipped if requested again within this many seconds
+EMAIL_DEDUPE_TTL = float(os.getenv('EMAIL_DEDUPE_TTL', str(7 * 86400)))
+
+# Jinja2 templates, one set of files per email type; compiled templates are cached as bytecode
+EMAIL_TEMPLATE_DIR = os.getenv('EMAIL_TEMPLATE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates'))
+EMAIL_TEMPLATE_CACHE_DIR = os.getenv('EMAIL_TEMPLATE_CACHE_DIR', '')  # defaults to a directory under the system temp dir
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -28,317 +66,176 @@ class EmailService:
         self.email_address = EMAIL_ADDRESS
         self.email_password = EMAIL_PASSWORD
         self.from_name = EMAIL_FROM_NAME
+        self.pool = SMTPConnectionPool(
+            self.smtp_server, self.smtp_port,
+            username=self.email_address, password=self.email_password,
+            use_tls=SMTP_USE_TLS, size=SMTP_POOL_SIZE,
+            max_messages=SMTP_MAX_MESSAGES_PER_CONNECTION,
+            health_check_interval=SMTP_HEALTH_CHECK_INTERVAL, timeout=SMTP_TIMEOUT
+        )
+
+    def deliver_email(self, to_email, subject, html_content, text_content=None):
+        """Send email over a pooled SMTP connection; raises on failure"""
+        # Create message
+        msg = MIMEMultipart('alternative')
+        msg['From'] = f"{self.from_name} <{self.email_address}>"
+        msg['To'] = to_email
+        msg['Subject'] = subject
+
+        # Add text version if provided
+        if text_content:
+            text_part = MIMEText(text_content, 'plain')
+            msg.attach(text_part)
+
+        # Add HTML version
+        html_part = MIMEText(html_content, 'html')
+        msg.attach(html_part)
+
+        text = msg.as_string()
+        with tracer.span('smtp_send'):
+            try:
+                with self.pool.connection() as server:
+                    server.sendmail(self.email_address, to_email, text)
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                # The server dropped a pooled connection between health checks; the other idle
+                # ones are likely gone too, so discard them and retry once on a fresh connection
+                tracer.annotate(reconnected=True)
+                self.pool.close()
+                with self.pool.connection() as server:
+                    server.sendmail(self.email_address, to_email, text)
+
+        logger.info(f"Email sent successfully to {to_email}")
 
     def send_email(self, to_email, subject, html_content, text_content=None):
-        """Send email using SMTP"""
+        """Send email over a pooled SMTP connection"""
         try:
-            # Create message
-            msg = MIMEMultipart('alternative')
-            msg['From'] = f"{self.from_name} <{self.email_address}>"
-            msg['To'] = to_email
-            msg['Subject'] = subject
-
-            # Add text version if provided
-            if text_content:
-                text_part = MIMEText(text_content, 'plain')
-                msg.attach(text_part)
-
-            # Add HTML version
-            html_part = MIMEText(html_content, 'html')
-            msg.attach(html_part)
-
-            # Connect to server and send email
-            server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-            server.starttls()
-            server.login(self.email_address, self.email_password)
-            
-            text = msg.as_string()
-            server.sendmail(self.email_address, to_email, text)
-            server.quit()
-
-            logger.info(f"Email sent successfully to {to_email}")
+            self.deliver_email(to_email, subject, html_content, text_content)
             return True
-
         except Exception as e:
             logger.error(f"Failed to send email to {to_email}: {str(e)}")
             return False
 
-    def generate_booking_confirmation_email(self, booking_data):
-        """Generate booking confirmation email for user"""
-        user_name = booking_data.get('user', {}).get('name', 'User')
-        session_title = booking_data.get('session', {}).get('title', 'Session')
-        session_type = booking_data.get('session', {}).get('session_type', 'session')
-        start_time = booking_data.get('session', {}).get('start_time', '')
-        end_time = booking_data.get('session', {}).get('end_time', '')
-        facilitator_name = booking_data.get('facilitator', {}).get('name', 'Facilitator')
-        price = booking_data.get('session', {}).get('price', 0)
-        booking_id = booking_data.get('booking_id', '')
-
-        # Format dates
-        try:
-            start_dt = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
-            end_dt = datetime.fromisoformat(end_time.replace('Z', '+00:00'))
-            formatted_start = start_dt.strftime('%B %d, %Y at %I:%M %p')
-            formatted_end = end_dt.strftime('%I:%M %p')
-        except:
-            formatted_start = start_time
-            formatted_end = end_time
-
-        subject = f"Booking Confirmation - {session_title}"
-
-        html_content = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <style>
-                body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-                .header {{ background-color: #4F46E5; color: white; padding: 20px; text-align: center; }}
-                .content {{ padding: 20px; }}
-                .booking-details {{ background-color: #f8f9fa; padding: 15px; border-radius: 5px; margin: 20px 0; }}
-                .footer {{ background-color: #f1f1f1; padding: 15px; text-align: center; font-size: 12px; }}
-                .button {{ background-color: #4F46E5; color: white; padding: 10px 20px; text-decoration: none; border-radius: 5px; }}
-            </style>
-        </head>
-        <body>
-            <div class="header">
-                <h1>Booking Confirmed!</h1>
-            </div>
-            <div class="content">
-                <h2>Hello {user_name},</h2>
-                <p>Your booking has been confirmed! Here are the details:</p>
-                
-                <div class="booking-details">
-                    <h3>Booking Details</h3>
-                    <p><strong>Session:</strong> {session_title}</p>
-                    <p><strong>Type:</strong> {session_type.title()}</p>
-                    <p><strong>Date & Time:</strong> {formatted_start} - {formatted_end}</p>
-                    <p><strong>Facilitator:</strong> {facilitator_name}</p>
-                    <p><strong>Price:</strong> ${price:.2f}</p>
-                    <p><strong>Booking ID:</strong> {booking_id}</p>
-                </div>
-
-                <p>We're excited to have you join us! Please arrive 10 minutes early to get settled.</p>
-                
-                <p>If you have any questions or need to make changes to your booking, please contact us.</p>
-                
-                <p>Best regards,<br>The Booking System Team</p>
-            </div>
-            <div class="footer">
-                <p>This is an automated email. Please do not reply directly to this email.</p>
-            </div>
-        </body>
-        </html>
-        """
-
-        text_content = f"""
-        Booking Confirmed!
-
-        Hello {user_name},
-
-        Your booking has been confirmed! Here are the details:
-
-        Session: {session_title}
-        Type: {session_type.title()}
-        Date & Time: {formatted_start} - {formatted_end}
-        Facilitator: {facilitator_name}
-        Price: ${price:.2f}
-        Booking ID: {booking_id}
-
-        We're excited to have you join us! Please arrive 10 minutes early to get settled.
-
-        If you have any questions or need to make changes to your booking, please contact us.
-
-        Best regards,
-        The Booking System Team
-        """
-
-        return subject, html_content, text_content
-
-    def generate_facilitator_notification_email(self, booking_data):
-        """Generate booking notification email for facilitator"""
-        facilitator_name = booking_data.get('facilitator', {}).get('name', 'Facilitator')
-        user_name = booking_data.get('user', {}).get('name', 'User')
-        user_email = booking_data.get('user', {}).get('email', '')
-        session_title = booking_data.get('session', {}).get('title', 'Session')
-        session_type = booking_data.get('session', {}).get('session_type', 'session')
-        start_time = booking_data.get('session', {}).get('start_time', '')
-        end_time = booking_data.get('session', {}).get('end_time', '')
-        price = booking_data.get('session', {}).get('price', 0)
-        booking_id = booking_data.get('booking_id', '')
-
-        # Format dates
-        try:
-            start_dt = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
-            end_dt = datetime.fromisoformat(end_time.replace('Z', '+00:00'))
-            formatted_start = start_dt.strftime('%B %d, %Y at %I:%M %p')
-            formatted_end = end_dt.strftime('%I:%M %p')
-        except:
-            formatted_start = start_time
-            formatted_end = end_time
-
-        subject = f"New Booking - {session_title}"
-
-        html_content = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <style>
-                body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-                .header {{ background-color: #059669; color: white; padding: 20px; text-align: center; }}
-                .content {{ padding: 20px; }}
-                .booking-details {{ background-color: #f0f9ff; padding: 15px; border-radius: 5px; margin: 20px 0; }}
-                .footer {{ background-color: #f1f1f1; padding: 15px; text-align: center; font-size: 12px; }}
-                .highlight {{ background-color: #fef3c7; padding: 10px; border-radius: 5px; margin: 10px 0; }}
-            </style>
-        </head>
-        <body>
-            <div class="header">
-                <h1>New Booking Received!</h1>
-            </div>
-            <div class="content">
-                <h2>Hello {facilitator_name},</h2>
-                <p>You have received a new booking for your session!</p>
-                
-                <div class="booking-details">
-                    <h3>Booking Details</h3>
-                    <p><strong>Session:</strong> {session_title}</p>
-                    <p><strong>Type:</strong> {session_type.title()}</p>
-                    <p><strong>Date & Time:</strong> {formatted_start} - {formatted_end}</p>
-                    <p><strong>Revenue:</strong> ${price:.2f}</p>
-                    <p><strong>Booking ID:</strong> {booking_id}</p>
-                </div>
-
-                <div class="highlight">
-                    <h3>Participant Information</h3>
-                    <p><strong>Name:</strong> {user_name}</p>
-                    <p><strong>Email:</strong> {user_email}</p>
-                </div>
-
-                <p>The participant will receive a confirmation email with session details.</p>
-                
-                <p>You can manage your bookings and sessions from your facilitator dashboard.</p>
-                
-                <p>Best regards,<br>The Booking System Team</p>
-            </div>
-            <div class="footer">
-                <p>This is an automated email. Please do not reply directly to this email.</p>
-            </div>
-        </body>
-        </html>
-        """
-
-        text_content = f"""
-        New Booking Received!
-
-        Hello {facilitator_name},
-
-        You have received a new booking for your session!
-
-        Booking Details:
-        Session: {session_title}
-        Type: {session_type.title()}
-        Date & Time: {formatted_start} - {formatted_end}
-        Revenue: ${price:.2f}
-        Booking ID: {booking_id}
-
-        Participant Information:
-        Name: {user_name}
-        Email: {user_email}
-
-        The participant will receive a confirmation email with session details.
-
-        You can manage your bookings and sessions from your facilitator dashboard.
-
-        Best regards,
-        The Booking System Team
-        """
-
-        return subject, html_content, text_content
-
 # Initialize email service
 email_service = EmailService()
 
+# Email types are defined by the files in templates/, compiled once here
+email_templates = EmailTemplates(EMAIL_TEMPLATE_DIR, EMAIL_TEMPLATE_CACHE_DIR or None)
+
+def process_email_job(job):
+    """Render and send one queued email; any exception counts as a failed attempt"""
+    trace = job['payload'].get('trace')
+    if trace:
+        # From when this attempt fell due to when a worker claimed it
+        tracer.record('email_queue_wait', utc_timestamp(job['next_attempt_at']), utc_timestamp(job['updated_at']),
+                      trace, kind=job['kind'], attempt=job['attempts'])
+    with tracer.span('send_email', trace, kind=job['kind'], attempt=job['attempts']):
+        with tracer.span('render_email'):
+            if 'rendered' in job['payload']:
+                # Bulk jobs are rendered when accepted
+                subject, html_content, text_content = job['payload']['rendered']
+            else:
+                subject, html_content, text_content = email_templates.render(job['kind'], job['payload'])
+        with instrumentation.outbound('smtp', job['kind']):
+            email_service.deliver_email(job['recipient'], subject, html_content, text_content)
+
+def utc_timestamp(value):
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp()
+
+email_queue = EmailQueue(
+    EMAIL_QUEUE_PATH, process_email_job,
+    workers=EMAIL_WORKERS, max_attempts=EMAIL_MAX_ATTEMPTS,
+    backoff_base=EMAIL_RETRY_BACKOFF, backoff_max=EMAIL_RETRY_MAX_BACKOFF,
+    # A refused recipient or sender is refused again on every retry
+    permanent_errors=(smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, KeyError),
+    bulk_rate=EMAIL_BULK_RATE_LIMIT,
+    dedupe_ttl=EMAIL_DEDUPE_TTL
+)
+
+def shutdown():
+    email_queue.stop()
+    email_service.pool.close()
+
+atexit.register(shutdown)
+
+def dedupe_key(kind, recipient, data):
+    """Emails about a booking are sent once per type and recipient; others are never deduplicated.
+    A reminder_key narrows that to one occurrence, such as a booking's session at one start time."""
+    booking_id = data.get('booking_id')
+    if booking_id in (None, ''):
+        return None
+    reminder_key = data.get('reminder_key')
+    if reminder_key not in (None, ''):
+        return f"{booking_id}@{reminder_key}:{kind}:{recipient.strip().lower()}"
+    return f"{booking_id}:{kind}:{recipient.strip().lower()}"
+
+def validate_booking_email_request(data):
+    """Return an error message for a request missing booking email fields, else None"""
+    if not isinstance(data, dict):
+        return 'Request body must be a JSON object'
+    required_fields = ['user', 'session', 'facilitator', 'booking_id']
+    for field in required_fields:
+        if field not in data:
+            return f'Missing required field: {field}'
+    return None
+
 @app.route('/send-booking-confirmation', methods=['POST'])
 def send_booking_confirmation():
-    """Send booking confirmation email to user"""
+    """Queue booking confirmation email to user"""
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True)
         
         # Validate required fields
-        required_fields = ['user', 'session', 'facilitator', 'booking_id']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
+        error = validate_booking_email_request(data)
+        if error:
+            return jsonify({'error': error}), 400
 
         user_email = data['user'].get('email')
         if not user_email:
             return jsonify({'error': 'User email is required'}), 400
 
-        # Generate and send email
-        subject, html_content, text_content = email_service.generate_booking_confirmation_email(data)
-        
-        success = email_service.send_email(
-            to_email=user_email,
-            subject=subject,
-            html_content=html_content,
-            text_content=text_content
-        )
-
-        if success:
-            return jsonify({'message': 'Booking confirmation email sent successfully'}), 200
-        else:
-            return jsonify({'error': 'Failed to send booking confirmation email'}), 500
+        job_id, duplicate = email_queue.enqueue('booking_confirmation', user_email, data,
+                                                dedupe_key('booking_confirmation', user_email, data))
+        message = 'Booking confirmation email already queued or sent' if duplicate else 'Booking confirmation email queued'
+        return jsonify({'message': message, 'job_id': job_id, 'duplicate': duplicate}), 202
 
     except Exception as e:
-        logger.error(f"Error sending booking confirmation: {str(e)}")
+        logger.error(f"Error queueing booking confirmation: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/send-facilitator-notification', methods=['POST'])
 def send_facilitator_notification():
-    """Send booking notification email to facilitator"""
+    """Queue booking notification email to facilitator"""
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True)
         
         # Validate required fields
-        required_fields = ['user', 'session', 'facilitator', 'booking_id']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
+        error = validate_booking_email_request(data)
+        if error:
+            return jsonify({'error': error}), 400
 
         facilitator_email = data['facilitator'].get('email')
         if not facilitator_email:
             return jsonify({'error': 'Facilitator email is required'}), 400
 
-        # Generate and send email
-        subject, html_content, text_content = email_service.generate_facilitator_notification_email(data)
-        
-        success = email_service.send_email(
-            to_email=facilitator_email,
-            subject=subject,
-            html_content=html_content,
-            text_content=text_content
-        )
-
-        if success:
-            return jsonify({'message': 'Facilitator notification email sent successfully'}), 200
-        else:
-            return jsonify({'error': 'Failed to send facilitator notification email'}), 500
+        job_id, duplicate = email_queue.enqueue('facilitator_notification', facilitator_email, data,
+                                                dedupe_key('facilitator_notification', facilitator_email, data))
+        message = 'Facilitator notification email already queued or sent' if duplicate else 'Facilitator notification email queued'
+        return jsonify({'message': message, 'job_id': job_id, 'duplicate': duplicate}), 202
 
     except Exception as e:
-        logger.error(f"Error sending facilitator notification: {str(e)}")
+        logger.error(f"Error queueing facilitator notification: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
 @app.route('/send-booking-emails', methods=['POST'])
 def send_booking_emails():
-    """Send both booking confirmation and facilitator notification emails"""
+    """Queue both booking confirmation and facilitator notification emails"""
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True)
         
         # Validate required fields
-        required_fields = ['user', 'session', 'facilitator', 'booking_id']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
+        error = validate_booking_email_request(data)
+        if error:
+            return jsonify({'error': error}), 400
 
         user_email = data['user'].get('email')
         facilitator_email = data['facilitator'].get('email')
@@ -346,43 +243,167 @@ def send_booking_emails():
         if not user_email or not facilitator_email:
             return jsonify({'error': 'Both user and facilitator emails are required'}), 400
 
-        results = {'user_email': False, 'facilitator_email': False}
+        # One job per email so each is retried on its own
+        jobs = {}
+        duplicates = []
+        with tracer.span('queue_booking_emails', tracer.from_headers(request.headers), booking_id=data['booking_id']):
+            trace = tracer.context()
+            if trace:
+                # Workers continue the trace when they send
+                data['trace'] = trace
+            for name, kind, email in (('user_email', 'booking_confirmation', user_email),
+                                      ('facilitator_email', 'facilitator_notification', facilitator_email)):
+                jobs[name], duplicate = email_queue.enqueue(kind, email, data, dedupe_key(kind, email, data))
+                if duplicate:
+                    duplicates.append(name)
+            tracer.annotate(duplicates=len(duplicates))
+
+        message = 'Booking emails already queued or sent' if len(duplicates) == len(jobs) else 'Booking emails queued'
+        return jsonify({'message': message, 'jobs': jobs, 'duplicates': duplicates}), 202
 
-        # Send booking confirmation to user
-        try:
-            subject, html_content, text_content = email_service.generate_booking_confirmation_email(data)
-            results['user_email'] = email_service.send_email(
-                to_email=user_email,
-                subject=subject,
-                html_content=html_content,
-                text_content=text_content
-            )
-        except Exception as e:
-            logger.error(f"Error sending user confirmation: {str(e)}")
+    except Exception as e:
+        logger.error(f"Error queueing booking emails: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
 
-        # Send notification to facilitator
-        try:
-            subject, html_content, text_content = email_service.generate_facilitator_notification_email(data)
-            results['facilitator_email'] = email_service.send_email(
-                to_email=facilitator_email,
-                subject=subject,
-                html_content=html_content,
-                text_content=text_content
-            )
-        except Exception as e:
-            logger.error(f"Error sending facilitator notification: {str(e)}")
+@app.route('/send-email', methods=['POST'])
+def send_templated_email():
+    """Queue an email of any type defined in the templates directory"""
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
+
+        template = data.get('template')
+        to_email = data.get('to')
+        variables = data.get('data', {})
+        if template not in email_templates:
+            return jsonify({'error': f'Unknown email template: {template}'}), 400
+        if not to_email or not isinstance(to_email, str):
+            return jsonify({'error': 'Recipient email is required'}), 400
+        if not isinstance(variables, dict):
+            return jsonify({'error': 'data must be an object'}), 400
+
+        job_id, duplicate = email_queue.enqueue(template, to_email, variables,
+                                                dedupe_key(template, to_email, variables))
+        message = f'{template} email already queued or sent' if duplicate else f'{template} email queued'
+        return jsonify({'message': message, 'job_id': job_id, 'duplicate': duplicate}), 202
 
-        if results['user_email'] and results['facilitator_email']:
-            return jsonify({'message': 'Both emails sent successfully', 'results': results}), 200
-        elif results['user_email'] or results['facilitator_email']:
-            return jsonify({'message': 'Partial success - some emails sent', 'results': results}), 207
-        else:
-            return jsonify({'error': 'Failed to send both emails', 'results': results}), 500
+    except Exception as e:
+        logger.error(f"Error queueing templated email: {str(e)}")
+        return jsonify({'error': 'Internal server error'}), 500
+
+@app.route('/send-bulk', methods=['POST'])
+def send_bulk():
+    """Queue one template to many recipients, each with their own variables"""
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'error': 'Request body must be a JSON object'}), 400
+
+        template = data.get('template')
+        shared = data.get('data', {})
+        recipients = data.get('recipients')
+        if template not in email_templates:
+            return jsonify({'error': f'Unknown email template: {template}'}), 400
+        if not isinstance(shared, dict):
+            return jsonify({'error': 'data must be an object'}), 400
+        if not isinstance(recipients, list) or not recipients:
+            return jsonify({'error': 'recipients must be a non-empty list'}), 400
+        if len(recipients) > EMAIL_BULK_MAX_RECIPIENTS:
+            return jsonify({'error': f'At most {EMAIL_BULK_MAX_RECIPIENTS} recipients per request'}), 400
+
+        # Render every email up front so template errors are reported per recipient
+        results = []
+        jobs = []
+        seen = set()
+        for index, recipient in enumerate(recipients):
+            if isinstance(recipient, str):
+                recipient = {'email': recipient}
+            email = recipient.get('email') if isinstance(recipient, dict) else None
+            variables = recipient.get('data', {}) if isinstance(recipient, dict) else None
+            if not isinstance(email, str) or '@' not in email:
+                results.append({'index': index, 'email': email, 'status': 'rejected', 'error': 'Invalid email address'})
+                continue
+            if not isinstance(variables, dict):
+                results.append({'index': index, 'email': email, 'status': 'rejected', 'error': 'data must be an object'})
+                continue
+            if email.lower() in seen:
+                results.append({'index': index, 'email': email, 'status': 'rejected', 'error': 'Duplicate recipient'})
+                continue
+            context = {'email': email, **shared, **variables}
+            try:
+                rendered = email_templates.render(template, context)
+            except Exception as e:
+                results.append({'index': index, 'email': email, 'status': 'rejected', 'error': f'Render failed: {e}'})
+                continue
+            seen.add(email.lower())
+            results.append({'index': index, 'email': email, 'status': 'queued'})
+            jobs.append((email, {'rendered': rendered}, dedupe_key(template, email, context)))
+
+        if not jobs:
+            return jsonify({'error': 'No valid recipients', 'results': results}), 400
+
+        batch_id, queued = email_queue.enqueue_batch(template, jobs)
+        queued = iter(queued)
+        duplicates = 0
+        for result in results:
+            if result['status'] == 'queued':
+                result['job_id'], duplicate = next(queued)
+                if duplicate:
+                    result['status'] = 'duplicate'
+                    duplicates += 1
+
+        return jsonify({
+            'message': f'{len(jobs) - duplicates} {template} emails queued',
+            'batch_id': batch_id,
+            'queued': len(jobs) - duplicates,
+            'duplicates': duplicates,
+            'rejected': len(results) - len(jobs),
+            'results': results
+        }), 202
 
     except Exception as e:
-        logger.error(f"Error sending booking emails: {str(e)}")
+        logger.error(f"Error queueing bulk email: {str(e)}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/bulk/<batch_id>', methods=['GET'])
+def get_bulk_batch(batch_id):
+    """Get per-recipient delivery status for a bulk send"""
+    jobs = email_queue.get_batch(batch_id)
+    if not jobs:
+        return jsonify({'error': 'Batch not found'}), 404
+    counts = Counter(job['status'] for job in jobs)
+    return jsonify({
+        'batch_id': batch_id,
+        'template': jobs[0]['kind'],
+        'total': len(jobs),
+        'queued': counts['queued'] + counts['sending'],
+        'sent': counts['sent'],
+        'dead': counts['dead'],
+        'recipients': [
+            {'job_id': job['id'], 'email': job['recipient'], 'status': job['status'],
+             'attempts': job['attempts'], 'last_error': job['last_error']}
+            for job in jobs
+        ]
+    }), 200
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get the delivery status of a queued email"""
+    job = email_queue.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job), 200
+
+@app.route('/jobs/<job_id>/retry', methods=['POST'])
+def retry_job(job_id):
+    """Send a dead-lettered email again with a fresh set of attempts"""
+    if not email_queue.get(job_id):
+        return jsonify({'error': 'Job not found'}), 404
+    if not email_queue.retry(job_id):
+        return jsonify({'error': 'Only dead jobs can be retried'}), 409
+    return jsonify({'message': 'Job queued for retry', 'job': email_queue.get(job_id)}), 202
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -391,8 +412,19 @@ def health_check():
         'service': 'email_service',
         'timestamp': datetime.utcnow().isoformat(),
         'smtp_server': SMTP_SERVER,
-        'smtp_port': SMTP_PORT
+        'smtp_port': SMTP_PORT,
+        'smtp_pool': email_service.pool.snapshot(),
+        'queue': email_queue.stats(),
+        'templates': sorted(email_templates.kinds)
     }), 200
 
+def is_reloader_watcher():
+    """The debug reloader's parent process only watches files; the child it starts serves requests"""
+    return __name__ == '__main__' and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'
+
+# Every serving process sends: `python app.py`, and a WSGI server importing this module
+if EMAIL_QUEUE_AUTOSTART and not is_reloader_watcher():
+    email_queue.start()
+
 if __name__ == '__main__':
     app.run(debug=True, port=5003, host='0.0.0.0')
@@ -0,0 +1,171 @@
+"""
+End-to-end throughput benchmark for the email service.
+
+Boots app.py in-process against the local SMTP sink (smtp_sink.py) and pushes
+emails through the HTTP API, the queue, the worker pool and the SMTP
+connection pool. The sink can add handshake and per-message latency and fail
+a share of messages, so retry and dead-letter behaviour can be measured
+without a real provider.
+
+Reports how long the API takes to accept a request, delivered emails per
+second, and per-email latency from enqueue to delivery, including retries.
+
+Usage:
+    python benchmark_email_throughput.py --emails 1000 --workers 4 --message-latency 0.01
+    python benchmark_email_throughput.py --mode bulk --transient-failure-rate 0.1
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from smtp_sink import SMTPSink  # noqa: E402
+
+BULK_BATCH_SIZE = 500
+
+
+def percentile(sorted_values, pct):
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def booking(booking_id):
+    return {
+        'booking_id': booking_id,
+        'user': {'id': booking_id, 'email': f'user{booking_id}@example.com', 'name': 'John Doe'},
+        'session': {'id': 1, 'title': 'Morning Meditation', 'session_type': 'session',
+                    'start_time': '2030-01-15T09:00:00', 'end_time': '2030-01-15T10:00:00', 'price': 25.0},
+        'facilitator': {'id': 1, 'email': 'facilitator@example.com', 'name': 'Jane Smith'},
+    }
+
+
+def submit_bookings(client, emails):
+    """Two emails per booking, one request each"""
+    timings = []
+    for booking_id in range(1, emails // 2 + 1):
+        start = time.perf_counter()
+        response = client.post('/send-booking-emails', json=booking(booking_id))
+        timings.append(time.perf_counter() - start)
+        assert response.status_code == 202, response.get_json()
+    return timings
+
+
+def submit_bulk(client, emails):
+    timings = []
+    for first in range(0, emails, BULK_BATCH_SIZE):
+        recipients = [{'email': f'reader{index}@example.com', 'data': {'user': {'name': f'Reader {index}'}}}
+                      for index in range(first, min(emails, first + BULK_BATCH_SIZE))]
+        start = time.perf_counter()
+        response = client.post('/send-bulk', json={
+            'template': 'announcement',
+            'data': {'subject': 'Studio news', 'message': 'New sessions are open for booking.'},
+            'recipients': recipients,
+        })
+        timings.append(time.perf_counter() - start)
+        assert response.status_code == 202, response.get_json()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Email service end-to-end throughput benchmark')
+    parser.add_argument('--emails', type=int, default=1000)
+    parser.add_argument('--mode', choices=['booking', 'bulk'], default='booking',
+                        help='booking: /send-booking-emails per booking, bulk: /send-bulk in batches of 500')
+    parser.add_argument('--workers', type=int, default=4, help='queue workers, also the SMTP pool size')
+    parser.add_argument('--bulk-rate-limit', type=float, default=0, help='bulk emails per second, 0 for unlimited')
+    parser.add_argument('--connect-latency', type=float, default=0.05,
+                        help='seconds the sink delays its greeting, standing in for TLS + AUTH')
+    parser.add_argument('--message-latency', type=float, default=0.005, help='seconds the sink takes per message')
+    parser.add_argument('--transient-failure-rate', type=float, default=0.0, help='share of messages answered 451')
+    parser.add_argument('--permanent-failure-rate', type=float, default=0.0, help='share of recipients refused 550')
+    parser.add_argument('--disconnect-rate', type=float, default=0.0, help='share of messages that drop the connection')
+    parser.add_argument('--max-attempts', type=int, default=3)
+    parser.add_argument('--retry-backoff', type=float, default=0.1, help='first retry delay in seconds')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=300)
+    args = parser.parse_args()
+
+    sink = SMTPSink(connect_latency=args.connect_latency, message_latency=args.message_latency,
+                    transient_failure_rate=args.transient_failure_rate,
+                    permanent_failure_rate=args.permanent_failure_rate,
+                    disconnect_rate=args.disconnect_rate, seed=args.seed).start()
+    work_dir = tempfile.mkdtemp()
+    # app.py reads its configuration at import time
+    os.environ.update({
+        'SMTP_SERVER': sink.host,
+        'SMTP_PORT': str(sink.port),
+        'SMTP_USE_TLS': 'false',
+        'EMAIL_PASSWORD': '',
+        'SMTP_POOL_SIZE': str(args.workers),
+        'EMAIL_QUEUE_PATH': os.path.join(work_dir, 'email_queue.db'),
+        'EMAIL_QUEUE_AUTOSTART': 'false',
+        'EMAIL_TEMPLATE_CACHE_DIR': os.path.join(work_dir, 'templates'),
+        'EMAIL_WORKERS': str(args.workers),
+        'EMAIL_MAX_ATTEMPTS': str(args.max_attempts),
+        'EMAIL_RETRY_BACKOFF': str(args.retry_backoff),
+        'EMAIL_RETRY_MAX_BACKOFF': str(args.retry_backoff * 8),
+        'EMAIL_BULK_RATE_LIMIT': str(args.bulk_rate_limit),
+        'EMAIL_BULK_MAX_RECIPIENTS': str(BULK_BATCH_SIZE),
+    })
+    import app as email_app
+
+    # Per-send logging would dominate the measurement
+    logging.disable(logging.WARNING)
+    queue = email_app.email_queue
+    queue.poll_interval = 0.05
+    client = email_app.app.test_client()
+
+    print("📧 Email service throughput benchmark")
+    print("=" * 66)
+    print(f"{args.emails} emails via {args.mode}, {args.workers} workers, "
+          f"{args.connect_latency * 1000:.0f} ms handshake, {args.message_latency * 1000:.0f} ms per message")
+    print(f"Failures: {args.transient_failure_rate:.0%} transient, {args.permanent_failure_rate:.0%} permanent, "
+          f"{args.disconnect_rate:.0%} disconnect, {args.max_attempts} attempts max")
+
+    # Accept first and deliver afterwards, so the two phases are measured separately
+    submit = submit_bulk if args.mode == 'bulk' else submit_bookings
+    accept_start = time.perf_counter()
+    timings = sorted(timing * 1000 for timing in submit(client, args.emails))
+    accepted_in = time.perf_counter() - accept_start
+
+    deliver_start = time.perf_counter()
+    deliver_epoch = time.time()
+    queue.start()
+    deadline = deliver_start + args.timeout
+    while time.perf_counter() < deadline:
+        stats = queue.stats()
+        if stats['queued'] == 0 and stats['sending'] == 0:
+            break
+        time.sleep(0.05)
+    delivered_in = time.perf_counter() - deliver_start
+    queue.stop()
+    email_app.email_service.pool.close()
+
+    rows = queue.connection().execute('SELECT status, attempts, created_at, updated_at FROM email_job').fetchall()
+    statuses = Counter(row[0] for row in rows)
+    attempts = Counter(row[1] for row in rows if row[0] == 'sent')
+    # Workers start after the accept phase, so latency counts from then rather than from enqueue
+    sent_latencies = sorted(updated_at - max(created_at, deliver_epoch)
+                            for status, _, created_at, updated_at in rows if status == 'sent')
+
+    print()
+    print(f"{'Accept':<28}{len(timings) / accepted_in:>10.0f} req/s"
+          f"   p50 {percentile(timings, 50):.2f} ms   p99 {percentile(timings, 99):.2f} ms")
+    print(f"{'Delivery':<28}{statuses['sent'] / delivered_in:>10.1f}/s"
+          f"    {statuses['sent']} sent, {statuses['dead']} dead, {stats['queued'] + stats['sending']} unfinished")
+    if sent_latencies:
+        print(f"{'Queue to sent':<28}   p50 {percentile(sent_latencies, 50) * 1000:.0f} ms"
+              f"   p99 {percentile(sent_latencies, 99) * 1000:.0f} ms")
+    print(f"{'Attempts per sent email':<28}   "
+          + ', '.join(f"{count} in {n}" for n, count in sorted(attempts.items())))
+    print(f"{'SMTP':<28}   {sink.connections} connections, injected failures {dict(sink.failures) or 'none'}")
+    sink.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+SMTP connection pool benchmark for the email service.
+
+Sends booking emails to a local SMTP stand-in (smtp_sink.py) whose greeting is
+delayed by --connect-latency to model the TCP + STARTTLS + AUTH handshake of a
+real provider. Compares one connection per email (the pool with
+max_messages=1, equivalent to the old connect/login/quit per send) with pooled
+connections reused across sends.
+
+Usage:
+    python benchmark_smtp_pool.py --emails 200 --concurrency 4 --connect-latency 0.05
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from smtp_sink import SMTPSink  # noqa: E402
+
+SINK = SMTPSink().start()
+os.environ.update({
+    'SMTP_SERVER': SINK.host,
+    'SMTP_PORT': str(SINK.port),
+    'SMTP_USE_TLS': 'false',
+    'EMAIL_PASSWORD': '',
+    'EMAIL_QUEUE_PATH': os.path.join(tempfile.mkdtemp(), 'email_queue.db'),
+    'EMAIL_QUEUE_AUTOSTART': 'false',
+})
+
+import app as email_app  # noqa: E402
+from smtp_pool import SMTPConnectionPool  # noqa: E402
+
+# Per-send logging would dominate the measurement
+logging.disable(logging.INFO)
+
+BOOKING = {
+    'booking_id': 123,
+    'user': {'id': 1, 'email': 'user@example.com', 'name': 'John Doe'},
+    'session': {'id': 1, 'title': 'Morning Meditation', 'session_type': 'session',
+                'start_time': '2030-01-15T09:00:00', 'end_time': '2030-01-15T10:00:00', 'price': 25.0},
+    'facilitator': {'id': 1, 'email': 'facilitator@example.com', 'name': 'Jane Smith'},
+}
+
+
+def percentile(sorted_values, pct):
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run(label, max_messages, args):
+    service = email_app.EmailService()
+    service.pool = SMTPConnectionPool(SINK.host, SINK.port, use_tls=False,
+                                      size=args.concurrency, max_messages=max_messages)
+    subject, html_content, text_content = email_app.email_templates.render('booking_confirmation', BOOKING)
+    SINK.reset()
+
+    def send(_):
+        start = time.perf_counter()
+        ok = service.send_email(BOOKING['user']['email'], subject, html_content, text_content)
+        return ok, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(send, range(args.emails)))
+    elapsed = time.perf_counter() - start
+    service.pool.close()
+
+    latencies = sorted(latency * 1000 for _, latency in results)
+    sent = sum(1 for ok, _ in results if ok)
+    print(f"{label:<28}{sent / elapsed:>10.1f}/s{percentile(latencies, 50):>10.1f} ms"
+          f"{percentile(latencies, 99):>10.1f} ms{SINK.connections:>8}")
+    return sent / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Email service SMTP pool benchmark')
+    parser.add_argument('--emails', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=4, help='sending threads, also the pool size')
+    parser.add_argument('--connect-latency', type=float, default=0.05,
+                        help='seconds the sink delays its greeting, standing in for TLS + AUTH')
+    parser.add_argument('--max-messages', type=int, default=100, help='messages per pooled connection')
+    args = parser.parse_args()
+    SINK.connect_latency = args.connect_latency
+
+    print("📧 SMTP connection pool benchmark")
+    print("=" * 66)
+    print(f"{args.emails} emails, {args.concurrency} threads, {args.connect_latency * 1000:.0f} ms handshake")
+    print(f"{'Mode':<28}{'Throughput':>12}{'p50':>13}{'p99':>13}{'Conns':>8}")
+    unpooled = run('Connection per email', 1, args)
+    pooled = run('Pooled connections', args.max_messages, args)
+    print(f"Speedup: {pooled / unpooled:.1f}x")
+    SINK.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,302 @@
+"""
+Email template rendering benchmark for the email service.
+
+Measures, for each email type:
+
+  * renders per second with the templates compiled once at startup (what the
+    service does) versus loading, parsing and compiling them on every render
+  * for the two original email types, renders per second of the f-string
+    builders they replaced, kept below unchanged as the baseline
+  * startup cost of compiling every template from source versus loading them
+    from a warm bytecode cache
+
+Usage:
+    python benchmark_templates.py --renders 20000
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from markupsafe import Markup
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from email_templates import STYLES_TEMPLATE, EmailTemplates, email_datetime, email_time  # noqa: E402
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+BOOKING = {
+    'booking_id': 123,
+    'user': {'id': 1, 'email': 'user@example.com', 'name': 'John Doe'},
+    'session': {'id': 1, 'title': 'Morning Meditation', 'session_type': 'session',
+                'start_time': '2030-01-15T09:00:00', 'end_time': '2030-01-15T10:00:00', 'price': 25.0},
+    'facilitator': {'id': 1, 'email': 'facilitator@example.com', 'name': 'Jane Smith'},
+}
+
+
+def uncached_render(kind, data):
+    """Render with a fresh environment each time, so every template is parsed and compiled again"""
+    env = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=select_autoescape(['html']),
+                      cache_size=0, trim_blocks=True, lstrip_blocks=True)
+    env.filters['email_datetime'] = email_datetime
+    env.filters['email_time'] = email_time
+    env.globals['email_styles'] = lambda accent_color, details_color: Markup(
+        env.get_template(STYLES_TEMPLATE).render(accent_color=accent_color, details_color=details_color))
+    subject = env.get_template(f'{kind}.subject.txt').render(data)
+    return subject, env.get_template(f'{kind}.html').render(data), env.get_template(f'{kind}.txt').render(data)
+
+
+def renders_per_second(render, kind, renders):
+    start = time.perf_counter()
+    for _ in range(renders):
+        render(kind, BOOKING)
+    return renders / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Email template rendering benchmark')
+    parser.add_argument('--renders', type=int, default=20000, help='renders per email type when precompiled')
+    parser.add_argument('--uncached-renders', type=int, default=200, help='renders per email type when compiling each time')
+    parser.add_argument('--startups', type=int, default=20)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    cache_dir = tempfile.mkdtemp()
+    templates = EmailTemplates(TEMPLATE_DIR, cache_dir)
+
+    print("📧 Email template benchmark")
+    print("=" * 66)
+    print(f"{'Email type':<28}{'f-strings (before)':>20}{'Compiled once':>16}{'Compiled per render':>22}")
+    for kind in templates.kinds:
+        if kind in FSTRING_BUILDERS:
+            builder = FSTRING_BUILDERS[kind]
+            before = f"{renders_per_second(lambda _, data: builder(data), kind, args.renders):>18.0f}/s"
+        else:
+            before = f"{'-':>20}"
+        compiled = renders_per_second(templates.render, kind, args.renders)
+        uncached = renders_per_second(uncached_render, kind, args.uncached_renders)
+        print(f"{kind:<28}{before}{compiled:>14.0f}/s{uncached:>20.0f}/s")
+
+    def startup_ms(directory):
+        start = time.perf_counter()
+        for _ in range(args.startups):
+            if directory is None:
+                shutil.rmtree(cache_dir)
+            EmailTemplates(TEMPLATE_DIR, cache_dir)
+        return (time.perf_counter() - start) / args.startups * 1000
+
+    print(f"\nStartup, compiling from source:    {startup_ms(None):>6.1f} ms")
+    print(f"Startup, from warm bytecode cache: {startup_ms(cache_dir):>6.1f} ms")
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+# The service's email builders before the move to templates, unchanged apart from
+# no longer being methods, as the baseline for the rendering cost
+
+def fstring_booking_confirmation(booking_data):
+    """Generate booking confirmation email for user"""
+    user_name = booking_data.get('user', {}).get('name', 'User')
+    session_title = booking_data.get('session', {}).get('title', 'Session')
+    session_type = booking_data.get('session', {}).get('session_type', 'session')
+    start_time = booking_data.get('session', {}).get('start_time', '')
+    end_time = booking_data.get('session', {}).get('end_time', '')
+    facilitator_name = booking_data.get('facilitator', {}).get('name', 'Facilitator')
+    price = booking_data.get('session', {}).get('price', 0)
+    booking_id = booking_data.get('booking_id', '')
+
+    # Format dates
+    try:
+        start_dt = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
+        end_dt = datetime.fromisoformat(end_time.replace('Z', '+00:00'))
+        formatted_start = start_dt.strftime('%B %d, %Y at %I:%M %p')
+        formatted_end = end_dt.strftime('%I:%M %p')
+    except:
+        formatted_start = start_time
+        formatted_end = end_time
+
+    subject = f"Booking Confirmation - {session_title}"
+
+    html_content = f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <style>
+            body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
+            .header {{ background-color: #4F46E5; color: white; padding: 20px; text-align: center; }}
+            .content {{ padding: 20px; }}
+            .booking-details {{ background-color: #f8f9fa; padding: 15px; border-radius: 5px; margin: 20px 0; }}
+            .footer {{ background-color: #f1f1f1; padding: 15px; text-align: center; font-size: 12px; }}
+            .button {{ background-color: #4F46E5; color: white; padding: 10px 20px; text-decoration: none; border-radius: 5px; }}
+        </style>
+    </head>
+    <body>
+        <div class="header">
+            <h1>Booking Confirmed!</h1>
+        </div>
+        <div class="content">
+            <h2>Hello {user_name},</h2>
+            <p>Your booking has been confirmed! Here are the details:</p>
+
+            <div class="booking-details">
+                <h3>Booking Details</h3>
+                <p><strong>Session:</strong> {session_title}</p>
+                <p><strong>Type:</strong> {session_type.title()}</p>
+                <p><strong>Date & Time:</strong> {formatted_start} - {formatted_end}</p>
+                <p><strong>Facilitator:</strong> {facilitator_name}</p>
+                <p><strong>Price:</strong> ${price:.2f}</p>
+                <p><strong>Booking ID:</strong> {booking_id}</p>
+            </div>
+
+            <p>We're excited to have you join us! Please arrive 10 minutes early to get settled.</p>
+
+            <p>If you have any questions or need to make changes to your booking, please contact us.</p>
+
+            <p>Best regards,<br>The Booking System Team</p>
+        </div>
+        <div class="footer">
+            <p>This is an automated email. Please do not reply directly to this email.</p>
+        </div>
+    </body>
+    </html>
+    """
+
+    text_content = f"""
+    Booking Confirmed!
+
+    Hello {user_name},
+
+    Your booking has been confirmed! Here are the details:
+
+    Session: {session_title}
+    Type: {session_type.title()}
+    Date & Time: {formatted_start} - {formatted_end}
+    Facilitator: {facilitator_name}
+    Price: ${price:.2f}
+    Booking ID: {booking_id}
+
+    We're excited to have you join us! Please arrive 10 minutes early to get settled.
+
+    If you have any questions or need to make changes to your booking, please contact us.
+
+    Best regards,
+    The Booking System Team
+    """
+
+    return subject, html_content, text_content
+
+def fstring_facilitator_notification(booking_data):
+    """Generate booking notification email for facilitator"""
+    facilitator_name = booking_data.get('facilitator', {}).get('name', 'Facilitator')
+    user_name = booking_data.get('user', {}).get('name', 'User')
+    user_email = booking_data.get('user', {}).get('email', '')
+    session_title = booking_data.get('session', {}).get('title', 'Session')
+    session_type = booking_data.get('session', {}).get('session_type', 'session')
+    start_time = booking_data.get('session', {}).get('start_time', '')
+    end_time = booking_data.get('session', {}).get('end_time', '')
+    price = booking_data.get('session', {}).get('price', 0)
+    booking_id = booking_data.get('booking_id', '')
+
+    # Format dates
+    try:
+        start_dt = datetime.fromisoformat(start_time.replace('Z', '+00:00'))
+        end_dt = datetime.fromisoformat(end_time.replace('Z', '+00:00'))
+        formatted_start = start_dt.strftime('%B %d, %Y at %I:%M %p')
+        formatted_end = end_dt.strftime('%I:%M %p')
+    except:
+        formatted_start = start_time
+        formatted_end = end_time
+
+    subject = f"New Booking - {session_title}"
+
+    html_content = f"""
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <style>
+            body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
+            .header {{ background-color: #059669; color: white; padding: 20px; text-align: center; }}
+            .content {{ padding: 20px; }}
+            .booking-details {{ background-color: #f0f9ff; padding: 15px; border-radius: 5px; margin: 20px 0; }}
+            .footer {{ background-color: #f1f1f1; padding: 15px; text-align: center; font-size: 12px; }}
+            .highlight {{ background-color: #fef3c7; padding: 10px; border-radius: 5px; margin: 10px 0; }}
+        </style>
+    </head>
+    <body>
+        <div class="header">
+            <h1>New Booking Received!</h1>
+        </div>
+        <div class="content">
+            <h2>Hello {facilitator_name},</h2>
+            <p>You have received a new booking for your session!</p>
+
+            <div class="booking-details">
+                <h3>Booking Details</h3>
+                <p><strong>Session:</strong> {session_title}</p>
+                <p><strong>Type:</strong> {session_type.title()}</p>
+                <p><strong>Date & Time:</strong> {formatted_start} - {formatted_end}</p>
+                <p><strong>Revenue:</strong> ${price:.2f}</p>
+                <p><strong>Booking ID:</strong> {booking_id}</p>
+            </div>
+
+            <div class="highlight">
+                <h3>Participant Information</h3>
+                <p><strong>Name:</strong> {user_name}</p>
+                <p><strong>Email:</strong> {user_email}</p>
+            </div>
+
+            <p>The participant will receive a confirmation email with session details.</p>
+
+            <p>You can manage your bookings and sessions from your facilitator dashboard.</p>
+
+            <p>Best regards,<br>The Booking System Team</p>
+        </div>
+        <div class="footer">
+            <p>This is an automated email. Please do not reply directly to this email.</p>
+        </div>
+    </body>
+    </html>
+    """
+
+    text_content = f"""
+    New Booking Received!
+
+    Hello {facilitator_name},
+
+    You have received a new booking for your session!
+
+    Booking Details:
+    Session: {session_title}
+    Type: {session_type.title()}
+    Date & Time: {formatted_start} - {formatted_end}
+    Revenue: ${price:.2f}
+    Booking ID: {booking_id}
+
+    Participant Information:
+    Name: {user_name}
+    Email: {user_email}
+
+    The participant will receive a confirmation email with session details.
+
+    You can manage your bookings and sessions from your facilitator dashboard.
+
+    Best regards,
+    The Booking System Team
+    """
+
+    return subject, html_content, text_content
+
+
+FSTRING_BUILDERS = {
+    'booking_confirmation': fstring_booking_confirmation,
+    'facilitator_notification': fstring_facilitator_notification,
+}
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,375 @@
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS email_job (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    batch_id TEXT,
+    dedupe_key TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_email_job_due ON email_job (status, next_attempt_at);
+CREATE TABLE IF NOT EXISTS email_sent_log (
+    dedupe_key TEXT PRIMARY KEY,
+    job_id TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_email_sent_log_expires ON email_sent_log (expires_at);
+"""
+
+
+class RateLimiter:
+    """Token bucket shared by the workers; `rate` tokens per second, 0 for no limit"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self):
+        if not self.rate:
+            return True
+        with self.lock:
+            self.refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def refund(self):
+        if self.rate:
+            with self.lock:
+                self.tokens = min(self.burst, self.tokens + 1)
+
+    def wait_time(self):
+        """Seconds until the next token is available"""
+        if not self.rate:
+            return 0.0
+        with self.lock:
+            self.refill()
+            return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class EmailQueue:
+    """Durable SQLite-backed job queue drained by a pool of worker threads.
+
+    A job moves queued -> sending -> sent. A failed attempt goes back to queued
+    with exponential backoff until max_attempts, then to dead (the dead-letter
+    state), where it stays until retried by hand. Errors listed in
+    `permanent_errors` skip the remaining attempts. Jobs left in sending by a
+    crash are re-queued on start, so delivery is at least once.
+
+    Jobs enqueued with a batch_id are bulk sends. They are claimed only when
+    no single job is due, and at most `bulk_rate` per second across workers.
+
+    A job may carry a dedupe key. While the sent log holds that key (until
+    `dedupe_ttl` seconds after the send), enqueueing it again returns the
+    existing job instead of sending twice. Dead jobs release their key.
+    """
+
+    def __init__(self, path, handler, workers=4, max_attempts=5, backoff_base=2.0,
+                 backoff_max=300.0, poll_interval=1.0, sent_retention=72 * 3600,
+                 permanent_errors=(), bulk_rate=0, dedupe_ttl=7 * 86400):
+        self.path = path
+        self.handler = handler
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.poll_interval = poll_interval
+        self.sent_retention = sent_retention
+        self.permanent_errors = permanent_errors
+        self.bulk_limiter = RateLimiter(bulk_rate)
+        self.dedupe_ttl = dedupe_ttl
+        self.dedupe_hits = 0
+        self.counter_lock = threading.Lock()
+
+        self.local = threading.local()
+        self.wakeup = threading.Condition()
+        self.stop_event = threading.Event()
+        self.threads = []
+        self.last_purge = 0.0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.create_schema()
+
+    def connection(self):
+        """One autocommit connection per thread; WAL lets readers run alongside the writer"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+        return conn
+
+    def create_schema(self):
+        conn = self.connection()
+        conn.executescript(SCHEMA)
+        # Queues created by earlier versions lack the later columns
+        columns = {row['name'] for row in conn.execute('PRAGMA table_info(email_job)')}
+        for column in ('batch_id', 'dedupe_key'):
+            if column not in columns:
+                conn.execute(f'ALTER TABLE email_job ADD COLUMN {column} TEXT')
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_email_job_batch ON email_job (batch_id)')
+
+    def enqueue(self, kind, recipient, payload, dedupe_key=None):
+        """Store a job and wake a worker; returns (job_id, duplicate)"""
+        return self.insert_jobs(kind, [(recipient, payload, dedupe_key)])[0]
+
+    def enqueue_batch(self, kind, jobs):
+        """Store (recipient, payload, dedupe_key) jobs as one bulk batch; returns (batch_id, [(job_id, duplicate)])
+
+        batch_id is None when every job was a duplicate.
+        """
+        batch_id = uuid.uuid4().hex
+        results = self.insert_jobs(kind, jobs, batch_id)
+        return (batch_id if any(not duplicate for _, duplicate in results) else None), results
+
+    def insert_jobs(self, kind, jobs, batch_id=None):
+        """Insert jobs in one transaction, skipping any whose dedupe key is in the sent log"""
+        now = time.time()
+        results = []
+        hits = 0
+        conn = self.connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for recipient, payload, dedupe_key in jobs:
+                if dedupe_key:
+                    row = conn.execute(
+                        'SELECT job_id FROM email_sent_log WHERE dedupe_key = ? AND expires_at > ?', (dedupe_key, now)
+                    ).fetchone()
+                    if row is not None:
+                        results.append((row['job_id'], True))
+                        hits += 1
+                        continue
+                job_id = uuid.uuid4().hex
+                conn.execute(
+                    'INSERT INTO email_job (id, kind, recipient, payload, status, max_attempts, next_attempt_at, '
+                    'created_at, updated_at, batch_id, dedupe_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (job_id, kind, recipient, json.dumps(payload), 'queued', self.max_attempts, now, now, now,
+                     batch_id, dedupe_key)
+                )
+                if dedupe_key:
+                    # Claimed now so requests repeated before the send are caught too
+                    conn.execute('INSERT OR REPLACE INTO email_sent_log (dedupe_key, job_id, expires_at) VALUES (?, ?, ?)',
+                                 (dedupe_key, job_id, now + self.dedupe_ttl))
+                results.append((job_id, False))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+        if hits:
+            with self.counter_lock:
+                self.dedupe_hits += hits
+        if hits < len(results):
+            with self.wakeup:
+                self.wakeup.notify_all()
+        return results
+
+    def get_batch(self, batch_id):
+        rows = self.connection().execute(
+            'SELECT * FROM email_job WHERE batch_id = ? ORDER BY rowid', (batch_id,)
+        ).fetchall()
+        return [serialize_job(row) for row in rows]
+
+    def get(self, job_id):
+        row = self.connection().execute('SELECT * FROM email_job WHERE id = ?', (job_id,)).fetchone()
+        return serialize_job(row) if row else None
+
+    def retry(self, job_id):
+        """Put a dead job back in the queue with a fresh set of attempts"""
+        now = time.time()
+        updated = self.connection().execute(
+            "UPDATE email_job SET status = 'queued', attempts = 0, next_attempt_at = ?, updated_at = ? "
+            "WHERE id = ? AND status = 'dead'",
+            (now, now, job_id)
+        ).rowcount
+        if updated:
+            # Take the dedupe key back unless a newer job has claimed it meanwhile
+            self.connection().execute(
+                'INSERT OR IGNORE INTO email_sent_log (dedupe_key, job_id, expires_at) '
+                'SELECT dedupe_key, id, ? FROM email_job WHERE id = ? AND dedupe_key IS NOT NULL',
+                (now + self.dedupe_ttl, job_id)
+            )
+            with self.wakeup:
+                self.wakeup.notify()
+        return bool(updated)
+
+    def stats(self):
+        conn = self.connection()
+        counts = dict(conn.execute('SELECT status, COUNT(*) FROM email_job GROUP BY status').fetchall())
+        oldest = conn.execute("SELECT MIN(created_at) FROM email_job WHERE status = 'queued'").fetchone()[0]
+        return {
+            'queued': counts.get('queued', 0),
+            'sending': counts.get('sending', 0),
+            'sent': counts.get('sent', 0),
+            'dead': counts.get('dead', 0),
+            'oldest_queued_seconds': round(time.time() - oldest, 3) if oldest else 0,
+            'workers': sum(1 for thread in self.threads if thread.is_alive()),
+            'bulk_rate_limit': self.bulk_limiter.rate,
+            'dedupe_hits': self.dedupe_hits
+        }
+
+    def claim(self):
+        """Take the next due job, single sends first; bulk sends only while the rate limit allows"""
+        job = self.claim_next(bulk=False)
+        if job is None and self.bulk_limiter.try_acquire():
+            job = self.claim_next(bulk=True)
+            if job is None:
+                self.bulk_limiter.refund()
+        return job
+
+    def claim_next(self, bulk):
+        """BEGIN IMMEDIATE holds the write lock so two workers never claim the same job"""
+        conn = self.connection()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                "SELECT id FROM email_job WHERE status = 'queued' AND next_attempt_at <= ? "
+                f"AND batch_id IS {'NOT ' if bulk else ''}NULL ORDER BY next_attempt_at LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE email_job SET status = 'sending', attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (now, row['id'])
+                )
+                row = conn.execute('SELECT * FROM email_job WHERE id = ?', (row['id'],)).fetchone()
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return serialize_job(row, include_payload=True) if row else None
+
+    def complete(self, job):
+        now = time.time()
+        conn = self.connection()
+        conn.execute(
+            "UPDATE email_job SET status = 'sent', last_error = NULL, updated_at = ? WHERE id = ?",
+            (now, job['id'])
+        )
+        if job['dedupe_key']:
+            # The TTL runs from the send
+            conn.execute('UPDATE email_sent_log SET expires_at = ? WHERE dedupe_key = ? AND job_id = ?',
+                         (now + self.dedupe_ttl, job['dedupe_key'], job['id']))
+
+    def fail(self, job, error):
+        now = time.time()
+        if job['attempts'] >= job['max_attempts'] or isinstance(error, self.permanent_errors):
+            status, next_attempt_at = 'dead', now
+            logger.error(f"Email job {job['id']} ({job['kind']} to {job['recipient']}) is dead after "
+                         f"{job['attempts']} attempts: {error}")
+        else:
+            delay = min(self.backoff_max, self.backoff_base * 2 ** (job['attempts'] - 1))
+            status, next_attempt_at = 'queued', now + delay * random.uniform(0.8, 1.2)
+            logger.warning(f"Email job {job['id']} attempt {job['attempts']} failed, retrying in {delay:.1f}s: {error}")
+        conn = self.connection()
+        conn.execute(
+            'UPDATE email_job SET status = ?, next_attempt_at = ?, last_error = ?, updated_at = ? WHERE id = ?',
+            (status, next_attempt_at, str(error), now, job['id'])
+        )
+        if status == 'dead':
+            # Nothing was sent, so a later request for the same email should go out
+            conn.execute('DELETE FROM email_sent_log WHERE job_id = ?', (job['id'],))
+
+    def purge_sent(self):
+        """Drop sent jobs past the retention window and expired dedupe keys, at most once an hour"""
+        now = time.time()
+        if now - self.last_purge < 3600:
+            return
+        self.last_purge = now
+        self.connection().execute(
+            "DELETE FROM email_job WHERE status = 'sent' AND updated_at < ?", (now - self.sent_retention,)
+        )
+        self.connection().execute('DELETE FROM email_sent_log WHERE expires_at < ?', (now,))
+
+    def work(self):
+        while not self.stop_event.is_set():
+            try:
+                job = self.claim()
+            except sqlite3.Error as e:
+                logger.error(f"Email queue unavailable: {e}")
+                self.stop_event.wait(self.poll_interval)
+                continue
+
+            if job is None:
+                self.purge_sent()
+                with self.wakeup:
+                    # Wake when the rate limit frees a token rather than a full poll later
+                    self.wakeup.wait(min(self.poll_interval, self.bulk_limiter.wait_time() or self.poll_interval))
+                continue
+
+            try:
+                self.handler(job)
+            except Exception as e:
+                self.fail(job, e)
+            else:
+                self.complete(job)
+
+    def start(self):
+        # Jobs a previous process was sending when it stopped go back in the queue
+        self.connection().execute("UPDATE email_job SET status = 'queued' WHERE status = 'sending'")
+        self.stop_event.clear()
+        self.threads = [
+            threading.Thread(target=self.work, name=f'email-worker-{index}', daemon=True)
+            for index in range(self.workers)
+        ]
+        for thread in self.threads:
+            thread.start()
+        logger.info(f"Email queue started with {self.workers} workers")
+
+    def stop(self, timeout=10):
+        self.stop_event.set()
+        with self.wakeup:
+            self.wakeup.notify_all()
+        for thread in self.threads:
+            thread.join(timeout=timeout)
+
+
+def serialize_job(row, include_payload=False):
+    job = {
+        'id': row['id'],
+        'kind': row['kind'],
+        'recipient': row['recipient'],
+        'status': row['status'],
+        'attempts': row['attempts'],
+        'max_attempts': row['max_attempts'],
+        'next_attempt_at': datetime.utcfromtimestamp(row['next_attempt_at']).isoformat(),
+        'last_error': row['last_error'],
+        'created_at': datetime.utcfromtimestamp(row['created_at']).isoformat(),
+        'updated_at': datetime.utcfromtimestamp(row['updated_at']).isoformat(),
+        'batch_id': row['batch_id'],
+        'dedupe_key': row['dedupe_key']
+    }
+    if include_payload:
+        job['payload'] = json.loads(row['payload'])
+    return job
@@ -0,0 +1,119 @@
+import logging
+import os
+from datetime import datetime
+from functools import lru_cache
+
+from jinja2 import ChainableUndefined, Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+from markupsafe import Markup
+
+logger = logging.getLogger(__name__)
+
+SUBJECT_SUFFIX = '.subject.txt'
+STYLES_TEMPLATE = 'styles.css'
+
+
+class EmailEnvironment(Environment):
+    """Jinja2 environment trimmed for rendering many small emails.
+
+    Jinja keeps each template's globals as a ChainMap over the environment's,
+    which every render walks again to build its context; here they are one
+    flat dict. Email data is plain JSON, so `user.name` tries the dict key
+    before falling back to attribute lookup.
+    """
+
+    def make_globals(self, d):
+        # Globals are all registered before the first template loads, so a copy stays current
+        return {**self.globals, **(d or {})}
+
+    def getattr(self, obj, attribute):
+        if type(obj) is dict:
+            try:
+                return obj[attribute]
+            except KeyError:
+                pass
+        return super().getattr(obj, attribute)
+
+
+class EmailTemplates:
+    """Jinja2 email templates, compiled once when the service starts.
+
+    Every `<kind>.subject.txt` in the template directory defines an email type,
+    rendered from `<kind>.html` and, if present, `<kind>.txt`. Adding an email
+    type only takes new template files. Compiled templates are kept in memory
+    and written to a bytecode cache, so a restart loads them without parsing.
+    The inline CSS in `styles.css` is rendered once per colour pair at startup.
+    """
+
+    def __init__(self, template_dir, cache_dir=None):
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        self.env = EmailEnvironment(
+            loader=FileSystemLoader(template_dir),
+            autoescape=select_autoescape(['html']),
+            bytecode_cache=FileSystemBytecodeCache(cache_dir) if cache_dir else FileSystemBytecodeCache(),
+            auto_reload=False,  # templates are fixed for the life of the process; skip mtime checks
+            cache_size=-1,
+            trim_blocks=True,
+            lstrip_blocks=True,
+            undefined=ChainableUndefined  # `user.name | default(...)` works when user itself is missing
+        )
+        self.env.filters['email_datetime'] = email_datetime
+        self.env.filters['email_time'] = email_time
+        self.styles_template = self.env.get_template(STYLES_TEMPLATE)
+        self.styles = {}  # {(accent_color, details_color): Markup}
+        self.env.globals['email_styles'] = self.email_styles
+
+        self.kinds = {}
+        names = set(self.env.list_templates())
+        for name in sorted(names):
+            if not name.endswith(SUBJECT_SUFFIX):
+                continue
+            kind = name[:-len(SUBJECT_SUFFIX)]
+            if f'{kind}.html' not in names:
+                raise ValueError(f'Email template {kind} has a subject but no {kind}.html')
+            self.kinds[kind] = (
+                self.env.get_template(name),
+                self.env.get_template(f'{kind}.html'),
+                self.env.get_template(f'{kind}.txt') if f'{kind}.txt' in names else None
+            )
+        for kind in self.kinds:
+            self.render(kind, {})  # builds each colour pair's CSS now rather than on the first send
+        logger.info(f"Loaded email templates: {', '.join(self.kinds)}")
+
+    def email_styles(self, accent_color, details_color):
+        key = (accent_color, details_color)
+        css = self.styles.get(key)
+        if css is None:
+            css = self.styles[key] = Markup(self.styles_template.render(accent_color=accent_color,
+                                                                        details_color=details_color))
+        return css
+
+    def __contains__(self, kind):
+        return kind in self.kinds
+
+    def render(self, kind, data):
+        """Render (subject, html_content, text_content) for an email type"""
+        subject_template, html_template, text_template = self.kinds[kind]
+        subject = ' '.join(subject_template.render(data).split())
+        html_content = html_template.render(data)
+        text_content = text_template.render(data) if text_template else None
+        return subject, html_content, text_content
+
+
+@lru_cache(maxsize=4096)
+def format_iso(value, fmt):
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).strftime(fmt)
+
+
+def email_datetime(value, fmt='%B %d, %Y at %I:%M %p'):
+    """Format an ISO timestamp for an email; values that don't parse are shown as given"""
+    if not isinstance(value, str):
+        return value
+    try:
+        return format_iso(value, fmt)
+    except ValueError:
+        return value
+
+
+def email_time(value):
+    return email_datetime(value, '%I:%M %p')
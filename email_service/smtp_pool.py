@@ -0,0 +1,146 @@
+import logging
+import queue
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Errors about one message; the connection itself is still usable afterwards
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError)
+
+
+class PooledConnection:
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.messages_sent = 0
+        self.last_used = time.monotonic()
+
+
+class SMTPConnectionPool:
+    """A bounded pool of connected, authenticated SMTP sessions.
+
+    Connections are opened lazily up to `size`. A connection idle for longer
+    than `health_check_interval` seconds is checked with NOOP before reuse and
+    replaced if the server has dropped it. After `max_messages` sends a
+    connection is closed so the next checkout opens a fresh one.
+    """
+
+    def __init__(self, host, port, username=None, password=None, use_tls=True,
+                 size=4, max_messages=100, health_check_interval=30, timeout=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.size = size
+        self.max_messages = max_messages
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        self.stats = {'connections_opened': 0, 'connections_recycled': 0, 'connections_dropped': 0,
+                      'health_checks': 0, 'messages_sent': 0}
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.stats[name] += amount
+
+    def open_connection(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                smtp.starttls()
+            if self.username and self.password:
+                smtp.login(self.username, self.password)
+        except Exception:
+            close_quietly(smtp)
+            raise
+        self.count('connections_opened')
+        return PooledConnection(smtp)
+
+    def is_healthy(self, conn):
+        if time.monotonic() - conn.last_used < self.health_check_interval:
+            return True
+        self.count('health_checks')
+        try:
+            return conn.smtp.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def checkout(self):
+        while True:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                return self.open_connection()
+            if self.is_healthy(conn):
+                return conn
+            self.count('connections_dropped')
+            close_quietly(conn.smtp)
+
+    def checkin(self, conn):
+        conn.last_used = time.monotonic()
+        if conn.messages_sent >= self.max_messages:
+            self.count('connections_recycled')
+            close_quietly(conn.smtp)
+        else:
+            self.idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; broken connections are discarded instead of returned"""
+        if not self.slots.acquire(timeout=self.timeout):
+            raise TimeoutError('Timed out waiting for a free SMTP connection')
+        conn = None
+        try:
+            conn = self.checkout()
+            yield conn.smtp
+            conn.messages_sent += 1
+            self.count('messages_sent')
+        except MESSAGE_ERRORS:
+            if conn is not None:
+                try:
+                    conn.smtp.rset()
+                except (smtplib.SMTPException, OSError):
+                    close_quietly(conn.smtp)
+                    conn = None
+            raise
+        except BaseException:
+            if conn is not None:
+                self.count('connections_dropped')
+                close_quietly(conn.smtp)
+                conn = None
+            raise
+        finally:
+            if conn is not None:
+                self.checkin(conn)
+            self.slots.release()
+
+    def close(self):
+        while True:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                return
+            close_quietly(conn.smtp)
+
+    def snapshot(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats['idle_connections'] = self.idle.qsize()
+        stats['pool_size'] = self.size
+        return stats
+
+
+def close_quietly(smtp):
+    try:
+        smtp.quit()
+    except (smtplib.SMTPException, OSError):
+        try:
+            smtp.close()
+        except OSError:
+            pass
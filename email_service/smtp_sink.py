@@ -0,0 +1,164 @@
+"""
+Local SMTP stand-in for benchmarks and offline testing.
+
+Speaks enough SMTP for smtplib (EHLO/HELO, AUTH PLAIN, MAIL, RCPT, DATA, RSET,
+NOOP, QUIT) and keeps every accepted message in memory. `connect_latency` is
+slept before the greeting to stand in for the TCP + STARTTLS + AUTH cost of a
+real provider; `message_latency` is slept before each DATA is accepted.
+
+Failures can be injected per message, either at random rates or forced for the
+next few messages with fail_next():
+  * transient  - DATA is answered 451, which the email queue retries
+  * permanent  - RCPT is answered 550, which dead-letters the job
+  * disconnect - the connection is dropped at MAIL without a reply
+
+Usage:
+    sink = SMTPSink(connect_latency=0.05, transient_failure_rate=0.1, seed=1)
+    sink.start()
+    ... point SMTP_SERVER / SMTP_PORT at 127.0.0.1:sink.port ...
+    sink.stop()
+"""
+
+import random
+import socketserver
+import threading
+import time
+from collections import Counter, deque
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        sink = self.server.sink
+        with sink.lock:
+            sink.connections += 1
+        time.sleep(sink.connect_latency)
+        self.reply('220 sink ESMTP ready')
+
+        mail_from = None
+        rcpt_tos = []
+        outcome = 'ok'
+        for raw in self.rfile:
+            line = raw.decode(errors='replace').rstrip('\r\n')
+            command = line[:4].upper()
+
+            if command == 'EHLO':
+                self.reply('250-sink')
+                self.reply('250-AUTH PLAIN')
+                self.reply('250 8BITMIME')
+            elif command == 'HELO':
+                self.reply('250 sink')
+            elif command == 'AUTH':
+                self.reply('235 2.7.0 Authentication successful')
+            elif command == 'MAIL':
+                outcome = sink.next_outcome()
+                if outcome == 'disconnect':
+                    return
+                mail_from = line[10:].strip()
+                rcpt_tos = []
+                self.reply('250 OK')
+            elif command == 'RCPT':
+                if outcome == 'permanent':
+                    self.reply('550 5.1.1 Mailbox unavailable')
+                    continue
+                rcpt_tos.append(line[8:].strip())
+                self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                lines = []
+                for data_line in self.rfile:
+                    if data_line in (b'.\r\n', b'.\n'):
+                        break
+                    lines.append(data_line)
+                time.sleep(sink.message_latency)
+                if outcome == 'transient':
+                    self.reply('451 4.3.0 Temporary failure, try again later')
+                    continue
+                with sink.lock:
+                    sink.messages.append((mail_from, rcpt_tos, b''.join(lines)))
+                self.reply('250 OK queued')
+            elif command == 'RSET':
+                mail_from, rcpt_tos, outcome = None, [], 'ok'
+                self.reply('250 OK')
+            elif command == 'NOOP':
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            elif command == 'STAR':
+                self.reply('454 TLS not available')
+            else:
+                self.reply('500 Command not recognized')
+
+
+class SMTPSinkServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPSink:
+    def __init__(self, host='127.0.0.1', port=0, connect_latency=0.0, message_latency=0.0,
+                 transient_failure_rate=0.0, permanent_failure_rate=0.0, disconnect_rate=0.0, seed=None):
+        self.connect_latency = connect_latency
+        self.message_latency = message_latency
+        self.transient_failure_rate = transient_failure_rate
+        self.permanent_failure_rate = permanent_failure_rate
+        self.disconnect_rate = disconnect_rate
+        self.random = random.Random(seed)
+        self.forced = deque()
+        self.failures = Counter()  # outcome -> count of injected failures
+        self.messages = []  # [(mail_from, rcpt_tos, raw message bytes)]
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.server = SMTPSinkServer((host, port), SMTPSinkHandler)
+        self.server.sink = self
+        self.thread = None
+
+    @property
+    def host(self):
+        return self.server.server_address[0]
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='smtp-sink', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def fail_next(self, count=1, outcome='transient'):
+        """Force the next `count` messages to fail with `outcome`, ahead of the random rates"""
+        with self.lock:
+            self.forced.extend([outcome] * count)
+
+    def next_outcome(self):
+        with self.lock:
+            if self.forced:
+                outcome = self.forced.popleft()
+            else:
+                roll = self.random.random()
+                if roll < self.disconnect_rate:
+                    outcome = 'disconnect'
+                elif roll < self.disconnect_rate + self.permanent_failure_rate:
+                    outcome = 'permanent'
+                elif roll < self.disconnect_rate + self.permanent_failure_rate + self.transient_failure_rate:
+                    outcome = 'transient'
+                else:
+                    outcome = 'ok'
+            if outcome != 'ok':
+                self.failures[outcome] += 1
+        return outcome
+
+    def reset(self):
+        with self.lock:
+            self.messages.clear()
+            self.connections = 0
+            self.forced.clear()
+            self.failures.clear()
@@ -0,0 +1,84 @@
+"""
+Boots the email service in-process against a local SMTP sink.
+
+The service reads its configuration when app.py is imported, so the sink is
+started and the environment set before the import. Retries are shortened so
+failure paths finish in well under a second.
+"""
+
+import itertools
+import os
+import sys
+import tempfile
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from smtp_sink import SMTPSink  # noqa: E402
+
+SINK = SMTPSink().start()
+WORK_DIR = tempfile.mkdtemp()
+os.environ.update({
+    'SMTP_SERVER': SINK.host,
+    'SMTP_PORT': str(SINK.port),
+    'SMTP_USE_TLS': 'false',
+    'EMAIL_PASSWORD': '',
+    'SMTP_POOL_SIZE': '2',
+    'EMAIL_QUEUE_PATH': os.path.join(WORK_DIR, 'email_queue.db'),
+    'EMAIL_QUEUE_AUTOSTART': 'false',
+    'EMAIL_TEMPLATE_CACHE_DIR': os.path.join(WORK_DIR, 'templates'),
+    'EMAIL_WORKERS': '2',
+    'EMAIL_MAX_ATTEMPTS': '3',
+    'EMAIL_RETRY_BACKOFF': '0.05',
+    'EMAIL_RETRY_MAX_BACKOFF': '0.2',
+    'EMAIL_BULK_RATE_LIMIT': '0',
+})
+
+import app as email_app  # noqa: E402
+
+booking_ids = itertools.count(1000)
+
+
+@pytest.fixture(scope='session', autouse=True)
+def email_queue():
+    email_app.email_queue.poll_interval = 0.05
+    email_app.email_queue.start()
+    yield email_app.email_queue
+    email_app.email_queue.stop()
+    email_app.email_service.pool.close()
+    SINK.stop()
+
+
+@pytest.fixture
+def sink():
+    SINK.reset()
+    yield SINK
+
+
+@pytest.fixture
+def client():
+    return email_app.app.test_client()
+
+
+@pytest.fixture
+def booking():
+    """Booking email data with a booking id no other test has used, so deduplication does not interfere"""
+    booking_id = next(booking_ids)
+    return {
+        'booking_id': booking_id,
+        'user': {'id': 1, 'email': f'user{booking_id}@example.com', 'name': 'John Doe'},
+        'session': {'id': 1, 'title': 'Morning Meditation', 'session_type': 'session',
+                    'start_time': '2030-01-15T09:00:00', 'end_time': '2030-01-15T10:00:00', 'price': 25.0},
+        'facilitator': {'id': 1, 'email': 'facilitator@example.com', 'name': 'Jane Smith'},
+    }
+
+
+def wait_for_job(client, job_id, timeout=5):
+    """Poll a job until it is sent or dead"""
+    deadline = time.monotonic() + timeout
+    while True:
+        job = client.get(f'/jobs/{job_id}').get_json()
+        if job['status'] in ('sent', 'dead') or time.monotonic() > deadline:
+            return job
+        time.sleep(0.02)
@@ -0,0 +1,168 @@
+import email
+import json
+
+import app as email_app
+from conftest import wait_for_job
+
+
+def delivered_subjects(sink):
+    return {tuple(rcpt_tos): email.message_from_bytes(raw)['Subject'] for _, rcpt_tos, raw in sink.messages}
+
+
+def test_booking_emails_are_queued_and_delivered(client, sink, booking):
+    response = client.post('/send-booking-emails', json=booking)
+
+    assert response.status_code == 202
+    jobs = response.get_json()['jobs']
+    assert [wait_for_job(client, job_id)['status'] for job_id in jobs.values()] == ['sent', 'sent']
+    assert delivered_subjects(sink) == {
+        (f"<{booking['user']['email']}>",): 'Booking Confirmation - Morning Meditation',
+        ('<facilitator@example.com>',): 'New Booking - Morning Meditation',
+    }
+
+
+def test_missing_fields_are_rejected(client, booking):
+    del booking['session']
+
+    response = client.post('/send-booking-emails', json=booking)
+
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Missing required field: session'
+
+
+def test_transient_failures_are_retried(client, sink, booking):
+    sink.fail_next(2, 'transient')
+
+    job_id = client.post('/send-booking-confirmation', json=booking).get_json()['job_id']
+    job = wait_for_job(client, job_id)
+
+    assert job['status'] == 'sent'
+    assert job['attempts'] == 3
+    assert len(sink.messages) == 1
+
+
+def test_exhausted_retries_are_dead_lettered_and_can_be_retried(client, sink, booking):
+    sink.fail_next(3, 'transient')
+
+    job_id = client.post('/send-booking-confirmation', json=booking).get_json()['job_id']
+    job = wait_for_job(client, job_id)
+
+    assert job['status'] == 'dead'
+    assert job['attempts'] == 3
+    assert '451' in job['last_error']
+
+    assert client.post(f'/jobs/{job_id}/retry').status_code == 202
+    assert wait_for_job(client, job_id)['status'] == 'sent'
+
+
+def test_refused_recipient_is_not_retried(client, sink, booking):
+    sink.fail_next(1, 'permanent')
+
+    job_id = client.post('/send-booking-confirmation', json=booking).get_json()['job_id']
+    job = wait_for_job(client, job_id)
+
+    assert job['status'] == 'dead'
+    assert job['attempts'] == 1
+    assert sink.messages == []
+
+
+def test_dropped_connection_is_resent_on_a_fresh_one(client, sink, booking):
+    sink.fail_next(1, 'disconnect')
+
+    job_id = client.post('/send-booking-confirmation', json=booking).get_json()['job_id']
+    job = wait_for_job(client, job_id)
+
+    assert job['status'] == 'sent'
+    assert job['attempts'] == 1
+    assert len(sink.messages) == 1
+
+
+def test_repeated_booking_request_is_sent_once(client, sink, booking):
+    first = client.post('/send-booking-emails', json=booking).get_json()
+    second = client.post('/send-booking-emails', json=booking).get_json()
+
+    assert second['jobs'] == first['jobs']
+    assert second['duplicates'] == ['user_email', 'facilitator_email']
+    for job_id in first['jobs'].values():
+        wait_for_job(client, job_id)
+    assert len(sink.messages) == 2
+
+
+def test_bulk_send_reports_each_recipient(client, sink, booking):
+    response = client.post('/send-bulk', json={
+        'template': 'session_cancellation',
+        'data': {'session': booking['session'], 'reason': 'Venue unavailable'},
+        'recipients': [
+            {'email': 'a@example.com', 'data': {'user': {'name': 'Ann'}}},
+            'b@example.com',
+            'not-an-address',
+            'A@example.com',
+        ],
+    })
+
+    assert response.status_code == 202
+    body = response.get_json()
+    assert [result['status'] for result in body['results']] == ['queued', 'queued', 'rejected', 'rejected']
+    assert body['queued'] == 2
+
+    for result in body['results'][:2]:
+        assert wait_for_job(client, result['job_id'])['status'] == 'sent'
+    batch = client.get(f"/bulk/{body['batch_id']}").get_json()
+    assert batch['sent'] == 2
+    assert b'Hello Ann' in next(raw for _, rcpt_tos, raw in sink.messages if rcpt_tos == ['<a@example.com>'])
+
+
+def test_pooled_connections_are_reused(client, sink, booking):
+    job_ids = []
+    for index in range(20):
+        job_ids.append(client.post('/send-email', json={
+            'template': 'announcement', 'to': f'reader{index}@example.com',
+            'data': {'subject': 'Studio news', 'message': 'Hello'},
+        }).get_json()['job_id'])
+
+    assert all(wait_for_job(client, job_id)['status'] == 'sent' for job_id in job_ids)
+    assert len(sink.messages) == 20
+    # Connections opened by earlier tests may still be idle in the pool
+    assert sink.connections <= 2
+
+
+def test_trace_continues_from_request_to_smtp(client, sink, booking, tmp_path, monkeypatch):
+    monkeypatch.setattr(email_app.tracer, 'path', str(tmp_path / 'traces.jsonl'))
+    monkeypatch.setattr(email_app.tracer, 'file', None)
+
+    response = client.post('/send-booking-emails', json=booking,
+                           headers={'X-Trace-Id': 'trace-1', 'X-Parent-Span-Id': 'backend-span'})
+    for job_id in response.get_json()['jobs'].values():
+        wait_for_job(client, job_id)
+    email_app.tracer.file.close()
+
+    spans = [json.loads(line) for line in (tmp_path / 'traces.jsonl').read_text().splitlines()]
+    assert {span['trace_id'] for span in spans} == {'trace-1'}
+    by_id = {span['span_id']: span for span in spans}
+    names = sorted(span['name'] for span in spans)
+    assert names == ['email_queue_wait'] * 2 + ['queue_booking_emails'] + ['render_email'] * 2 + \
+        ['send_email'] * 2 + ['smtp_send'] * 2
+    for span in spans:
+        if span['name'] == 'queue_booking_emails':
+            assert span['parent_id'] == 'backend-span'
+        if span['name'] == 'smtp_send':
+            assert by_id[span['parent_id']]['name'] == 'send_email'
+            assert by_id[by_id[span['parent_id']]['parent_id']]['name'] == 'queue_booking_emails'
+
+
+def test_reminder_for_a_moved_session_is_not_a_duplicate(client, sink, booking):
+    def remind(start_time):
+        return client.post('/send-bulk', json={
+            'template': 'session_reminder',
+            'data': {'session': {**booking['session'], 'start_time': start_time}},
+            'recipients': [{'email': booking['user']['email'],
+                            'data': {'booking_id': booking['booking_id'], 'reminder_key': start_time}}],
+        }).get_json()['results'][0]
+
+    first = remind('2030-01-15T09:00:00')
+    repeat = remind('2030-01-15T09:00:00')
+    moved = remind('2030-01-16T09:00:00')
+
+    assert [first['status'], repeat['status'], moved['status']] == ['queued', 'duplicate', 'queued']
+    assert repeat['job_id'] == first['job_id']
+    assert moved['job_id'] != first['job_id']
@@ -8,15 +8,21 @@ import { Bell, X, Check } from "lucide-react"
 import { io, type Socket } from "socket.io-client"
 import { API_CONFIG } from "../config/api"
 
+interface NotificationUser {
+  id: number
+  name: string
+  email: string
+}
+
 interface Notification {
   notification_id?: number
   type: string
   booking_id: number
-  user: {
-    id: number
-    name: string
-    email: string
-  }
+  user: NotificationUser
+  // Present on "booking_digest" notifications that merge a burst of bookings
+  booking_ids?: number[]
+  users?: NotificationUser[]
+  count?: number
   session: {
     id: number
     title: string
@@ -27,6 +33,20 @@ interface Notification {
   stored_at?: string
 }
 
+// Compact frame: ids only, with user/session metadata the first time this socket sees them
+interface CompactNotification {
+  t: "b" | "d"
+  b: number | number[]
+  u: number | number[]
+  s: number
+  ts: number
+  um?: [number, string, string][]
+  sm?: [number, string, string][]
+}
+
+// Keeps last_seen fresh while connected; the server writes the latest heartbeat on its next presence flush
+const HEARTBEAT_INTERVAL_MS = 30000
+
 const NotificationSystem: React.FC = () => {
   const { user, token } = useAuth()
   const [notifications, setNotifications] = useState<Notification[]>([])
@@ -34,6 +54,14 @@ const NotificationSystem: React.FC = () => {
   const [showNotifications, setShowNotifications] = useState(false)
   const [connected, setConnected] = useState(false)
   const socketRef = useRef<Socket | null>(null)
+  const heartbeatRef = useRef<ReturnType<typeof setInterval> | null>(null)
+  const userCache = useRef(new Map<number, NotificationUser>())
+  const sessionCache = useRef(new Map<number, Notification["session"]>())
+  const notificationsRef = useRef<Notification[]>([])
+
+  useEffect(() => {
+    notificationsRef.current = notifications
+  }, [notifications])
 
   const playNotificationSound = () => {
     // Create a simple notification sound
@@ -51,6 +79,45 @@ const NotificationSystem: React.FC = () => {
     oscillator.stop(audioContext.currentTime + 0.2)
   }
 
+  const expandCompact = (frame: CompactNotification): Notification => {
+    frame.um?.forEach(([id, name, email]) => userCache.current.set(id, { id, name, email }))
+    frame.sm?.forEach(([id, title, start_time]) => sessionCache.current.set(id, { id, title, start_time }))
+
+    const session = sessionCache.current.get(frame.s)!
+    const bookingIds = Array.isArray(frame.b) ? frame.b : [frame.b]
+    const users = (Array.isArray(frame.u) ? frame.u : [frame.u]).map((id) => userCache.current.get(id)!)
+    const latest = users[users.length - 1]
+
+    if (frame.t === "d") {
+      return {
+        type: "booking_digest",
+        booking_id: bookingIds[bookingIds.length - 1],
+        booking_ids: bookingIds,
+        user: latest,
+        users,
+        count: bookingIds.length,
+        session,
+        timestamp: new Date(frame.ts).toISOString(),
+        message: `${bookingIds.length} new bookings for ${session.title}`,
+      }
+    }
+    return {
+      type: "new_booking",
+      booking_id: bookingIds[0],
+      user: latest,
+      session,
+      timestamp: new Date(frame.ts).toISOString(),
+      message: `New booking from ${latest.name} for ${session.title}`,
+    }
+  }
+
+  const stopHeartbeat = () => {
+    if (heartbeatRef.current) {
+      clearInterval(heartbeatRef.current)
+      heartbeatRef.current = null
+    }
+  }
+
   const initializeWebSocket = useCallback(() => {
     const socket = io(API_CONFIG.NOTIFICATION_URL, {
       transports: ["websocket"],
@@ -60,16 +127,21 @@ const NotificationSystem: React.FC = () => {
 
     socket.on("connect", () => {
       console.log("Connected to notification service")
+      // The server only tracks sent metadata per socket, so start each connection with empty caches
+      userCache.current.clear()
+      sessionCache.current.clear()
       // Authenticate as facilitator
       socket.emit("facilitator_connect", {
         facilitator_id: user?.id, // In production, get facilitator ID from user profile
         token: token,
+        compact: true,
       })
     })
 
     socket.on("disconnect", () => {
       console.log("Disconnected from notification service")
       setConnected(false)
+      stopHeartbeat()
     })
 
     socket.on("facilitator_auth_success", (data) => {
@@ -77,6 +149,13 @@ const NotificationSystem: React.FC = () => {
       setConnected(true)
       toast.success("Connected to real-time notifications")
 
+      stopHeartbeat()
+      heartbeatRef.current = setInterval(() => {
+        socket.emit("facilitator_heartbeat", {
+          facilitator_id: user?.id,
+        })
+      }, HEARTBEAT_INTERVAL_MS)
+
       // Request pending notifications
       socket.emit("get_pending_notifications", {
         facilitator_id: user?.id,
@@ -88,27 +167,49 @@ const NotificationSystem: React.FC = () => {
       toast.error("Failed to connect to notifications")
     })
 
-    socket.on("new_booking_notification", (notification: Notification) => {
+    const handleNewNotification = (notification: Notification) => {
       console.log("New booking notification:", notification)
       setNotifications((prev) => [notification, ...prev])
       setUnreadCount((prev) => prev + 1)
-      toast.success(`New booking: ${notification.user.name}`)
+      toast.success(
+        notification.type === "booking_digest" ? notification.message : `New booking: ${notification.user.name}`,
+      )
 
       // Play notification sound (optional)
       playNotificationSound()
+    }
+
+    // Acknowledge every push: the server counts unacknowledged notifications as backlog
+    socket.on("new_booking_notification", (notification: Notification, ack?: () => void) => {
+      handleNewNotification(notification)
+      ack?.()
+    })
+    socket.on("new_booking_compact", (frame: CompactNotification, ack?: () => void) => {
+      handleNewNotification(expandCompact(frame))
+      ack?.()
+    })
+
+    // We fell behind and some notifications were stored instead of pushed
+    socket.on("notifications_spilled", () => {
+      socket.emit("get_pending_notifications", {
+        facilitator_id: user?.id,
+      })
     })
 
     socket.on("pending_notifications", (data) => {
       console.log("Pending notifications:", data)
       if (data.notifications && data.notifications.length > 0) {
-        setNotifications((prev) => [...data.notifications, ...prev])
-        setUnreadCount((prev) => prev + data.count)
+        // Pending lists repeat unread notifications already shown, so merge by notification_id
+        const known = new Set(notificationsRef.current.map((n) => n.notification_id))
+        const fresh = data.notifications.filter((n: Notification) => !known.has(n.notification_id))
+        setNotifications((prev) => [...fresh, ...prev])
+        setUnreadCount((prev) => prev + fresh.length)
         toast(`You have ${data.count} pending notifications`)
       }
     })
 
-    socket.on("notification_marked_read", (data) => {
-      console.log("Notification marked as read:", data)
+    socket.on("notifications_marked_read", (data) => {
+      console.log("Notifications marked as read:", data)
     })
 
     socket.on("error", (data) => {
@@ -123,6 +224,7 @@ const NotificationSystem: React.FC = () => {
     }
 
     return () => {
+      stopHeartbeat()
       if (socketRef.current) {
         socketRef.current.disconnect()
       }
@@ -131,9 +233,9 @@ const NotificationSystem: React.FC = () => {
 
   const markAsRead = (notification: Notification) => {
     if (notification.notification_id && socketRef.current) {
-      socketRef.current.emit("mark_notification_read", {
+      socketRef.current.emit("mark_notifications_read", {
         facilitator_id: user?.id,
-        notification_id: notification.notification_id,
+        notification_ids: [notification.notification_id],
       })
     }
 
@@ -143,6 +245,17 @@ const NotificationSystem: React.FC = () => {
   }
 
   const clearAllNotifications = () => {
+    // Acknowledge every stored notification in one round trip using the highest id as a watermark
+    const storedIds = notifications
+      .map((n) => n.notification_id)
+      .filter((id): id is number => id !== undefined)
+    if (storedIds.length > 0 && socketRef.current) {
+      socketRef.current.emit("mark_notifications_read", {
+        facilitator_id: user?.id,
+        up_to_id: Math.max(...storedIds),
+      })
+    }
+
     setNotifications([])
     setUnreadCount(0)
   }
@@ -207,9 +320,13 @@ const NotificationSystem: React.FC = () => {
                       </div>
                       <p className="text-sm text-gray-800 mb-2">{notification.message}</p>
                       <div className="text-xs text-gray-500 space-y-1">
-                        <p>
-                          User: {notification.user.name} ({notification.user.email})
-                        </p>
+                        {notification.users ? (
+                          <p>Participants: {notification.users.map((u) => u.name).join(", ")}</p>
+                        ) : (
+                          <p>
+                            User: {notification.user.name} ({notification.user.email})
+                          </p>
+                        )}
                         <p>Session: {notification.session.title}</p>
                         <p>Time: {formatTime(notification.timestamp)}</p>
                       </div>
@@ -1,12 +1,20 @@
 "use client"
 
 import type React from "react"
-import { useState, useEffect } from "react"
+import { useState, useEffect, useRef } from "react"
 import axios from "axios"
+import { io, type Socket } from "socket.io-client"
 import { toast } from "react-hot-toast"
 import { Calendar, Users, DollarSign } from "lucide-react"
 import { buildApiUrl, API_CONFIG } from "../config/api"
 
+interface SessionAvailability {
+  session_id: number
+  available_spots: number
+  capacity: number | null
+  status: string
+}
+
 interface Session {
   id: number
   title: string
@@ -24,11 +32,60 @@ const Sessions: React.FC = () => {
   const [sessions, setSessions] = useState<Session[]>([])
   const [loading, setLoading] = useState(true)
   const [bookingLoading, setBookingLoading] = useState<number | null>(null)
+  const socketRef = useRef<Socket | null>(null)
 
   useEffect(() => {
     fetchSessions()
   }, [])
 
+  // Live seat availability pushed by the notification service instead of re-fetching the catalog
+  useEffect(() => {
+    const socket = io(API_CONFIG.NOTIFICATION_URL, {
+      transports: ["websocket"],
+    })
+    socketRef.current = socket
+
+    socket.on("session_availability", (update: SessionAvailability) => {
+      setSessions((prev) =>
+        update.status === "cancelled"
+          ? prev.filter((s) => s.id !== update.session_id)
+          : prev.map((s) =>
+              s.id === update.session_id
+                ? { ...s, available_spots: update.available_spots, capacity: update.capacity ?? s.capacity }
+                : s,
+            ),
+      )
+    })
+
+    return () => {
+      socket.disconnect()
+      socketRef.current = null
+    }
+  }, [])
+
+  const sessionIds = sessions.map((s) => s.id).join(",")
+
+  useEffect(() => {
+    const socket = socketRef.current
+    if (!socket || !sessionIds) {
+      return
+    }
+
+    const ids = sessionIds.split(",").map(Number)
+    const subscribe = () => socket.emit("subscribe_availability", { session_ids: ids })
+
+    // Rooms are lost on reconnect, so subscribe again whenever the socket (re)connects
+    if (socket.connected) {
+      subscribe()
+    }
+    socket.on("connect", subscribe)
+
+    return () => {
+      socket.off("connect", subscribe)
+      socket.emit("unsubscribe_availability", { session_ids: ids })
+    }
+  }, [sessionIds])
+
   const fetchSessions = async () => {
     try {
       const response = await axios.get(buildApiUrl(API_CONFIG.ENDPOINTS.sessions))
@@ -47,7 +104,10 @@ const Sessions: React.FC = () => {
         session_id: sessionId,
       })
       toast.success("Session booked successfully!")
-      fetchSessions() // Refresh to update available spots
+      // Available spots arrive over the socket; only fall back to a refetch without it
+      if (!socketRef.current?.connected) {
+        fetchSessions()
+      }
     } catch (error: any) {
       toast.error(error.response?.data?.error || "Booking failed")
     } finally {
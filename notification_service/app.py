@@ -1,19 +1,62 @@
-from flask import Flask, request, jsonify
+import os
+
+# Socket.IO async mode: 'threading' (Werkzeug, one thread per connection),
+# 'eventlet' or 'gevent'. Cooperative modes must patch the standard library
+# before anything else is imported.
+SOCKETIO_ASYNC_MODE = os.getenv('SOCKETIO_ASYNC_MODE', 'threading')
+if SOCKETIO_ASYNC_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+elif SOCKETIO_ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+from flask import Flask, Response, request, jsonify
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_sqlalchemy import SQLAlchemy
-from datetime import datetime
+from sqlalchemy import insert, select, text
+from datetime import datetime, timedelta
+from collections import deque
+import atexit
+import functools
+import itertools
 import json
 import logging
-import os
+import sys
+import threading
+import time
+# instrumentation.py is shared from common/ at the repository root; the images copy it to /common
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'common'))
+from instrumentation import Instrumentation, Tracer
+
+try:
+    import msgpack
+except ImportError:  # optional: without it the backend link stays on JSON
+    msgpack = None
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///notifications.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+DEBUG = os.getenv('FLASK_ENV', 'development') != 'production'
+PORT = int(os.getenv('PORT', '5002'))
+# eventlet's WSGI server handles at most 1024 concurrent connections unless told otherwise
+MAX_CONNECTIONS = int(os.getenv('MAX_CONNECTIONS', '20000'))
+
 # Initialize extensions
 db = SQLAlchemy(app)
-socketio = SocketIO(app, cors_allowed_origins="*", logger=True, engineio_logger=True)
+socketio = SocketIO(app, async_mode=SOCKETIO_ASYNC_MODE, cors_allowed_origins="*",
+                    logger=DEBUG, engineio_logger=DEBUG)
+# Created before the handlers below are registered so each one is timed; /metrics is defined further down
+instrumentation = Instrumentation('notification_service', app, db=db, socketio=socketio, metrics_endpoint=False)
+tracer = Tracer('notification_service')
+
+# In cooperative modes blocking database calls run on native worker threads so they
+# never stall the event loop; DB_WORKERS caps how many run at once and should not
+# exceed the SQLAlchemy connection pool.
+DB_WORKERS = int(os.getenv('DB_WORKERS', '10'))
+db_slots = threading.BoundedSemaphore(DB_WORKERS)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -26,6 +69,89 @@ BACKEND_BEARER_TOKEN = os.getenv('BACKEND_SERVICE_TOKEN', 'backend-service-token
 online_facilitators = {}  # {facilitator_id: socket_id}
 backend_socket_id = None
 
+# Sockets that asked for compact frames, with the user and session ids whose
+# metadata each one has already been sent
+compact_sockets = {}  # {socket_id: {'users': set(), 'sessions': set()}}
+
+# Presence changes are buffered here and written to FacilitatorSession in batches.
+# A flush interval of 0 writes through on every event (the old behaviour).
+PRESENCE_FLUSH_INTERVAL = float(os.getenv('PRESENCE_FLUSH_INTERVAL', '5'))
+pending_presence = {}  # {facilitator_id: {'op': 'upsert'|'delete', 'socket_id': ..., 'at': datetime}}
+pending_heartbeats = {}  # {facilitator_id: last_seen}
+presence_lock = threading.Lock()
+
+# Counters behind /stats and /metrics, kept current by the event handlers and
+# reconciled against the database every STATS_RECONCILE_INTERVAL seconds so
+# that scrapes never run SQL.
+STATS_RECONCILE_INTERVAL = float(os.getenv('STATS_RECONCILE_INTERVAL', '60'))
+DELIVERY_RATE_WINDOW = 60  # seconds of real-time deliveries used for deliveries_per_second
+notification_counters = {
+    'total_notifications': 0,
+    'pending_notifications': 0,
+    'facilitator_sessions': 0,
+    'realtime_deliveries': 0,
+    'spilled_notifications': 0,
+    'slow_consumer_disconnects': 0
+}
+recent_deliveries = deque()  # monotonic timestamps of real-time deliveries
+last_reconciled_at = None
+stats_lock = threading.Lock()
+
+# Booking bursts are coalesced per facilitator: the first booking is pushed
+# immediately and opens a window; bookings arriving inside the window are merged
+# into one digest per session when it closes. A window of 0 disables coalescing.
+NOTIFICATION_COALESCE_WINDOW = float(os.getenv('NOTIFICATION_COALESCE_WINDOW', '2'))
+coalesce_windows = {}  # {facilitator_id: seconds} overrides sent with facilitator_connect
+coalesce_buffers = {}  # {facilitator_id: [notification_message, ...]} for open windows
+coalesce_lock = threading.Lock()
+
+# Live seat availability: browsers join per-session rooms and the backend publishes
+# each session's remaining spots after bookings and cancellations. Each room gets at
+# most one frame per AVAILABILITY_THROTTLE seconds, always carrying the latest state.
+# Throttle state is only kept for sessions that someone is subscribed to.
+AVAILABILITY_THROTTLE = float(os.getenv('AVAILABILITY_THROTTLE', '0.25'))
+MAX_AVAILABILITY_SUBSCRIPTIONS = int(os.getenv('MAX_AVAILABILITY_SUBSCRIPTIONS', '200'))
+availability_subscribers = {}  # {session_id: {socket_id, ...}}
+availability_subscriptions = {}  # {socket_id: {session_id, ...}}
+availability_latest = {}  # {session_id: update waiting to be emitted}
+availability_last_emit = {}  # {session_id: monotonic time of the last frame}
+availability_scheduled = set()  # session_ids with a trailing emit pending
+availability_lock = threading.Lock()
+
+# Backpressure: real-time notifications are emitted with an ack and a socket's
+# unacknowledged notifications form its outbound queue. Once MAX_OUTBOUND_QUEUE are
+# outstanding, further notifications spill to StoredNotification; if the oldest has
+# waited longer than SLOW_CONSUMER_TIMEOUT the socket is disconnected and everything
+# it never acknowledged is stored for its next connection.
+MAX_OUTBOUND_QUEUE = int(os.getenv('MAX_OUTBOUND_QUEUE', '100'))
+SLOW_CONSUMER_TIMEOUT = float(os.getenv('SLOW_CONSUMER_TIMEOUT', '30'))
+outbound_queues = {}  # {socket_id: {seq: (monotonic sent time, facilitator_id, notification_message)}}
+outbound_spilled = {}  # {socket_id: notifications stored while its queue was full}
+outbound_seq = itertools.count(1)
+outbound_lock = threading.Lock()
+
+# Retention: delivered notifications older than NOTIFICATION_RETENTION_DAYS are
+# purged (or archived to ArchivedNotification) in batches of RETENTION_BATCH_SIZE,
+# each in its own short transaction. On PostgreSQL, NOTIFICATION_PARTITIONING=monthly
+# creates stored_notification as a range-partitioned table so whole expired months
+# can be dropped instead of deleted row by row.
+NOTIFICATION_RETENTION_DAYS = float(os.getenv('NOTIFICATION_RETENTION_DAYS', '30'))
+RETENTION_INTERVAL = float(os.getenv('RETENTION_INTERVAL', '3600'))
+RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', '1000'))
+RETENTION_BATCH_PAUSE = float(os.getenv('RETENTION_BATCH_PAUSE', '0.1'))
+RETENTION_ARCHIVE = os.getenv('RETENTION_ARCHIVE', 'false').lower() == 'true'
+NOTIFICATION_PARTITIONING = os.getenv('NOTIFICATION_PARTITIONING', 'none')
+PARTITIONS_AHEAD = int(os.getenv('NOTIFICATION_PARTITIONS_AHEAD', '2'))
+retention_report = {
+    'last_run_at': None,
+    'last_run_seconds': 0.0,
+    'last_run_purged': 0,
+    'last_run_partitions_dropped': 0,
+    'purged_total': 0,
+    'purge_rows_per_second': 0.0,
+    'table_bytes': None
+}
+
 # Database Models
 class StoredNotification(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -38,6 +164,26 @@ class StoredNotification(db.Model):
     message_data = db.Column(db.Text, nullable=False)  # JSON string
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     delivered = db.Column(db.Boolean, default=False)
+    
+    __table_args__ = (
+        # Pending lookups per facilitator, and retention scans over old delivered rows
+        db.Index('ix_stored_notification_pending', 'facilitator_id', 'delivered', 'created_at'),
+        db.Index('ix_stored_notification_retention', 'delivered', 'created_at'),
+    )
+
+class ArchivedNotification(db.Model):
+    """Delivered notifications moved out of StoredNotification by the retention job"""
+    id = db.Column(db.Integer, primary_key=True)  # id of the original StoredNotification
+    facilitator_id = db.Column(db.Integer, nullable=False)
+    booking_id = db.Column(db.Integer, nullable=False)
+    user_name = db.Column(db.String(100), nullable=False)
+    user_email = db.Column(db.String(120), nullable=False)
+    session_title = db.Column(db.String(200), nullable=False)
+    session_start_time = db.Column(db.DateTime, nullable=False)
+    message_data = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime)
+    delivered = db.Column(db.Boolean, default=True)
+    archived_at = db.Column(db.DateTime, server_default=db.func.now())
 
 class FacilitatorSession(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -56,6 +202,8 @@ def handle_connect(auth):
 @socketio.on('disconnect')
 def handle_disconnect():
     logger.info(f"Client disconnected: {request.sid}")
+    compact_sockets.pop(request.sid, None)
+    release_availability(request.sid)
     
     # Remove from online facilitators if it was a facilitator
     facilitator_to_remove = None
@@ -68,14 +216,18 @@ def handle_disconnect():
         del online_facilitators[facilitator_to_remove]
         logger.info(f"Facilitator {facilitator_to_remove} went offline")
         
-        # Update database
-        session = FacilitatorSession.query.filter_by(
-            facilitator_id=facilitator_to_remove, 
-            socket_id=request.sid
-        ).first()
-        if session:
-            db.session.delete(session)
-            db.session.commit()
+        # An open coalescing window drops the override when it closes
+        with coalesce_lock:
+            if facilitator_to_remove not in coalesce_buffers:
+                coalesce_windows.pop(facilitator_to_remove, None)
+        
+        # Queue the session row for removal
+        record_presence(facilitator_to_remove, 'delete', request.sid)
+    
+    # Anything pushed but never acknowledged is kept for the next connection
+    unacknowledged = release_outbound(request.sid)
+    if unacknowledged:
+        spill_notifications(unacknowledged)
     
     # Check if it was the backend service
     global backend_socket_id
@@ -110,23 +262,26 @@ def handle_facilitator_connect(data):
     # In production, validate the JWT token here
     # For now, we'll accept any facilitator_id
     
+    if data.get('coalesce_window') is not None:
+        try:
+            coalesce_windows[facilitator_id] = max(0.0, float(data['coalesce_window']))
+        except (TypeError, ValueError):
+            emit('auth_error', {'error': 'coalesce_window must be a number of seconds'})
+            return
+    else:
+        # An override lasts for one connection; a reconnect without it gets the default
+        coalesce_windows.pop(facilitator_id, None)
+    
     # Store facilitator as online
     online_facilitators[facilitator_id] = request.sid
-    join_room(f'facilitator_{facilitator_id}')
-    
-    # Store in database
-    existing_session = FacilitatorSession.query.filter_by(facilitator_id=facilitator_id).first()
-    if existing_session:
-        existing_session.socket_id = request.sid
-        existing_session.last_seen = datetime.utcnow()
+    if data.get('compact'):
+        compact_sockets[request.sid] = {'users': set(), 'sessions': set()}
     else:
-        new_session = FacilitatorSession(
-            facilitator_id=facilitator_id,
-            socket_id=request.sid
-        )
-        db.session.add(new_session)
+        compact_sockets.pop(request.sid, None)
+    join_room(f'facilitator_{facilitator_id}')
     
-    db.session.commit()
+    # Queue the session row for upsert
+    record_presence(facilitator_id, 'upsert', request.sid)
     
     logger.info(f"Facilitator {facilitator_id} connected: {request.sid}")
     emit('facilitator_auth_success', {
@@ -137,6 +292,85 @@ def handle_facilitator_connect(data):
     # Send any pending notifications
     send_pending_notifications(facilitator_id)
 
+@socketio.on('facilitator_heartbeat')
+def handle_facilitator_heartbeat(data):
+    """Refresh a facilitator's last_seen without touching the database"""
+    facilitator_id = data.get('facilitator_id')
+    
+    if facilitator_id not in online_facilitators or online_facilitators[facilitator_id] != request.sid:
+        emit('error', {'error': 'Unauthorized'})
+        return
+    
+    with presence_lock:
+        pending_heartbeats[facilitator_id] = datetime.utcnow()
+
+@socketio.on('subscribe_availability')
+def handle_subscribe_availability(data):
+    """Subscribe a browser to seat-availability updates for a set of sessions"""
+    session_ids = data.get('session_ids')
+    
+    if not isinstance(session_ids, list) or not all(is_id(session_id) for session_id in session_ids):
+        emit('error', {'error': 'session_ids must be a list of integers'})
+        return
+    
+    # A socket follows at most MAX_AVAILABILITY_SUBSCRIPTIONS sessions; the rest are reported as dropped
+    subscribed, dropped = [], []
+    with availability_lock:
+        current = availability_subscriptions.setdefault(request.sid, set())
+        for session_id in dict.fromkeys(session_ids):
+            if session_id not in current and len(current) >= MAX_AVAILABILITY_SUBSCRIPTIONS:
+                dropped.append(session_id)
+                continue
+            current.add(session_id)
+            availability_subscribers.setdefault(session_id, set()).add(request.sid)
+            subscribed.append(session_id)
+    
+    for session_id in subscribed:
+        join_room(f'availability_{session_id}')
+    
+    if dropped:
+        logger.info(f"Socket {request.sid} reached {MAX_AVAILABILITY_SUBSCRIPTIONS} availability "
+                    f"subscriptions, dropped {len(dropped)}")
+    
+    emit('availability_subscribed', {'session_ids': subscribed, 'dropped': dropped})
+
+@socketio.on('unsubscribe_availability')
+def handle_unsubscribe_availability(data):
+    """Stop seat-availability updates for a set of sessions"""
+    session_ids = data.get('session_ids')
+    
+    if not isinstance(session_ids, list) or not all(is_id(session_id) for session_id in session_ids):
+        emit('error', {'error': 'session_ids must be a list of integers'})
+        return
+    
+    for session_id in session_ids:
+        leave_room(f'availability_{session_id}')
+    release_availability(request.sid, session_ids)
+
+@socketio.on('session_availability_update')
+def handle_session_availability_update(data):
+    """Handle a session availability change published by the backend"""
+    if request.sid != backend_socket_id:
+        emit('error', {'error': 'Unauthorized'})
+        return
+    
+    try:
+        data = decode_payload(data)
+    except ValueError as e:
+        emit('notification_error', {'error': str(e)})
+        return
+    
+    if 'session_id' not in data or 'available_spots' not in data:
+        emit('notification_error', {'error': 'session_id and available_spots are required'})
+        return
+    
+    publish_availability({
+        'session_id': data['session_id'],
+        'available_spots': data['available_spots'],
+        'capacity': data.get('capacity'),
+        'status': data.get('status', 'active')
+    })
+
 @socketio.on('booking_notification')
 def handle_booking_notification(data):
     """Handle booking notification from backend"""
@@ -145,6 +379,8 @@ def handle_booking_notification(data):
         return
     
     try:
+        data = decode_payload(data)
+        
         # Validate required fields
         required_fields = ['booking_id', 'user', 'session', 'facilitator_id']
         for field in required_fields:
@@ -164,42 +400,14 @@ def handle_booking_notification(data):
             'message': f"New booking from {data['user']['name']} for {data['session']['title']}"
         }
         
-        # Check if facilitator is online
-        if facilitator_id in online_facilitators:
-            # Send real-time notification
-            socket_id = online_facilitators[facilitator_id]
-            socketio.emit('new_booking_notification', notification_message, room=socket_id)
-            logger.info(f"Real-time notification sent to facilitator {facilitator_id}")
-            
-            # Confirm delivery to backend
-            emit('notification_delivered', {
-                'booking_id': data['booking_id'],
-                'facilitator_id': facilitator_id,
-                'delivered_at': datetime.utcnow().isoformat()
-            })
-        else:
-            # Store notification for offline facilitator
-            stored_notification = StoredNotification(
-                facilitator_id=facilitator_id,
-                booking_id=data['booking_id'],
-                user_name=data['user']['name'],
-                user_email=data['user']['email'],
-                session_title=data['session']['title'],
-                session_start_time=datetime.fromisoformat(data['session']['start_time']),
-                message_data=json.dumps(notification_message)
-            )
-            
-            db.session.add(stored_notification)
-            db.session.commit()
-            
-            logger.info(f"Notification stored for offline facilitator {facilitator_id}")
+        with tracer.span('handle_booking_notification', data.get('trace'),
+                         booking_id=data['booking_id'], facilitator_id=facilitator_id):
+            # Merge into the facilitator's open coalescing window if there is one
+            if coalesce_notification(facilitator_id, notification_message):
+                tracer.annotate(coalesced=True)
+                return
             
-            # Confirm storage to backend
-            emit('notification_stored', {
-                'booking_id': data['booking_id'],
-                'facilitator_id': facilitator_id,
-                'stored_at': datetime.utcnow().isoformat()
-            })
+            deliver_notifications(facilitator_id, [notification_message])
             
     except Exception as e:
         logger.error(f"Error handling booking notification: {str(e)}")
@@ -218,7 +426,7 @@ def handle_get_pending_notifications(data):
 
 @socketio.on('mark_notification_read')
 def handle_mark_notification_read(data):
-    """Mark a notification as read"""
+    """Mark a notification as read (superseded by mark_notifications_read)"""
     facilitator_id = data.get('facilitator_id')
     notification_id = data.get('notification_id')
     
@@ -226,31 +434,403 @@ def handle_mark_notification_read(data):
         emit('error', {'error': 'Unauthorized'})
         return
     
-    notification = StoredNotification.query.filter_by(
-        id=notification_id,
-        facilitator_id=facilitator_id
-    ).first()
+    if not is_id(notification_id):
+        emit('error', {'error': 'notification_id must be an integer'})
+        return
     
-    if notification:
-        notification.delivered = True
-        db.session.commit()
+    count = run_db(mark_notifications_delivered, facilitator_id, notification_ids=[notification_id])
+    adjust_counters(pending_notifications=-count)
+    if count:
         emit('notification_marked_read', {'notification_id': notification_id})
 
-def send_pending_notifications(facilitator_id):
-    """Send all pending notifications to a facilitator"""
+@socketio.on('mark_notifications_read')
+def handle_mark_notifications_read(data):
+    """Mark a list of notifications, or everything up to a cursor, as read"""
+    facilitator_id = data.get('facilitator_id')
+    notification_ids = data.get('notification_ids')
+    up_to_id = data.get('up_to_id')
+    
+    if facilitator_id not in online_facilitators or online_facilitators[facilitator_id] != request.sid:
+        emit('error', {'error': 'Unauthorized'})
+        return
+    
+    if notification_ids is None and up_to_id is None:
+        emit('error', {'error': 'notification_ids or up_to_id required'})
+        return
+    
+    if notification_ids is not None and not (isinstance(notification_ids, list)
+                                             and all(is_id(item) for item in notification_ids)):
+        emit('error', {'error': 'notification_ids must be a list of integers'})
+        return
+    
+    if up_to_id is not None and not is_id(up_to_id):
+        emit('error', {'error': 'up_to_id must be an integer'})
+        return
+    
+    count = run_db(mark_notifications_delivered, facilitator_id,
+                   notification_ids=notification_ids, up_to_id=up_to_id)
+    adjust_counters(pending_notifications=-count)
+    emit('notifications_marked_read', {
+        'notification_ids': notification_ids,
+        'up_to_id': up_to_id,
+        'count': count
+    })
+
+def is_id(value):
+    """Client-supplied ids are checked before they reach a query; bool is an int subclass"""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def mark_notifications_delivered(facilitator_id, notification_ids=None, up_to_id=None):
+    """Flag a facilitator's pending notifications as delivered in a single UPDATE"""
+    query = StoredNotification.query.filter(
+        StoredNotification.facilitator_id == facilitator_id,
+        StoredNotification.delivered == False  # noqa: E712
+    )
+    if notification_ids is not None:
+        if not notification_ids:
+            return 0
+        query = query.filter(StoredNotification.id.in_(notification_ids))
+    if up_to_id is not None:
+        query = query.filter(StoredNotification.id <= up_to_id)
+    
+    count = query.update({StoredNotification.delivered: True}, synchronize_session=False)
+    db.session.commit()
+    return count
+
+def run_db(fn, *args, **kwargs):
+    """Run a database call in an app context, off the event loop in cooperative modes"""
+    def call():
+        with app.app_context():
+            return fn(*args, **kwargs)
+    
+    if SOCKETIO_ASYNC_MODE == 'eventlet':
+        from eventlet import tpool
+        with db_slots:
+            return tpool.execute(call)
+    if SOCKETIO_ASYNC_MODE == 'gevent':
+        import gevent
+        with db_slots:
+            return gevent.get_hub().threadpool.apply(call)
+    return call()
+
+def reserve_outbound(socket_id, facilitator_id, notification_message):
+    """Take a slot in a socket's outbound queue.
+    
+    Returns (seq, stalled): seq is None when the queue is full, and stalled is True
+    when its oldest notification has been waiting longer than SLOW_CONSUMER_TIMEOUT.
+    """
+    now = time.monotonic()
+    with outbound_lock:
+        queue = outbound_queues.setdefault(socket_id, {})
+        if len(queue) < MAX_OUTBOUND_QUEUE:
+            seq = next(outbound_seq)
+            queue[seq] = (now, facilitator_id, notification_message)
+            return seq, False
+        # Acks remove entries, so insertion order keeps the oldest first
+        oldest_sent_at = next(iter(queue.values()))[0]
+    return None, now - oldest_sent_at > SLOW_CONSUMER_TIMEOUT
+
+def acknowledge_outbound(socket_id, seq, *args):
+    """Ack callback: free the slot and tell a recovered client about notifications it missed"""
+    with outbound_lock:
+        queue = outbound_queues.get(socket_id)
+        if queue is None:
+            return
+        queue.pop(seq, None)
+        spilled = outbound_spilled.pop(socket_id, 0) if not queue else 0
+    
+    if spilled:
+        socketio.emit('notifications_spilled', {'count': spilled}, to=socket_id)
+
+def release_outbound(socket_id):
+    """Forget a closed socket's queue, returning the (facilitator_id, message) pairs it never acknowledged"""
+    with outbound_lock:
+        queue = outbound_queues.pop(socket_id, {})
+        outbound_spilled.pop(socket_id, None)
+    return [(facilitator_id, message) for _, facilitator_id, message in queue.values()]
+
+def spill_notifications(entries):
+    """Store unacknowledged notifications so they are sent as pending on reconnect"""
+    try:
+        run_db(store_notifications, entries)
+    except Exception as e:
+        logger.error(f"Error storing unacknowledged notifications: {str(e)}")
+        return
+    adjust_counters(total_notifications=len(entries), pending_notifications=len(entries),
+                    spilled_notifications=len(entries))
+    logger.info(f"Stored {len(entries)} unacknowledged notifications")
+
+def disconnect_slow_consumer(socket_id, facilitator_id):
+    """Drop a socket that has stopped acknowledging; its disconnect handler spills the queue"""
+    logger.warning(f"Disconnecting slow consumer {socket_id} (facilitator {facilitator_id})")
+    adjust_counters(slow_consumer_disconnects=1)
+    socketio.server.disconnect(socket_id, namespace='/')
+
+def outbound_queue_depths():
+    with outbound_lock:
+        depths = [len(queue) for queue in outbound_queues.values()]
+    return sum(depths), max(depths, default=0)
+
+def decode_payload(data):
+    """Accept msgpack-encoded binary payloads from the backend alongside plain JSON"""
+    if isinstance(data, (bytes, bytearray)):
+        if msgpack is None:
+            raise ValueError('Received a msgpack payload but msgpack is not installed')
+        try:
+            data = msgpack.unpackb(data, raw=False)
+        except Exception as e:
+            raise ValueError(f'Invalid msgpack payload: {e}')
+    if not isinstance(data, dict):
+        raise ValueError('Payload must be an object')
+    return data
+
+def encode_compact(socket_id, notification_message):
+    """Reduce a notification to ids, attaching user and session metadata only the first time
+    this socket sees them; the client keeps them in a cache for later frames"""
+    seen = compact_sockets[socket_id]
+    digest = notification_message['type'] == 'booking_digest'
+    users = notification_message.get('users') or [notification_message['user']]
+    session = notification_message['session']
+    
+    frame = {
+        't': 'd' if digest else 'b',
+        'b': notification_message['booking_ids'] if digest else notification_message['booking_id'],
+        'u': [user['id'] for user in users] if digest else users[0]['id'],
+        's': session['id'],
+        'ts': int(time.time() * 1000)
+    }
+    
+    new_users = []
+    for user in users:
+        if user['id'] not in seen['users']:
+            seen['users'].add(user['id'])
+            new_users.append([user['id'], user['name'], user.get('email')])
+    if new_users:
+        frame['um'] = new_users
+    
+    if session['id'] not in seen['sessions']:
+        seen['sessions'].add(session['id'])
+        frame['sm'] = [[session['id'], session['title'], session.get('start_time')]]
+    
+    return frame
+
+def deliver_notifications(facilitator_id, messages):
+    """Push notifications to an online facilitator or store them, merging several into digests"""
+    if len(messages) > 1:
+        messages = build_digests(messages)
+    
+    for notification_message in messages:
+        ack = {'booking_id': notification_message['booking_id'], 'facilitator_id': facilitator_id}
+        if 'booking_ids' in notification_message:
+            ack['booking_ids'] = notification_message['booking_ids']
+        
+        # Check if facilitator is online and keeping up
+        socket_id = online_facilitators.get(facilitator_id)
+        seq = None
+        if socket_id:
+            seq, stalled = reserve_outbound(socket_id, facilitator_id, notification_message)
+            if stalled:
+                disconnect_slow_consumer(socket_id, facilitator_id)
+                socket_id = None
+        
+        if seq is not None:
+            # Send real-time notification; the client's ack releases its queue slot
+            acknowledge = functools.partial(acknowledge_outbound, socket_id, seq)
+            with tracer.span('emit_notification'):
+                if socket_id in compact_sockets:
+                    socketio.emit('new_booking_compact', encode_compact(socket_id, notification_message),
+                                  to=socket_id, callback=acknowledge)
+                else:
+                    socketio.emit('new_booking_notification', notification_message,
+                                  to=socket_id, callback=acknowledge)
+            record_delivery()
+            logger.info(f"Real-time notification sent to facilitator {facilitator_id}")
+            
+            # Confirm delivery to backend
+            socketio.emit('notification_delivered', {**ack, 'delivered_at': datetime.utcnow().isoformat()},
+                          room='backend')
+        else:
+            # Store notification for an offline or backlogged facilitator
+            with tracer.span('store_notification'):
+                run_db(store_notification, facilitator_id, notification_message)
+            adjust_counters(total_notifications=1, pending_notifications=1)
+            
+            if socket_id:
+                ack['reason'] = 'backpressure'
+                with outbound_lock:
+                    outbound_spilled[socket_id] = outbound_spilled.get(socket_id, 0) + 1
+                adjust_counters(spilled_notifications=1)
+                logger.info(f"Outbound queue full, notification stored for facilitator {facilitator_id}")
+            else:
+                logger.info(f"Notification stored for offline facilitator {facilitator_id}")
+            
+            # Confirm storage to backend
+            socketio.emit('notification_stored', {**ack, 'stored_at': datetime.utcnow().isoformat()},
+                          room='backend')
+
+def release_availability(socket_id, session_ids=None):
+    """Drop a socket's subscriptions, all of them by default, and the throttle state of sessions left without subscribers"""
+    with availability_lock:
+        current = availability_subscriptions.get(socket_id, set())
+        released = current if session_ids is None else current.intersection(session_ids)
+        for session_id in released:
+            subscribers = availability_subscribers.get(session_id)
+            if subscribers is not None:
+                subscribers.discard(socket_id)
+                if not subscribers:
+                    del availability_subscribers[session_id]
+                    availability_latest.pop(session_id, None)
+                    availability_last_emit.pop(session_id, None)
+        current -= released
+        if not current:
+            availability_subscriptions.pop(socket_id, None)
+
+def publish_availability(update):
+    """Emit now if the room's throttle interval has passed, otherwise schedule one trailing emit"""
+    session_id = update['session_id']
+    with availability_lock:
+        if session_id not in availability_subscribers:
+            return
+        availability_latest[session_id] = update
+        if session_id in availability_scheduled:
+            return
+        wait = availability_last_emit.get(session_id, 0) + AVAILABILITY_THROTTLE - time.monotonic()
+        if wait > 0:
+            availability_scheduled.add(session_id)
+    
+    if wait > 0:
+        socketio.start_background_task(emit_availability_later, session_id, wait)
+    else:
+        emit_availability(session_id)
+
+def emit_availability_later(session_id, wait):
+    socketio.sleep(wait)
+    emit_availability(session_id)
+
+def emit_availability(session_id):
+    with availability_lock:
+        update = availability_latest.pop(session_id, None)
+        availability_scheduled.discard(session_id)
+        if update is None:
+            return
+        availability_last_emit[session_id] = time.monotonic()
+    
+    socketio.emit('session_availability', update, room=f'availability_{session_id}')
+
+def build_digests(messages):
+    """Merge booking notifications into one digest per session, keeping singletons as they are"""
+    by_session = {}
+    for message in messages:
+        session_key = message['session'].get('id', message['session']['title'])
+        by_session.setdefault(session_key, []).append(message)
+    
+    digests = []
+    for group in by_session.values():
+        if len(group) == 1:
+            digests.append(group[0])
+            continue
+        
+        latest = group[-1]
+        digests.append({
+            'type': 'booking_digest',
+            'booking_id': latest['booking_id'],
+            'booking_ids': [message['booking_id'] for message in group],
+            'count': len(group),
+            'user': latest['user'],
+            'users': [message['user'] for message in group],
+            'session': latest['session'],
+            'timestamp': datetime.utcnow().isoformat(),
+            'message': f"{len(group)} new bookings for {latest['session']['title']}"
+        })
+    return digests
+
+def coalesce_notification(facilitator_id, notification_message):
+    """Buffer a notification if the facilitator's window is open, otherwise open a new window"""
+    window = coalesce_windows.get(facilitator_id, NOTIFICATION_COALESCE_WINDOW)
+    if window <= 0:
+        return False
+    
+    with coalesce_lock:
+        if facilitator_id in coalesce_buffers:
+            coalesce_buffers[facilitator_id].append(notification_message)
+            return True
+        coalesce_buffers[facilitator_id] = []
+    
+    socketio.start_background_task(close_coalescing_window, facilitator_id, window)
+    return False
+
+def close_coalescing_window(facilitator_id, window):
+    """Deliver whatever arrived during the window; keep coalescing while bookings keep coming"""
+    while True:
+        socketio.sleep(window)
+        with coalesce_lock:
+            buffered = coalesce_buffers.get(facilitator_id)
+            if not buffered:
+                coalesce_buffers.pop(facilitator_id, None)
+                if facilitator_id not in online_facilitators:
+                    coalesce_windows.pop(facilitator_id, None)
+                return
+            coalesce_buffers[facilitator_id] = []
+        
+        try:
+            deliver_notifications(facilitator_id, buffered)
+        except Exception as e:
+            logger.error(f"Error delivering coalesced notifications to facilitator {facilitator_id}: {str(e)}")
+
+def store_coalesced_notifications():
+    """Persist anything still buffered so a shutdown does not drop notifications"""
+    with coalesce_lock:
+        buffers = dict(coalesce_buffers)
+        coalesce_buffers.clear()
+    
+    for facilitator_id, buffered in buffers.items():
+        for notification_message in build_digests(buffered):
+            run_db(store_notification, facilitator_id, notification_message)
+
+def build_stored_notification(facilitator_id, notification_message):
+    return StoredNotification(
+        facilitator_id=facilitator_id,
+        booking_id=notification_message['booking_id'],
+        user_name=notification_message['user']['name'],
+        user_email=notification_message['user']['email'],
+        session_title=notification_message['session']['title'],
+        session_start_time=datetime.fromisoformat(notification_message['session']['start_time']),
+        message_data=json.dumps(notification_message)
+    )
+
+def store_notification(facilitator_id, notification_message):
+    """Persist a notification for an offline facilitator"""
+    stored_notification = build_stored_notification(facilitator_id, notification_message)
+    
+    db.session.add(stored_notification)
+    db.session.commit()
+    return stored_notification.id
+
+def store_notifications(entries):
+    """Persist (facilitator_id, notification_message) pairs in one transaction"""
+    db.session.add_all([build_stored_notification(facilitator_id, message) for facilitator_id, message in entries])
+    db.session.commit()
+
+def load_pending_notifications(facilitator_id):
+    """Load a facilitator's undelivered notifications, newest first"""
     pending_notifications = StoredNotification.query.filter_by(
         facilitator_id=facilitator_id,
         delivered=False
     ).order_by(StoredNotification.created_at.desc()).all()
     
-    if pending_notifications:
-        notifications_data = []
-        for notification in pending_notifications:
-            message_data = json.loads(notification.message_data)
-            message_data['notification_id'] = notification.id
-            message_data['stored_at'] = notification.created_at.isoformat()
-            notifications_data.append(message_data)
-        
+    notifications_data = []
+    for notification in pending_notifications:
+        message_data = json.loads(notification.message_data)
+        message_data['notification_id'] = notification.id
+        message_data['stored_at'] = notification.created_at.isoformat()
+        notifications_data.append(message_data)
+    return notifications_data
+
+def send_pending_notifications(facilitator_id):
+    """Send all pending notifications to a facilitator"""
+    notifications_data = run_db(load_pending_notifications, facilitator_id)
+    
+    if notifications_data:
         emit('pending_notifications', {
             'notifications': notifications_data,
             'count': len(notifications_data)
@@ -258,6 +838,154 @@ def send_pending_notifications(facilitator_id):
         
         logger.info(f"Sent {len(notifications_data)} pending notifications to facilitator {facilitator_id}")
 
+def record_presence(facilitator_id, op, socket_id):
+    """Buffer a presence change; only the latest change per facilitator is kept"""
+    with presence_lock:
+        pending_presence[facilitator_id] = {'op': op, 'socket_id': socket_id, 'at': datetime.utcnow()}
+        pending_heartbeats.pop(facilitator_id, None)
+    
+    if PRESENCE_FLUSH_INTERVAL <= 0:
+        flush_presence()
+
+def flush_presence():
+    """Write buffered presence changes and heartbeats to FacilitatorSession in one transaction"""
+    with presence_lock:
+        changes = dict(pending_presence)
+        heartbeats = dict(pending_heartbeats)
+        pending_presence.clear()
+        pending_heartbeats.clear()
+    
+    if not changes and not heartbeats:
+        return 0
+    
+    try:
+        inserted, deleted = run_db(write_presence, changes, heartbeats)
+        adjust_counters(facilitator_sessions=inserted - deleted)
+    except Exception as e:
+        logger.error(f"Error flushing facilitator presence: {str(e)}")
+        # Put the changes back unless something newer arrived in the meantime
+        with presence_lock:
+            for fac_id, change in changes.items():
+                pending_presence.setdefault(fac_id, change)
+            for fac_id, last_seen in heartbeats.items():
+                pending_heartbeats.setdefault(fac_id, last_seen)
+        return 0
+    
+    return len(changes) + len(heartbeats)
+
+def write_presence(changes, heartbeats):
+    """Apply a batch of presence deletes, upserts and heartbeats"""
+    deletes = [fac_id for fac_id, change in changes.items() if change['op'] == 'delete']
+    upserts = {fac_id: change for fac_id, change in changes.items() if change['op'] == 'upsert'}
+    
+    inserted = deleted = 0
+    try:
+        if deletes:
+            deleted = FacilitatorSession.query.filter(
+                FacilitatorSession.facilitator_id.in_(deletes)
+            ).delete(synchronize_session=False)
+        
+        touched_ids = list(upserts) + list(heartbeats)
+        if touched_ids:
+            existing = {
+                session.facilitator_id: session
+                for session in FacilitatorSession.query.filter(
+                    FacilitatorSession.facilitator_id.in_(touched_ids)
+                ).all()
+            }
+            for fac_id, change in upserts.items():
+                session = existing.get(fac_id)
+                if session:
+                    session.socket_id = change['socket_id']
+                    session.last_seen = change['at']
+                else:
+                    existing[fac_id] = FacilitatorSession(
+                        facilitator_id=fac_id,
+                        socket_id=change['socket_id'],
+                        connected_at=change['at'],
+                        last_seen=change['at']
+                    )
+                    db.session.add(existing[fac_id])
+                    inserted += 1
+            for fac_id, last_seen in heartbeats.items():
+                if fac_id in existing:
+                    existing[fac_id].last_seen = last_seen
+        
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    
+    return inserted, deleted
+
+def presence_flush_loop():
+    """Background task that periodically flushes buffered presence changes"""
+    while True:
+        socketio.sleep(PRESENCE_FLUSH_INTERVAL)
+        flush_presence()
+
+def start_presence_flusher():
+    if PRESENCE_FLUSH_INTERVAL > 0:
+        socketio.start_background_task(presence_flush_loop)
+        atexit.register(shutdown_presence_flusher)
+
+def shutdown_presence_flusher():
+    flush_presence()
+
+def adjust_counters(**deltas):
+    with stats_lock:
+        for name, delta in deltas.items():
+            notification_counters[name] = max(0, notification_counters[name] + delta)
+
+def record_delivery():
+    now = time.monotonic()
+    with stats_lock:
+        notification_counters['realtime_deliveries'] += 1
+        recent_deliveries.append(now)
+        trim_recent_deliveries(now)
+
+def trim_recent_deliveries(now):
+    while recent_deliveries and recent_deliveries[0] < now - DELIVERY_RATE_WINDOW:
+        recent_deliveries.popleft()
+
+def reconcile_counters():
+    """Reset the row counters from the database"""
+    global last_reconciled_at
+    try:
+        counts = run_db(count_notification_stats)
+    except Exception as e:
+        logger.error(f"Error reconciling notification counters: {str(e)}")
+        return
+    
+    with stats_lock:
+        notification_counters.update(counts)
+        last_reconciled_at = datetime.utcnow()
+
+def stats_reconcile_loop():
+    """Background task that periodically corrects counter drift"""
+    while True:
+        socketio.sleep(STATS_RECONCILE_INTERVAL)
+        reconcile_counters()
+
+def start_stats_reconciler():
+    reconcile_counters()
+    if STATS_RECONCILE_INTERVAL > 0:
+        socketio.start_background_task(stats_reconcile_loop)
+
+def snapshot_stats():
+    """Current counters plus connection state; never touches the database"""
+    now = time.monotonic()
+    with stats_lock:
+        trim_recent_deliveries(now)
+        stats = dict(notification_counters)
+        stats['deliveries_per_second'] = round(len(recent_deliveries) / DELIVERY_RATE_WINDOW, 3)
+        stats['last_reconciled_at'] = last_reconciled_at.isoformat() if last_reconciled_at else None
+    
+    stats['online_facilitators'] = len(online_facilitators)
+    stats['backend_connected'] = backend_socket_id is not None
+    stats['outbound_queue_depth'], stats['outbound_queue_max_depth'] = outbound_queue_depths()
+    return stats
+
 # HTTP endpoints for health check and stats
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -271,22 +999,257 @@ def health_check():
 
 @app.route('/stats')
 def get_stats():
-    total_stored = StoredNotification.query.count()
-    undelivered = StoredNotification.query.filter_by(delivered=False).count()
-    
+    return snapshot_stats()
+
+@app.route('/retention')
+def get_retention():
     return {
-        'online_facilitators': len(online_facilitators),
-        'backend_connected': backend_socket_id is not None,
-        'total_notifications': total_stored,
-        'pending_notifications': undelivered,
+        'retention_days': NOTIFICATION_RETENTION_DAYS,
+        'archive': RETENTION_ARCHIVE,
+        'partitioning': NOTIFICATION_PARTITIONING if partitioning_enabled() else 'none',
+        **retention_report
+    }
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus text exposition of the in-memory counters, then request, SQL and event timings"""
+    stats = snapshot_stats()
+    metrics = [
+        ('online_facilitators', 'gauge', 'Facilitators with an open socket', stats['online_facilitators']),
+        ('backend_connected', 'gauge', 'Whether the backend service socket is connected', int(stats['backend_connected'])),
+        ('stored_notifications', 'gauge', 'Rows in the stored notification table', stats['total_notifications']),
+        ('pending_notifications', 'gauge', 'Stored notifications not yet read', stats['pending_notifications']),
+        ('facilitator_sessions', 'gauge', 'Rows in the facilitator session table', stats['facilitator_sessions']),
+        ('realtime_deliveries_total', 'counter', 'Notifications pushed to online facilitators', stats['realtime_deliveries']),
+        ('deliveries_per_second', 'gauge', f'Real-time deliveries per second over the last {DELIVERY_RATE_WINDOW}s', stats['deliveries_per_second']),
+        ('outbound_queue_depth', 'gauge', 'Notifications pushed but not yet acknowledged, all sockets', stats['outbound_queue_depth']),
+        ('outbound_queue_max_depth', 'gauge', 'Deepest single-socket outbound queue', stats['outbound_queue_max_depth']),
+        ('spilled_notifications_total', 'counter', 'Notifications stored because a socket fell behind', stats['spilled_notifications']),
+        ('slow_consumer_disconnects_total', 'counter', 'Sockets disconnected for not acknowledging', stats['slow_consumer_disconnects']),
+        ('retention_purged_total', 'counter', 'Notifications removed by the retention job', retention_report['purged_total']),
+        ('retention_purge_rows_per_second', 'gauge', 'Purge throughput of the last retention run', retention_report['purge_rows_per_second']),
+    ]
+    if retention_report['table_bytes'] is not None:
+        metrics.append(('stored_notifications_bytes', 'gauge', 'Notification table size at the last retention run',
+                        retention_report['table_bytes']))
+    lines = []
+    for name, metric_type, help_text, value in metrics:
+        lines.append(f'# HELP notification_service_{name} {help_text}')
+        lines.append(f'# TYPE notification_service_{name} {metric_type}')
+        lines.append(f'notification_service_{name} {value}')
+    return Response('\n'.join(lines) + '\n' + instrumentation.render(), mimetype='text/plain; version=0.0.4')
+
+def count_notification_stats():
+    return {
+        'total_notifications': StoredNotification.query.count(),
+        'pending_notifications': StoredNotification.query.filter_by(delivered=False).count(),
         'facilitator_sessions': FacilitatorSession.query.count()
     }
 
+def partitioning_enabled():
+    return NOTIFICATION_PARTITIONING == 'monthly' and db.engine.dialect.name == 'postgresql'
+
+def month_start(value, offset=0):
+    month_index = value.year * 12 + value.month - 1 + offset
+    return datetime(month_index // 12, month_index % 12 + 1, 1)
+
+def create_partitioned_notification_table():
+    """Create stored_notification as a monthly range-partitioned table (PostgreSQL only)"""
+    table = StoredNotification.__tablename__
+    existing = db.session.execute(
+        text("SELECT relkind FROM pg_class WHERE relname = :name AND relkind IN ('r', 'p')"),
+        {'name': table}
+    ).scalar()
+    if existing == 'r':
+        logger.warning(f"{table} already exists unpartitioned; NOTIFICATION_PARTITIONING only applies to new tables")
+        return
+    
+    db.session.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            id SERIAL,
+            facilitator_id INTEGER NOT NULL,
+            booking_id INTEGER NOT NULL,
+            user_name VARCHAR(100) NOT NULL,
+            user_email VARCHAR(120) NOT NULL,
+            session_title VARCHAR(200) NOT NULL,
+            session_start_time TIMESTAMP NOT NULL,
+            message_data TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+            delivered BOOLEAN DEFAULT false,
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at)
+    """))
+    db.session.commit()
+
+def ensure_notification_partitions():
+    """Create this month's partition and the next PARTITIONS_AHEAD months"""
+    table = StoredNotification.__tablename__
+    now = datetime.utcnow()
+    for offset in range(PARTITIONS_AHEAD + 1):
+        start, end = month_start(now, offset), month_start(now, offset + 1)
+        db.session.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {table}_{start:%Y_%m} PARTITION OF {table} "
+            f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+        ))
+    db.session.commit()
+
+def list_notification_partitions():
+    """Return [(partition_name, month_end)] for the stored_notification partitions"""
+    rows = db.session.execute(text("""
+        SELECT child.relname FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = :name
+    """), {'name': StoredNotification.__tablename__}).scalars().all()
+    
+    partitions = []
+    for name in rows:
+        try:
+            start = datetime.strptime(name[-7:], '%Y_%m')
+        except ValueError:
+            continue
+        partitions.append((name, month_start(start, 1)))
+    return partitions
+
+def drop_expired_partitions(cutoff):
+    """Drop whole months that ended before the cutoff and hold only delivered rows"""
+    dropped = purged = 0
+    for name, month_end in list_notification_partitions():
+        if month_end > cutoff:
+            continue
+        if db.session.execute(text(f"SELECT 1 FROM {name} WHERE NOT delivered LIMIT 1")).first():
+            continue  # undelivered rows are kept; the batched purge handles the delivered ones
+        
+        rows = db.session.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+        if RETENTION_ARCHIVE:
+            db.session.execute(text(f"""
+                INSERT INTO archived_notification
+                    (id, facilitator_id, booking_id, user_name, user_email, session_title,
+                     session_start_time, message_data, created_at, delivered)
+                SELECT id, facilitator_id, booking_id, user_name, user_email, session_title,
+                       session_start_time, message_data, created_at, delivered
+                FROM {name}
+            """))
+        db.session.execute(text(f"ALTER TABLE {StoredNotification.__tablename__} DETACH PARTITION {name}"))
+        db.session.execute(text(f"DROP TABLE {name}"))
+        db.session.commit()
+        dropped += 1
+        purged += rows
+        logger.info(f"Dropped notification partition {name} ({rows} rows)")
+    return dropped, purged
+
+def purge_notification_batch(cutoff, batch_size):
+    """Purge (or archive) one batch of delivered notifications older than the cutoff"""
+    ids = db.session.execute(
+        select(StoredNotification.id)
+        .where(StoredNotification.delivered == True, StoredNotification.created_at < cutoff)  # noqa: E712
+        .order_by(StoredNotification.id)
+        .limit(batch_size)
+    ).scalars().all()
+    if not ids:
+        return 0
+    
+    if RETENTION_ARCHIVE:
+        columns = ['id', 'facilitator_id', 'booking_id', 'user_name', 'user_email', 'session_title',
+                   'session_start_time', 'message_data', 'created_at', 'delivered']
+        db.session.execute(
+            insert(ArchivedNotification).from_select(
+                columns,
+                select(*[getattr(StoredNotification, column) for column in columns])
+                .where(StoredNotification.id.in_(ids))
+            )
+        )
+    StoredNotification.query.filter(StoredNotification.id.in_(ids)).delete(synchronize_session=False)
+    db.session.commit()
+    return len(ids)
+
+def measure_notification_table():
+    """Approximate on-disk size of the notification table (whole database file on SQLite)"""
+    if db.engine.dialect.name == 'postgresql':
+        # A partitioned parent holds no data; an unpartitioned table is its own single leaf
+        return db.session.execute(text("""
+            SELECT CAST(COALESCE(SUM(pg_total_relation_size(relid)), 0) AS BIGINT)
+            FROM pg_partition_tree(CAST(:name AS regclass)) WHERE isleaf
+        """), {'name': StoredNotification.__tablename__}).scalar()
+    if db.engine.dialect.name == 'sqlite':
+        page_count = db.session.execute(text("PRAGMA page_count")).scalar()
+        page_size = db.session.execute(text("PRAGMA page_size")).scalar()
+        return page_count * page_size
+    return None
+
+def run_retention():
+    """One retention pass: drop expired partitions, then purge remaining expired rows in batches"""
+    started = time.monotonic()
+    cutoff = datetime.utcnow() - timedelta(days=NOTIFICATION_RETENTION_DAYS)
+    partitions_dropped = purged = 0
+    
+    if partitioning_enabled():
+        run_db(ensure_notification_partitions)
+        partitions_dropped, purged = run_db(drop_expired_partitions, cutoff)
+    
+    while True:
+        batch = run_db(purge_notification_batch, cutoff, RETENTION_BATCH_SIZE)
+        purged += batch
+        if batch < RETENTION_BATCH_SIZE:
+            break
+        # Yield between batches so row locks are released and other writers get in
+        socketio.sleep(RETENTION_BATCH_PAUSE)
+    
+    elapsed = time.monotonic() - started
+    adjust_counters(total_notifications=-purged)
+    retention_report.update({
+        'last_run_at': datetime.utcnow().isoformat(),
+        'last_run_seconds': round(elapsed, 3),
+        'last_run_purged': purged,
+        'last_run_partitions_dropped': partitions_dropped,
+        'purged_total': retention_report['purged_total'] + purged,
+        'purge_rows_per_second': round(purged / elapsed, 1) if elapsed > 0 else 0.0,
+        'table_bytes': run_db(measure_notification_table)
+    })
+    if purged:
+        logger.info(f"Retention purged {purged} notifications in {elapsed:.2f}s")
+    return purged
+
+def retention_loop():
+    """Background task that applies the retention policy every RETENTION_INTERVAL seconds"""
+    while True:
+        try:
+            run_retention()
+        except Exception as e:
+            logger.error(f"Error applying notification retention: {str(e)}")
+        socketio.sleep(RETENTION_INTERVAL)
+
+def start_retention_worker():
+    if NOTIFICATION_RETENTION_DAYS > 0 and RETENTION_INTERVAL > 0:
+        socketio.start_background_task(retention_loop)
+
 # Initialize database
 def create_tables():
     with app.app_context():
+        if partitioning_enabled():
+            create_partitioned_notification_table()
+            ensure_notification_partitions()
         db.create_all()
+        # create_all skips indexes on tables that already exist
+        for index in StoredNotification.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
+
+def is_reloader_watcher():
+    """With DEBUG the reloader's parent process only watches files; the child it starts serves requests"""
+    return DEBUG and os.environ.get('WERKZEUG_RUN_MAIN') != 'true'
 
 if __name__ == '__main__':
-    create_tables()
-    socketio.run(app, debug=True, port=5002, host='0.0.0.0', allow_unsafe_werkzeug=True)
+    # Only the serving process owns the tables and background loops, or a dev run doubles them
+    if not is_reloader_watcher():
+        create_tables()
+        start_presence_flusher()
+        start_stats_reconciler()
+        start_retention_worker()
+        atexit.register(store_coalesced_notifications)
+    logger.info(f"Starting notification service with async mode '{SOCKETIO_ASYNC_MODE}'")
+    if SOCKETIO_ASYNC_MODE == 'threading':
+        socketio.run(app, debug=DEBUG, port=PORT, host='0.0.0.0', allow_unsafe_werkzeug=True)
+    elif SOCKETIO_ASYNC_MODE == 'eventlet':
+        socketio.run(app, debug=DEBUG, port=PORT, host='0.0.0.0', max_size=MAX_CONNECTIONS)
+    else:
+        socketio.run(app, debug=DEBUG, port=PORT, host='0.0.0.0')
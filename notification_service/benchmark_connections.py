@@ -0,0 +1,239 @@
+"""
+Connection-scaling benchmark for the notification service.
+
+Starts the service in a subprocess with the chosen Socket.IO async mode, opens
+many simulated facilitator sockets from a single asyncio client process, then
+reports server memory per connection and new_booking_notification delivery
+latency percentiles.
+
+Client and server share the host, so run it on a machine with spare cores: a
+CPU-bound client misses heartbeats and its sockets get dropped, which shows up
+as failed or no-longer-connected sockets in the report.
+
+Requires the asyncio Socket.IO client and psutil:
+    pip install "python-socketio[asyncio_client]" psutil
+
+Usage:
+    python benchmark_connections.py --async-mode eventlet --connections 10000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+import psutil
+import socketio
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_TOKEN = 'benchmark-backend-token'
+
+
+def raise_fd_limit():
+    """Every socket costs a descriptor on both ends, so lift the soft limit to the hard limit"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    return hard
+
+
+def start_service(async_mode, port, db_path, coalesce_window):
+    env = dict(os.environ)
+    env.update({
+        'SOCKETIO_ASYNC_MODE': async_mode,
+        'NOTIFICATION_COALESCE_WINDOW': str(coalesce_window),
+        'DATABASE_URL': f'sqlite:///{db_path}',
+        'BACKEND_SERVICE_TOKEN': BACKEND_TOKEN,
+        'FLASK_ENV': 'production',
+        'PORT': str(port),
+    })
+    return subprocess.Popen(
+        [sys.executable, 'app.py'],
+        cwd=SERVICE_DIR,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_for_health(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(f'{url}/health') as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError('Notification service did not become healthy')
+
+
+def make_client(http_session):
+    return socketio.AsyncClient(reconnection=False, http_session=http_session, request_timeout=30)
+
+
+async def connect_facilitator(url, http_session, facilitator_id, received):
+    """Open one facilitator socket and wait until it is authenticated"""
+    sio = make_client(http_session)
+    authenticated = asyncio.get_running_loop().create_future()
+
+    @sio.on('facilitator_auth_success')
+    async def on_auth(data):
+        if not authenticated.done():
+            authenticated.set_result(True)
+
+    @sio.on('new_booking_notification')
+    async def on_notification(data):
+        # Coalesced digests carry every booking they merged
+        for booking_id in data.get('booking_ids', [data['booking_id']]):
+            received[booking_id] = time.perf_counter()
+
+    await asyncio.wait_for(sio.connect(url, transports=['websocket']), timeout=30)
+    await sio.emit('facilitator_connect', {'facilitator_id': facilitator_id})
+    await asyncio.wait_for(authenticated, timeout=30)
+    return sio
+
+
+async def connect_backend(url, http_session):
+    sio = make_client(http_session)
+    authenticated = asyncio.get_running_loop().create_future()
+
+    @sio.on('backend_auth_success')
+    async def on_auth(data):
+        if not authenticated.done():
+            authenticated.set_result(True)
+
+    await sio.connect(url, transports=['websocket'])
+    await sio.emit('backend_connect', {'token': BACKEND_TOKEN})
+    await asyncio.wait_for(authenticated, timeout=30)
+    return sio
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return float('nan')
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run(args):
+    url = f'http://127.0.0.1:{args.port}'
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(db_fd)
+    server = start_service(args.async_mode, args.port, db_path, args.coalesce_window)
+    # One shared HTTP session keeps client-side overhead down at high socket counts
+    http_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0))
+    clients = []
+    failures = 0
+    try:
+        await wait_for_health(url)
+        server_process = psutil.Process(server.pid)
+        baseline_rss = server_process.memory_info().rss
+
+        received = {}
+        connected_ids = []
+        start = time.perf_counter()
+        for batch_start in range(1, args.connections + 1, args.ramp):
+            batch = range(batch_start, min(batch_start + args.ramp, args.connections + 1))
+            results = await asyncio.gather(
+                *(connect_facilitator(url, http_session, facilitator_id, received) for facilitator_id in batch),
+                return_exceptions=True
+            )
+            for facilitator_id, result in zip(batch, results):
+                if isinstance(result, BaseException):
+                    failures += 1
+                else:
+                    clients.append(result)
+                    connected_ids.append(facilitator_id)
+            print(f"  connected {len(clients):,}/{args.connections:,} ({failures} failed)", end='\r', flush=True)
+        print()
+        if not clients:
+            raise RuntimeError('No facilitator sockets could be opened')
+        connect_seconds = time.perf_counter() - start
+
+        # Let the server settle (presence flush, GC) before sampling memory
+        await asyncio.sleep(args.settle)
+        loaded_rss = server_process.memory_info().rss
+        per_connection = (loaded_rss - baseline_rss) / len(clients)
+
+        # Sockets can drop while connecting if the client host is CPU bound; count survivors
+        still_connected = sum(1 for client in clients if client.connected)
+
+        backend = await connect_backend(url, http_session)
+        clients.append(backend)
+
+        sent = {}
+        interval = 1.0 / args.rate
+        for booking_id in range(1, args.notifications + 1):
+            facilitator_id = random.choice(connected_ids)
+            sent[booking_id] = time.perf_counter()
+            await backend.emit('booking_notification', {
+                'booking_id': booking_id,
+                'user': {'id': 1, 'name': 'Benchmark User', 'email': 'bench@example.com'},
+                'session': {'id': 1, 'title': 'Benchmark Session', 'start_time': '2030-01-01T09:00:00'},
+                'facilitator_id': facilitator_id,
+            })
+            await asyncio.sleep(interval)
+
+        deadline = time.monotonic() + 30
+        while len(received) < len(sent) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+        latencies = sorted(
+            (received[booking_id] - sent_at) * 1000
+            for booking_id, sent_at in sent.items() if booking_id in received
+        )
+
+        print("📈 Notification service connection benchmark")
+        print("=" * 50)
+        print(f"Async mode:              {args.async_mode}")
+        print(f"Coalescing window:       {args.coalesce_window:g}s"
+              + (" (latency includes the deliberate hold)" if args.coalesce_window > 0 else ""))
+        print(f"Facilitator sockets:     {len(clients) - 1:,} (connected in {connect_seconds:.1f}s, "
+              f"{failures} failed, {still_connected:,} still connected)")
+        print(f"Server RSS:              {baseline_rss / 2**20:.1f} MiB -> {loaded_rss / 2**20:.1f} MiB")
+        print(f"Memory per connection:   {per_connection / 1024:.1f} KiB")
+        print(f"Notifications delivered: {len(latencies)}/{len(sent)}")
+        print(f"Delivery latency p50:    {percentile(latencies, 50):.2f} ms")
+        print(f"Delivery latency p95:    {percentile(latencies, 95):.2f} ms")
+        print(f"Delivery latency p99:    {percentile(latencies, 99):.2f} ms")
+        print(f"Delivery latency max:    {latencies[-1] if latencies else float('nan'):.2f} ms")
+    finally:
+        await asyncio.gather(*(client.disconnect() for client in clients), return_exceptions=True)
+        await http_session.close()
+        server.terminate()
+        server.wait(timeout=10)
+        os.remove(db_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Notification service connection-scaling benchmark')
+    parser.add_argument('--async-mode', default=os.getenv('SOCKETIO_ASYNC_MODE', 'eventlet'),
+                        choices=['threading', 'eventlet', 'gevent'])
+    parser.add_argument('--connections', type=int, default=10000)
+    parser.add_argument('--notifications', type=int, default=1000)
+    parser.add_argument('--rate', type=float, default=200, help='notifications sent per second')
+    parser.add_argument('--ramp', type=int, default=250, help='sockets opened concurrently')
+    parser.add_argument('--settle', type=float, default=2.0, help='seconds to wait before sampling memory')
+    parser.add_argument('--coalesce-window', type=float, default=0,
+                        help='NOTIFICATION_COALESCE_WINDOW for the service; 0 measures delivery without the hold')
+    parser.add_argument('--port', type=int, default=5102)
+    args = parser.parse_args()
+
+    fd_limit = raise_fd_limit()
+    if fd_limit < args.connections * 2 + 100:
+        print(f"⚠️  File descriptor limit {fd_limit} is low for {args.connections} local connections")
+
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""
+Serialization benchmark for the notification service.
+
+Compares, per booking notification, the bytes put on the wire and the CPU spent
+encoding and decoding the Socket.IO packet for:
+
+  * backend -> service: JSON text frames versus a msgpack binary attachment
+    (NOTIFICATION_WIRE_FORMAT=msgpack on the backend)
+  * service -> facilitator: full new_booking_notification frames versus compact
+    new_booking_compact frames, both for a socket's first notification (which
+    carries user/session metadata) and once the metadata is cached client side
+
+Requires msgpack:
+    pip install msgpack
+
+Usage:
+    python benchmark_serialization.py --iterations 20000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import timeit
+from datetime import datetime
+
+import msgpack
+from socketio import packet
+
+# Point the service at a throwaway database before it is imported
+_db_fd, _db_path = tempfile.mkstemp(suffix='.db')
+os.close(_db_fd)
+os.environ['DATABASE_URL'] = f'sqlite:///{_db_path}'
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import app as notification_app  # noqa: E402
+
+BOOKING = {
+    'booking_id': 48213,
+    'user': {'id': 1742, 'name': 'Priya Raman', 'email': 'priya.raman@example.com'},
+    'session': {'id': 318, 'title': 'Morning Vinyasa Flow', 'start_time': '2030-01-01T09:00:00'},
+    'facilitator_id': 57,
+}
+
+NOTIFICATION = {
+    'type': 'new_booking',
+    'booking_id': BOOKING['booking_id'],
+    'user': BOOKING['user'],
+    'session': BOOKING['session'],
+    'timestamp': datetime.utcnow().isoformat(),
+    'message': f"New booking from {BOOKING['user']['name']} for {BOOKING['session']['title']}",
+}
+
+
+def wire_bytes(event, data):
+    """Size of an encoded Socket.IO EVENT packet, counting binary attachments"""
+    encoded = packet.Packet(packet.EVENT, data=[event, data]).encode()
+    if isinstance(encoded, list):
+        return sum(len(part.encode() if isinstance(part, str) else part) for part in encoded)
+    return len(encoded.encode())
+
+
+def roundtrip(event, data, decode_payload=None):
+    """Encode a packet and decode it again the way the receiving side would"""
+    def run():
+        encoded = packet.Packet(packet.EVENT, data=[event, data]).encode()
+        if isinstance(encoded, list):
+            received = packet.Packet(encoded_packet=encoded[0])
+            received.add_attachment(encoded[1])
+        else:
+            received = packet.Packet(encoded_packet=encoded)
+        payload = received.data[1]
+        if decode_payload:
+            payload = decode_payload(payload)
+        return payload
+    return run
+
+
+def measure(run, iterations):
+    """Microseconds per encode + decode round trip"""
+    return min(timeit.repeat(run, number=iterations, repeat=3)) / iterations * 1e6
+
+
+def compact_frame(first):
+    notification_app.compact_sockets['benchmark'] = {'users': set(), 'sessions': set()}
+    if not first:
+        notification_app.encode_compact('benchmark', NOTIFICATION)
+    return notification_app.encode_compact('benchmark', NOTIFICATION)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Notification service serialization benchmark')
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    packed = msgpack.packb(BOOKING, use_bin_type=True)
+    first = compact_frame(first=True)
+    cached = compact_frame(first=False)
+
+    def encode_msgpack_roundtrip():
+        # The backend pays for packb on every send, so count it
+        return roundtrip('booking_notification', msgpack.packb(BOOKING, use_bin_type=True),
+                         notification_app.decode_payload)()
+
+    def encode_compact_roundtrip():
+        notification_app.compact_sockets['benchmark'] = {'users': {1742}, 'sessions': {318}}
+        return roundtrip('new_booking_compact', notification_app.encode_compact('benchmark', NOTIFICATION))()
+
+    rows = [
+        ('backend link, JSON', wire_bytes('booking_notification', BOOKING),
+         measure(roundtrip('booking_notification', BOOKING, notification_app.decode_payload), args.iterations)),
+        ('backend link, msgpack', wire_bytes('booking_notification', packed),
+         measure(encode_msgpack_roundtrip, args.iterations)),
+        ('facilitator, full frame', wire_bytes('new_booking_notification', NOTIFICATION),
+         measure(roundtrip('new_booking_notification', NOTIFICATION), args.iterations)),
+        ('facilitator, compact (first)', wire_bytes('new_booking_compact', first), None),
+        ('facilitator, compact (cached)', wire_bytes('new_booking_compact', cached),
+         measure(encode_compact_roundtrip, args.iterations)),
+    ]
+
+    print("📦 Notification serialization benchmark")
+    print("=" * 64)
+    print(f"{'Format':<32}{'Wire bytes':>12}{'Encode+decode':>20}")
+    for name, size, micros in rows:
+        timing = f"{micros:.2f} µs" if micros is not None else '-'
+        print(f"{name:<32}{size:>12}{timing:>20}")
+
+    os.remove(_db_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+"""
+Boots the notification service in-process against the PostgreSQL database in
+NOTIFICATION_TEST_DATABASE_URL, with monthly partitioning on.
+
+The service reads its configuration when app.py is imported, so the environment
+is set before the import. Without the variable the tests skip themselves. The
+database should be a scratch one: the notification tables are dropped afterwards.
+"""
+
+import os
+import sys
+
+import pytest
+
+TEST_DATABASE_URL = os.getenv('NOTIFICATION_TEST_DATABASE_URL')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if TEST_DATABASE_URL:
+    os.environ.update({
+        'DATABASE_URL': TEST_DATABASE_URL,
+        'NOTIFICATION_PARTITIONING': 'monthly',
+        'SOCKETIO_ASYNC_MODE': 'threading',
+        'FLASK_ENV': 'production',
+    })
+
+    import app as notification_app  # noqa: E402
+
+    @pytest.fixture(scope='session', autouse=True)
+    def tables():
+        notification_app.create_tables()
+        yield
+        with notification_app.app.app_context():
+            notification_app.db.session.remove()
+            notification_app.db.drop_all()
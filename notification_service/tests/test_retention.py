@@ -0,0 +1,31 @@
+from datetime import datetime
+
+import pytest
+
+from conftest import TEST_DATABASE_URL
+
+if not TEST_DATABASE_URL:
+    pytest.skip('NOTIFICATION_TEST_DATABASE_URL is not set', allow_module_level=True)
+
+import app as notification_app  # noqa: E402
+
+
+def notification(booking_id):
+    return {
+        'booking_id': booking_id,
+        'user': {'id': 1, 'name': 'John Doe', 'email': 'user@example.com'},
+        'session': {'id': 1, 'title': 'Morning Meditation', 'start_time': '2030-01-15T09:00:00'},
+        'timestamp': datetime.utcnow().isoformat(),
+        'message': 'New booking from John Doe for Morning Meditation'
+    }
+
+
+def test_partitioned_table_size_counts_the_partitions():
+    assert notification_app.run_db(notification_app.partitioning_enabled)
+    notification_app.run_db(notification_app.store_notifications,
+                            [(1, notification(booking_id)) for booking_id in range(200)])
+
+    notification_app.run_retention()
+
+    assert notification_app.retention_report['table_bytes'] > 0
+    assert notification_app.run_db(notification_app.measure_notification_table) > 0
@@ -1,10 +1,20 @@
 import requests
 import json
+import time
 from datetime import datetime, timedelta
 
 # Test email service
 EMAIL_SERVICE_URL = "http://localhost:5003"
 
+def wait_for_job(job_id, timeout=30):
+    """Poll a queued email until it is sent or dead, or the timeout passes"""
+    deadline = time.time() + timeout
+    while True:
+        job = requests.get(f"{EMAIL_SERVICE_URL}/jobs/{job_id}").json()
+        if job['status'] in ('sent', 'dead') or time.time() > deadline:
+            return job
+        time.sleep(0.5)
+
 def test_email_service():
     """Test the email service with sample data"""
     
@@ -57,12 +67,15 @@ def test_email_service():
             headers={'Content-Type': 'application/json'}
         )
         
-        if response.status_code == 200:
-            print("✅ Booking emails sent successfully")
-            print(f"Response: {response.json()}")
-        elif response.status_code == 207:
-            print("⚠️  Partial success - some emails sent")
+        if response.status_code == 202:
+            print("✅ Booking emails queued")
             print(f"Response: {response.json()}")
+            for job_id in response.json()['jobs'].values():
+                job = wait_for_job(job_id)
+                if job['status'] == 'sent':
+                    print(f"✅ {job['kind']} sent to {job['recipient']}")
+                else:
+                    print(f"⚠️  {job['kind']} is {job['status']} after {job['attempts']} attempts: {job['last_error']}")
         else:
             print(f"❌ Email sending failed: {response.status_code}")
             print(f"Response: {response.text}")
@@ -82,8 +95,8 @@ def test_email_service():
             headers={'Content-Type': 'application/json'}
         )
         
-        if response.status_code == 200:
-            print("✅ User confirmation email sent")
+        if response.status_code == 202:
+            print(f"✅ User confirmation email queued: {response.json()['job_id']}")
         else:
             print(f"❌ User confirmation failed: {response.status_code}")
     except Exception as e:
@@ -97,8 +110,8 @@ def test_email_service():
             headers={'Content-Type': 'application/json'}
         )
         
-        if response.status_code == 200:
-            print("✅ Facilitator notification email sent")
+        if response.status_code == 202:
+            print(f"✅ Facilitator notification email queued: {response.json()['job_id']}")
         else:
             print(f"❌ Facilitator notification failed: {response.status_code}")
     except Exception as e:
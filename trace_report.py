@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Booking flow trace report.
+
+Reads the span files written by the services (TRACE_LOG_PATH), rebuilds each
+booking's trace into a waterfall and aggregates latency percentiles per stage.
+A trace starts in the backend's create_booking and continues through the
+notification service and the email service's queue and SMTP send.
+
+Usage:
+    python trace_report.py traces.jsonl
+    python trace_report.py backend.jsonl notification.jsonl email.jsonl --slowest 5
+    python trace_report.py traces.jsonl --booking-id 42
+"""
+
+import argparse
+import json
+import os
+import sys
+from collections import defaultdict
+
+BAR_WIDTH = 40
+
+
+def percentile(sorted_values, pct):
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def load_spans(paths):
+    spans = []
+    for path in paths:
+        with open(path) as f:
+            for number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    spans.append(json.loads(line))
+                except ValueError:
+                    # A service killed mid-write leaves a partial last line
+                    print(f"Skipping unreadable line {number} of {path}", file=sys.stderr)
+    return spans
+
+
+class Trace:
+    def __init__(self, trace_id, spans):
+        self.trace_id = trace_id
+        self.spans = sorted(spans, key=lambda span: span['start'])
+        self.start = self.spans[0]['start']
+        self.end = max(span['start'] + span['duration_ms'] / 1000 for span in self.spans)
+        ids = {span['span_id'] for span in self.spans}
+        self.roots = [span for span in self.spans if span.get('parent_id') not in ids]
+        self.children = defaultdict(list)
+        for span in self.spans:
+            if span.get('parent_id') in ids:
+                self.children[span['parent_id']].append(span)
+
+    @property
+    def duration_ms(self):
+        """First span start to last span end, including email sent after the booking returned"""
+        return (self.end - self.start) * 1000
+
+    @property
+    def booking_id(self):
+        for span in self.spans:
+            if span['attrs'].get('booking_id') is not None:
+                return span['attrs']['booking_id']
+        return None
+
+    def walk(self):
+        """Spans depth first, each with its depth"""
+        stack = [(span, 0) for span in reversed(self.roots)]
+        while stack:
+            span, depth = stack.pop()
+            yield span, depth
+            stack.extend((child, depth + 1) for child in reversed(self.children[span['span_id']]))
+
+
+def print_waterfall(trace):
+    total = max(trace.duration_ms, 0.001)
+    print(f"\nBooking {trace.booking_id}  trace {trace.trace_id}  {trace.duration_ms:.1f} ms end to end")
+    for span, depth in trace.walk():
+        offset = (span['start'] - trace.start) * 1000
+        left = int(offset / total * BAR_WIDTH)
+        width = max(1, int(span['duration_ms'] / total * BAR_WIDTH))
+        bar = ' ' * left + '█' * min(width, BAR_WIDTH - left)
+        label = '  ' * depth + f"{span['service']}:{span['name']}"
+        extra = {key: value for key, value in span['attrs'].items() if key != 'booking_id'}
+        notes = ' '.join(f'{key}={value}' for key, value in extra.items())
+        if span['outcome'] != 'ok':
+            notes = f'{span["outcome"].upper()} {notes}'
+        print(f"  {label:<52}{bar:<{BAR_WIDTH}} {offset:>9.1f} +{span['duration_ms']:>8.1f} ms  {notes}".rstrip())
+
+
+def print_stages(traces):
+    stages = defaultdict(list)
+    errors = defaultdict(int)
+    for trace in traces:
+        for span in trace.spans:
+            stage = f"{span['service']}:{span['name']}"
+            stages[stage].append(span['duration_ms'])
+            errors[stage] += span['outcome'] != 'ok'
+    end_to_end = sorted(trace.duration_ms for trace in traces)
+
+    print(f"\n{'Stage':<52}{'Count':>7}{'p50':>10}{'p90':>10}{'p99':>10}{'Max':>10}{'Errors':>8}")
+    rows = [('end to end', end_to_end, 0)]
+    rows += [(stage, sorted(durations), errors[stage]) for stage, durations in sorted(stages.items())]
+    for stage, durations, error_count in rows:
+        print(f"{stage:<52}{len(durations):>7}{percentile(durations, 50):>10.1f}{percentile(durations, 90):>10.1f}"
+              f"{percentile(durations, 99):>10.1f}{durations[-1]:>10.1f}{error_count:>8}")
+    print("Times in ms. A stage runs once per booking, or once per email attempt in the email service.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Booking flow waterfalls and stage percentiles from trace spans')
+    parser.add_argument('paths', nargs='*', help='span files, defaults to $TRACE_LOG_PATH')
+    parser.add_argument('--booking-id', help='show the waterfall for one booking')
+    parser.add_argument('--trace-id', help='show the waterfall for one trace')
+    parser.add_argument('--slowest', type=int, default=3, help='waterfalls for the N slowest bookings')
+    args = parser.parse_args()
+
+    paths = args.paths or [os.getenv('TRACE_LOG_PATH', 'traces.jsonl')]
+    spans_by_trace = defaultdict(list)
+    for span in load_spans(paths):
+        spans_by_trace[span['trace_id']].append(span)
+    traces = [Trace(trace_id, spans) for trace_id, spans in spans_by_trace.items()]
+    if not traces:
+        print(f"No spans in {', '.join(paths)}")
+        return
+
+    if args.booking_id or args.trace_id:
+        matches = [trace for trace in traces
+                   if trace.trace_id == args.trace_id or str(trace.booking_id) == args.booking_id]
+        if not matches:
+            print("No matching trace")
+        for trace in matches:
+            print_waterfall(trace)
+        return
+
+    print("🔎 Booking flow traces")
+    print("=" * 66)
+    print(f"{len(traces)} traces, {sum(len(trace.spans) for trace in traces)} spans from {', '.join(paths)}")
+    print_stages(traces)
+    for trace in sorted(traces, key=lambda trace: trace.duration_ms, reverse=True)[:args.slowest]:
+        print_waterfall(trace)
+
+
+if __name__ == '__main__':
+    main()